@@ -4,14 +4,22 @@ set -eo pipefail
 
 # -- S3 BUCKET CREATION --
 
-# Generate a UUID
-uuid=$(uuidgen | tr '[:upper:]' '[:lower:]')
+# Pass the bucket of a previous run to update it in place, so the knowledge base sync below only
+# uploads the sections that changed. Without one, a new bucket is created.
+bucket_name="$1"
 
-# Create the bucket name
-bucket_name="iot-qnabot-onecall-$uuid"
+if [ -n "$bucket_name" ]; then
+  aws s3api head-bucket --bucket $bucket_name
+else
+  # Generate a UUID
+  uuid=$(uuidgen | tr '[:upper:]' '[:lower:]')
 
-# Create the S3 bucket using AWS CLI
-aws s3api create-bucket --bucket $bucket_name --region us-east-1
+  # Create the bucket name
+  bucket_name="iot-qnabot-onecall-$uuid"
+
+  # Create the S3 bucket using AWS CLI
+  aws s3api create-bucket --bucket $bucket_name --region us-east-1
+fi
 
 # -- COPY FILES TO S3 BUCKET --
 
@@ -22,12 +30,12 @@ aws s3api put-object --bucket $bucket_name --key anomaly-ml-model/model-artifact
 cd ./source/training_data/
 aws s3 cp training_data.csv s3://$bucket_name/anomaly-ml-model/training-data/training_data.csv
 
-# Create "knowledge-base/" prefix and copy the file
-cd ../../assets/data/
-aws s3 cp Troubleshooting_Guide.docx s3://$bucket_name/knowledge-base/Troubleshooting_Guide.docx
+# Create "knowledge-base/" prefix with the troubleshooting guide and the manual split into sections
+cd ../../
+python3 source/knowledge_base/prepare_manual.py --output build/knowledge-base
+aws s3 sync build/knowledge-base s3://$bucket_name/knowledge-base/ --exclude manifest.json --delete
 
 # Create "telemetry/firehose-streaming-data/" prefix
-cd ../../
 aws s3api put-object --bucket $bucket_name --key telemetry/firehose-streaming-data/
 
 # Create "telemetry/aggregated-telemetry/" prefix
@@ -39,17 +47,30 @@ aws s3api put-object --bucket $bucket_name --key telemetry/inference-output/
 # Create "telemetry/processed-output/" prefix
 aws s3api put-object --bucket $bucket_name --key telemetry/processed-output/
 
+# Create "telemetry/device-index/" prefix
+aws s3api put-object --bucket $bucket_name --key telemetry/device-index/
+
 # Zip the Bedrock Agent Lambda functions required for the Bedrock Agent and upload to S3 bucket 
+# Every Lambda function package also includes the shared modules from source/lambda/common
 cd ./source/lambda/bedrock_agent_functions/iot-qnabot-onecall-user-query
-zip iot-qnabot-onecall-user-query.zip lambda_function.py
+# The troubleshooting guide, the manual and their section parser are bundled for the in-process troubleshooting lookup
+zip -j iot-qnabot-onecall-user-query.zip lambda_function.py telemetry_summary.py manual_retrieval.py ../../../knowledge_base/document_sections.py ../../common/aws_clients.py ../../common/structured_logging.py ../../../../assets/data/Troubleshooting_Guide.docx ../../../iot_simulator/sample_air_conditioner_manual/aircon_manual.md
 aws s3 cp iot-qnabot-onecall-user-query.zip s3://$bucket_name/deployment/source/lambda/
 
 cd ../iot-qnabot-onecall-triage
-zip iot-qnabot-onecall-triage.zip lambda_function.py
+zip -j iot-qnabot-onecall-triage.zip lambda_function.py ../../common/aws_clients.py ../../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-triage.zip s3://$bucket_name/deployment/source/lambda/
 
+cd ../../iot-qnabot-onecall-notification-drain
+zip -j iot-qnabot-onecall-notification-drain.zip lambda_function.py ../common/aws_clients.py ../common/structured_logging.py
+aws s3 cp iot-qnabot-onecall-notification-drain.zip s3://$bucket_name/deployment/source/lambda/
+
+cd ../iot-qnabot-onecall-call-dispatcher
+zip -j iot-qnabot-onecall-call-dispatcher.zip lambda_function.py ../common/aws_clients.py ../common/structured_logging.py
+aws s3 cp iot-qnabot-onecall-call-dispatcher.zip s3://$bucket_name/deployment/source/lambda/
+
 # Zip the Lambda function and the lambda layer required for the index creation in Amazon OpenSearch Serverless collection
-cd ../../vector_index_creation
+cd ../vector_index_creation
 rm -rf python; mkdir python
 cd python
 pip3 install --target . -r ../requirements.txt
@@ -62,27 +83,27 @@ aws s3 cp lambda_layer.zip s3://$bucket_name/deployment/source/lambda/
 
 #iot-qnabot-onecall-anomaly-handler
 cd ../iot-qnabot-onecall-anomaly-handler
-zip iot-qnabot-onecall-anomaly-handler.zip lambda_function.py
+zip -j iot-qnabot-onecall-anomaly-handler.zip lambda_function.py suppression.py ../common/aws_clients.py ../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-anomaly-handler.zip s3://$bucket_name/deployment/source/lambda/
 
 #iot-qnabot-onecall-anomaly-inference
 cd ../iot-qnabot-onecall-anomaly-inference
-zip iot-qnabot-onecall-anomaly-inference.zip lambda_function.py utils.py
+zip -j iot-qnabot-onecall-anomaly-inference.zip lambda_function.py utils.py ../common/aws_clients.py ../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-anomaly-inference.zip s3://$bucket_name/deployment/source/lambda/
 
 #iot-qnabot-onecall-clean-inference-output
 cd ../iot-qnabot-onecall-clean-inference-output
-zip iot-qnabot-onecall-clean-inference-output.zip lambda_function.py
+zip -j iot-qnabot-onecall-clean-inference-output.zip lambda_function.py ../common/aws_clients.py ../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-clean-inference-output.zip s3://$bucket_name/deployment/source/lambda/
 
 #iot-qnabot-onecall-custom-hook
 cd ../iot-qnabot-onecall-custom-hook
-zip iot-qnabot-onecall-custom-hook.zip CustomPYHook.py
+zip -j iot-qnabot-onecall-custom-hook.zip CustomPYHook.py ../common/aws_clients.py ../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-custom-hook.zip s3://$bucket_name/deployment/source/lambda/
 
 #iot-qnabot-onecall-error-handler
 cd ../iot-qnabot-onecall-error-handler
-zip iot-qnabot-onecall-error-handler.zip lambda_function.py
+zip -j iot-qnabot-onecall-error-handler.zip lambda_function.py ../common/aws_clients.py ../common/structured_logging.py
 aws s3 cp iot-qnabot-onecall-error-handler.zip s3://$bucket_name/deployment/source/lambda/
 
 #Copy IoT simulator content
@@ -95,5 +116,5 @@ aws s3 cp deployment/ s3://$bucket_name/deployment/cfn_script/ --recursive
 
 
 echo "============================================================================================================================"
-echo "SUCCESS: Following S3 bucket is created and deployment files are uploaded: ${bucket_name}"
+echo "SUCCESS: Following S3 bucket is created or updated and deployment files are uploaded: ${bucket_name}"
 echo "============================================================================================================================"
\ No newline at end of file
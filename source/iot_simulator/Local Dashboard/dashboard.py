@@ -1,41 +1,265 @@
+import os
 import sys
 import json
+import time
 import argparse
 import boto3
 import certifi
-import datetime
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QTableWidget, QTableWidgetItem,
+    QApplication, QMainWindow, QTableView, QAbstractItemView,
     QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QComboBox, QLabel, QLineEdit, QPlainTextEdit
 )
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, Qt, QAbstractTableModel, QModelIndex, QObject, QSortFilterProxyModel, pyqtSignal
 from PyQt5.QtGui import QColor
 
-# Create the IoT Data client using the CA bundle from certifi
-iot_data = boto3.client('iot-data', verify=certifi.where())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from activity_log import ActivityLog, format_entry
+from fleet_index import FleetIndex
+from fleet_state import FleetState, lookup_endpoint, start_subscriber
+
+# Number of activity entries kept in memory and in the log widget
+ACTIVITY_LOG_SIZE = 1000
+# Shadows are read by a pool of worker threads, never on the UI thread
+SHADOW_FETCH_CONCURRENCY = 16
+# Live updates are applied to the table as they arrive, the filters and summary at most this often
+LIVE_REFRESH_MS = 1000
+
+# Create the IoT Data client using the CA bundle from certifi, with a connection per fetch worker
+iot_data = boto3.client('iot-data', verify=certifi.where(), config=Config(max_pool_connections=SHADOW_FETCH_CONCURRENCY))
 # If needed, you can also explicitly specify the endpoint:
 # iot_data = boto3.client('iot-data', endpoint_url='https://your-endpoint.amazonaws.com', verify=certifi.where())
 
+# Table columns as (header, reported field)
+COLUMNS = [
+    ("Device", None),
+    ("Outdoor Temp (°C)", "outdoor_temperature_c"),
+    ("Indoor Temp (°C)", "indoor_temperature_c"),
+    ("Setpoint (°C)", "setpoint_temperature_c"),
+    ("Compressor Status", "compressor_status"),
+    ("Mode", "mode"),
+    ("Wattage", "power_consumption_watts"),
+    ("Wattage Mode", "wattage_mode"),
+    ("Error Code", "error_code"),
+    ("Filter Status", "filter_status"),
+    ("Runtime (hrs)", "runtime_hours"),
+    ("Version", "version")
+]
+ERROR_CODE_COLUMN = 8
+ERROR_COLOR = QColor("red")
+# Filter choices as (label, value), an empty value does not filter.
+# Error codes are only reported by telemetry, the error code filter is shown while live updates are connected.
+ERROR_CODE_FILTERS = [("All", ""), ("Any fault", "any"), ("None", "None"), ("E1", "E1"), ("E2", "E2"), ("E3", "E3"), ("W1", "W1")]
+MODE_FILTERS = [("All", ""), ("cool", "cool"), ("off", "off"), ("fan_only", "fan_only")]
+
+def fetch_shadow(device_name):
+    """
+    Read a device's shadow, runs on a worker thread so it must not touch any widget.
+
+    :return: Reported state with the shadow version, and an error message or None
+    """
+    try:
+        response = iot_data.get_thing_shadow(thingName=device_name)
+        shadow = json.loads(response['payload'].read())
+        return dict(shadow.get("state", {}).get("reported", {}), version=shadow.get("version")), None
+    except ClientError as e:
+        return None, f"Error retrieving shadow: {e}"
+    except Exception as e:
+        return None, f"Unexpected error: {e}"
+
+class FleetModel(QAbstractTableModel):
+    """
+    Latest reported state of each device, shown by the table view one row per device.
+
+    Applying a new state only signals the cells whose value changed, so the view repaints
+    those cells instead of the whole table. The fleet index is kept in step for the filters
+    and the summary.
+    """
+
+    def __init__(self, devices, parent=None):
+        super().__init__(parent)
+        self.devices = list(devices)
+        self.rows = {device: row for row, device in enumerate(self.devices)}
+        self.states = {}
+        self.fleet_index = FleetIndex()
+        self.fleet_index.register(self.devices)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.devices)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        device = self.devices[index.row()]
+        field = COLUMNS[index.column()][1]
+        if role == Qt.DisplayRole:
+            if field is None:
+                return device
+            value = self.states.get(device, {}).get(field)
+            return "N/A" if value is None else str(value)
+        if role == Qt.ForegroundRole and index.column() == ERROR_CODE_COLUMN:
+            if self.states.get(device, {}).get("error_code", "N/A") not in ["None", "N/A"]:
+                return ERROR_COLOR
+        return None
+
+    def apply_state(self, device, state):
+        """
+        Merge reported values into a device's state and signal the changed cells.
+
+        The shadow reports a subset of the telemetry fields, so both are merged rather than replaced.
+
+        :return: Number of changed values
+        """
+        row = self.rows.get(device)
+        if row is None:
+            return 0
+        previous = self.states.get(device, {})
+        state = dict(previous, **state)
+        self.states[device] = state
+        changed = [column for column, (_, field) in enumerate(COLUMNS) if field and previous.get(field) != state.get(field)]
+        if changed:
+            self.fleet_index.update(device, state)
+            self.dataChanged.emit(self.index(row, changed[0]), self.index(row, changed[-1]), [Qt.DisplayRole, Qt.ForegroundRole])
+        return len(changed)
+
+class FleetFilterModel(QSortFilterProxyModel):
+    """
+    Shows the devices matching the error code and mode filters, looked up in the fleet index.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.filters = {}
+        self.matches = None
+
+    def set_filters(self, filters):
+        self.filters = {field: value for field, value in filters.items() if value}
+        self.refilter()
+
+    def refilter(self):
+        self.matches = self.sourceModel().fleet_index.matching(self.filters)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.matches is None or self.sourceModel().devices[source_row] in self.matches
+
+class ShadowFetcher(QObject):
+    """
+    Reads shadows on a thread pool and delivers each result to the UI thread through a signal.
+    """
+    # device, reported state or None, error message or None, on-demand read
+    fetched = pyqtSignal(str, object, object, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = ThreadPoolExecutor(max_workers=SHADOW_FETCH_CONCURRENCY)
+
+    def fetch(self, devices, on_demand=False):
+        for device in devices:
+            self.pool.submit(self.fetch_one, device, on_demand)
+
+    def fetch_one(self, device, on_demand):
+        state, error = fetch_shadow(device)
+        # Signals emitted from a worker thread are queued to the receiver's thread
+        self.fetched.emit(device, state, error, on_demand)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class LiveFleetState(FleetState):
+    """
+    Fleet view fed by the MQTT subscription, forwarding its changes to a TelemetryFeed.
+    """
+
+    def __init__(self, feed):
+        self.feed = feed
+        super().__init__()
+
+    @property
+    def live(self):
+        return self._live
+
+    @live.setter
+    def live(self, live):
+        self._live = live
+        self.feed.live_changed.emit(live)
+
+    def publish(self, event):
+        if 'device' in event:
+            self.feed.received.emit(event['device'], event['changes'])
+
+class TelemetryFeed(QObject):
+    """
+    Subscribes to the shadow documents and telemetry like the web dashboard, and delivers the
+    reported values to the UI thread through signals.
+    """
+    # device, changed reported values
+    received = pyqtSignal(str, object)
+    # whether the subscription is connected
+    live_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.fleet = LiveFleetState(self)
+        self.client = None
+
+    def start(self, endpoint):
+        self.client = start_subscriber(self.fleet, endpoint)
+        return self.client is not None
+
+    def stop(self):
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except Exception as e:
+                print(f"Error disconnecting live updates: {e}")
+            self.client = None
+
 class DashboardWindow(QMainWindow):
-    def __init__(self, devices):
+    def __init__(self, devices, iot_endpoint=None, live_updates=True):
         super().__init__()
         self.setWindowTitle("Air Conditioner Simulator Dashboard")
         self.setGeometry(100, 100, 950, 650)  # increased width and height for extra column and log window
         self.devices = devices
 
-        # Table to display device shadow statuses.
-        # Now 13 columns: 
-        # "Action", "Device", "Outdoor Temp (°C)", "Indoor Temp (°C)", "Setpoint (°C)",
-        # "Compressor Status", "Mode", "Wattage", "Wattage Mode", "Error Code", "Filter Status",
-        # "Runtime (hrs)", "Version"
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(13)
-        self.table.setHorizontalHeaderLabels([
-            "Action", "Device", "Outdoor Temp (°C)", "Indoor Temp (°C)", "Setpoint (°C)",
-            "Compressor Status", "Mode", "Wattage", "Wattage Mode", "Error Code", "Filter Status",
-            "Runtime (hrs)", "Version"
-        ])
+        # Table to display device shadow statuses, backed by the fleet model.
+        # Double-click a row, or select rows and press "Read Selected Shadows", to read shadows on demand.
+        self.model = FleetModel(devices, self)
+        self.proxy = FleetFilterModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.doubleClicked.connect(lambda index: self.read_shadows_on_demand([self.model.devices[self.proxy.mapToSource(index).row()]]))
+
+        # Filters and fleet summary, answered by the fleet index
+        self.error_filter = QComboBox(self)
+        self.mode_filter = QComboBox(self)
+        for combo, choices in ((self.error_filter, ERROR_CODE_FILTERS), (self.mode_filter, MODE_FILTERS)):
+            for label, value in choices:
+                combo.addItem(label, value)
+            combo.currentIndexChanged.connect(self.apply_filters)
+        self.summary_label = QLabel("", self)
+        self.summary_label.setWordWrap(True)
+        self.error_filter_label = QLabel("Error Code:", self)
+        self.read_selected_button = QPushButton("Read Selected Shadows", self)
+        self.read_selected_button.clicked.connect(self.read_selected_shadows)
+
+        self.fetcher = ShadowFetcher(self)
+        self.fetcher.fetched.connect(self.on_shadow_fetched)
+        # Progress of the running refresh, a refresh is skipped while the previous one is running
+        self.refresh = None
+        self.columns_sized = False
 
         # Create dropdown for device names
         self.device_label = QLabel("Select Device:", self)
@@ -68,6 +292,7 @@ class DashboardWindow(QMainWindow):
 
         # Layout for controls
         control_layout = QHBoxLayout()
+        control_layout.addWidget(self.read_selected_button)
         control_layout.addWidget(self.device_label)
         control_layout.addWidget(self.device_dropdown)
         control_layout.addWidget(self.fault_label)
@@ -85,10 +310,21 @@ class DashboardWindow(QMainWindow):
         self.log_widget = QPlainTextEdit(self)
         self.log_widget.setReadOnly(True)
         self.log_widget.setFixedHeight(150)
-        self.log_buffer = []
+        # The widget drops its oldest lines itself, so appending a line never re-renders the log
+        self.log_widget.setMaximumBlockCount(ACTIVITY_LOG_SIZE)
+        self.activity_log = ActivityLog(maxlen=ACTIVITY_LOG_SIZE)
 
-        # Main layout: table on top, then control layout, then log area.
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.error_filter_label)
+        filter_layout.addWidget(self.error_filter)
+        filter_layout.addWidget(QLabel("Mode:", self))
+        filter_layout.addWidget(self.mode_filter)
+        filter_layout.addStretch()
+
+        # Main layout: filters and summary, table, then control layout, then log area.
         main_layout = QVBoxLayout()
+        main_layout.addLayout(filter_layout)
+        main_layout.addWidget(self.summary_label)
         main_layout.addWidget(self.table)
         main_layout.addLayout(control_layout)
         main_layout.addWidget(QLabel("Shadow MQTT Messages:", self))
@@ -98,6 +334,23 @@ class DashboardWindow(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
+        # Live updates from telemetry, which is the only source of error codes
+        self.live = False
+        self.live_dirty = False
+        self.set_error_filter_visible(False)
+        self.feed = TelemetryFeed(self)
+        self.feed.received.connect(self.on_live_update)
+        self.feed.live_changed.connect(self.on_live_changed)
+        self.live_timer = QTimer(self)
+        self.live_timer.timeout.connect(self.refresh_live_views)
+        self.live_timer.start(LIVE_REFRESH_MS)
+        if live_updates:
+            endpoint = iot_endpoint or lookup_endpoint()
+            if endpoint and self.feed.start(endpoint):
+                self.append_log(f"Live updates connected to {endpoint}")
+            else:
+                self.append_log("Live updates unavailable, error codes are not shown.")
+
         # Timer to update the table every 5 minutes (300000 ms)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_table)
@@ -106,100 +359,106 @@ class DashboardWindow(QMainWindow):
         # Also update the table immediately at startup
         self.update_table()
 
-    def append_log(self, message):
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_line = f"[{timestamp}] {message}"
-        self.log_buffer.append(log_line)
-        if len(self.log_buffer) > 100:
-            self.log_buffer = self.log_buffer[-100:]
-        self.log_widget.setPlainText("\n".join(self.log_buffer))
+    def append_log(self, message, device=None, **details):
+        entry = self.activity_log.append(device, message, **details)
+        self.log_widget.appendPlainText(format_entry(entry))
         self.log_widget.verticalScrollBar().setValue(self.log_widget.verticalScrollBar().maximum())
 
-    def get_shadow_state(self, device_name):
-        try:
-            response = iot_data.get_thing_shadow(thingName=device_name)
-            payload = response['payload'].read()
-            shadow = json.loads(payload)
-            # Log the retrieved shadow as formatted JSON
-            formatted_shadow = json.dumps(shadow, indent=4)
-            self.append_log(f"Shadow for {device_name}:\n{formatted_shadow}")
-            reported = shadow.get("state", {}).get("reported", {})
-            return reported
-        except ClientError as e:
-            error_msg = f"Error retrieving shadow for {device_name}: {e}"
-            print(error_msg)
-            self.append_log(error_msg)
-            return {}
-        except Exception as e:
-            error_msg = f"Unexpected error for {device_name}: {e}"
-            print(error_msg)
-            self.append_log(error_msg)
-            return {}
-
     def update_table(self):
-        self.table.setRowCount(len(self.devices))
-        for row, device in enumerate(self.devices):
-            # Create "Read Shadow" button for each row in column 0
-            read_button = QPushButton("Read Shadow")
-            read_button.clicked.connect(lambda _, dev=device, r=row: self.read_shadow_on_demand(dev, r))
-            self.table.setCellWidget(row, 0, read_button)
-
-            # Retrieve the shadow for each device (for table update)
-            state = self.get_shadow_state(device)
-            # Create table items for the remaining columns.
-            device_item = QTableWidgetItem(device)
-            outdoor_temp = QTableWidgetItem(str(state.get("outdoor_temperature_c", "N/A")))
-            indoor_temp = QTableWidgetItem(str(state.get("indoor_temperature_c", "N/A")))
-            setpoint = QTableWidgetItem(str(state.get("setpoint_temperature_c", "N/A")))
-            compressor_status = QTableWidgetItem(state.get("compressor_status", "N/A"))
-            mode = QTableWidgetItem(state.get("mode", "N/A"))
-            wattage = QTableWidgetItem(str(state.get("power_consumption_watts", "N/A")))
-            wattage_mode = QTableWidgetItem(str(state.get("wattage_mode", "N/A")))
-            error = QTableWidgetItem(state.get("error_code", "N/A"))
-            filter_status = QTableWidgetItem(state.get("filter_status", "N/A"))
-            runtime = QTableWidgetItem(str(state.get("runtime_hours", "N/A")))
-            version = QTableWidgetItem(str(state.get("version", "N/A")))
-
-            if error.text() not in ["None", "N/A"]:
-                error.setForeground(QColor("red"))
-
-            # Set columns:
-            # 0: Action, 1: Device, 2: Outdoor Temp, 3: Indoor Temp, 4: Setpoint,
-            # 5: Compressor Status, 6: Mode, 7: Wattage, 8: Wattage Mode, 9: Error Code,
-            # 10: Filter Status, 11: Runtime, 12: Version
-            self.table.setItem(row, 1, device_item)
-            self.table.setItem(row, 2, outdoor_temp)
-            self.table.setItem(row, 3, indoor_temp)
-            self.table.setItem(row, 4, setpoint)
-            self.table.setItem(row, 5, compressor_status)
-            self.table.setItem(row, 6, mode)
-            self.table.setItem(row, 7, wattage)
-            self.table.setItem(row, 8, wattage_mode)
-            self.table.setItem(row, 9, error)
-            self.table.setItem(row, 10, filter_status)
-            self.table.setItem(row, 11, runtime)
-            self.table.setItem(row, 12, version)
-
-        self.table.resizeColumnsToContents()
-
-    def read_shadow_on_demand(self, device, row):
-        state = self.get_shadow_state(device)
-        self.table.item(row, 2).setText(str(state.get("outdoor_temperature_c", "N/A")))
-        self.table.item(row, 3).setText(str(state.get("indoor_temperature_c", "N/A")))
-        self.table.item(row, 4).setText(str(state.get("setpoint_temperature_c", "N/A")))
-        self.table.item(row, 5).setText(state.get("compressor_status", "N/A"))
-        self.table.item(row, 6).setText(state.get("mode", "N/A"))
-        self.table.item(row, 7).setText(str(state.get("power_consumption_watts", "N/A")))
-        self.table.item(row, 8).setText(str(state.get("wattage_mode", "N/A")))
-        error_text = state.get("error_code", "N/A")
-        error_item = QTableWidgetItem(error_text)
-        if error_text not in ["None", "N/A"]:
-            error_item.setForeground(QColor("red"))
-        self.table.setItem(row, 9, error_item)
-        self.table.item(row, 10).setText(state.get("filter_status", "N/A"))
-        self.table.item(row, 11).setText(str(state.get("runtime_hours", "N/A")))
-        self.table.item(row, 12).setText(str(state.get("version", "N/A")))
-        self.append_log(f"On-demand shadow read for {device} completed.")
+        if self.refresh is not None:
+            self.append_log(f"Refresh skipped, {self.refresh['pending']} shadows of the previous refresh are still being read.")
+            return
+        self.refresh = {"pending": len(self.devices), "changed": 0, "errors": 0, "started": time.time()}
+        self.fetcher.fetch(self.devices)
+
+    def read_selected_shadows(self):
+        rows = sorted({self.proxy.mapToSource(index).row() for index in self.table.selectionModel().selectedRows()})
+        self.read_shadows_on_demand([self.model.devices[row] for row in rows])
+
+    def read_shadows_on_demand(self, devices):
+        self.fetcher.fetch(devices, on_demand=True)
+
+    def on_shadow_fetched(self, device, state, error, on_demand):
+        """
+        Apply a shadow read by a worker, runs on the UI thread.
+        """
+        if error is not None:
+            print(f"{device}: {error}")
+            self.append_log(error, device)
+        else:
+            changed = self.model.apply_state(device, state)
+            if on_demand:
+                if changed:
+                    self.proxy.refilter()
+                    self.update_summary()
+                self.append_log("On-demand shadow read completed.", device, version=state.get("version"), error_code=state.get("error_code", "N/A"))
+            elif self.refresh is not None:
+                self.refresh["changed"] += 1 if changed else 0
+
+        if on_demand or self.refresh is None:
+            return
+        self.refresh["pending"] -= 1
+        self.refresh["errors"] += 1 if error is not None else 0
+        if self.refresh["pending"] == 0:
+            elapsed = time.time() - self.refresh["started"]
+            self.append_log(f"Refreshed {len(self.devices)} shadows in {elapsed:.1f}s", changed=self.refresh["changed"], errors=self.refresh["errors"])
+            self.proxy.refilter()
+            self.update_summary()
+            if not self.columns_sized:
+                self.table.resizeColumnsToContents()
+                self.columns_sized = True
+            self.refresh = None
+
+    def on_live_update(self, device, changes):
+        """
+        Apply values pushed by the subscription, runs on the UI thread.
+        """
+        if self.model.apply_state(device, changes):
+            self.live_dirty = True
+
+    def on_live_changed(self, live):
+        if live == self.live:
+            return
+        self.live = live
+        self.set_error_filter_visible(live)
+        self.append_log("Live updates connected." if live else "Live updates disconnected, error codes are not shown.")
+        self.update_summary()
+
+    def set_error_filter_visible(self, visible):
+        self.error_filter_label.setVisible(visible)
+        self.error_filter.setVisible(visible)
+        if not visible and self.error_filter.currentIndex() != 0:
+            # Resetting the filter re-applies the filters through currentIndexChanged
+            self.error_filter.setCurrentIndex(0)
+
+    def refresh_live_views(self):
+        if self.live_dirty:
+            self.live_dirty = False
+            self.proxy.refilter()
+            self.update_summary()
+
+    def apply_filters(self):
+        error_code = self.error_filter.currentData() if self.live else ""
+        self.proxy.set_filters({"error_code": error_code, "mode": self.mode_filter.currentData()})
+        self.update_summary()
+
+    def update_summary(self):
+        summary = self.model.fleet_index.summary(top_n=3)
+        shown = len(self.model.devices) if self.proxy.matches is None else len(self.proxy.matches)
+        power = ", ".join(f"{mode}: {watts:.0f} W" for mode, watts in sorted(summary["power_by_mode"].items()))
+        top = ", ".join(f"{row['device']} ({row['power_consumption_watts']:.0f} W)" for row in summary["top_power"])
+        text = f"Showing {shown} of {len(self.model.devices)} devices, {summary['total_power_watts']:.0f} W total. "
+        if self.live:
+            codes = ", ".join(f"{code}: {count}" for code, count in sorted(summary["counts"]["error_code"].items()))
+            text += f"Error codes: {codes}. "
+        self.summary_label.setText(text + f"Power by mode: {power}. Top consumers: {top}.")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.live_timer.stop()
+        self.feed.stop()
+        self.fetcher.shutdown()
+        super().closeEvent(event)
 
     def inject_fault(self):
         device_name = self.device_dropdown.currentText()
@@ -232,9 +491,10 @@ class DashboardWindow(QMainWindow):
                 thingName=device_name,
                 payload=json.dumps(payload)
             )
-            self.append_log(f"Updated desired temperature for {device_name} to {desired_temp}. Response: {response}")
+            self.append_log(f"Updated desired temperature to {desired_temp}", device_name,
+                            version=json.loads(response['payload'].read()).get("version"))
         except Exception as e:
-            self.append_log(f"Error updating desired temperature for {device_name}: {e}")
+            self.append_log(f"Error updating desired temperature: {e}", device_name)
 
     def set_wattage_mode(self):
         device_name = self.device_dropdown.currentText()
@@ -246,9 +506,9 @@ class DashboardWindow(QMainWindow):
         topic = f"aircon/commands/{device_name}"
         try:
             iot_data.publish(topic=topic, qos=1, payload=json.dumps(payload))
-            self.append_log(f"Published command to {topic}: {json.dumps(payload)}")
+            self.append_log(f"Published command to {topic}: {json.dumps(payload)}", device_name)
         except Exception as e:
-            self.append_log(f"Error publishing command to {topic}: {e}")
+            self.append_log(f"Error publishing command to {topic}: {e}", device_name)
 
 def parse_cli_args():
     parser = argparse.ArgumentParser(description="Air Conditioner Simulator Dashboard (Shadow-based)")
@@ -256,6 +516,10 @@ def parse_cli_args():
                         help="Prefix for device names (default: aircon)")
     parser.add_argument("--count", type=int, default=2,
                         help="Number of devices (default: 2)")
+    parser.add_argument("--iot-endpoint", type=str, default=None,
+                        help="AWS IoT data endpoint for live updates (default: IOT_ENDPOINT or the account's iot:Data-ATS endpoint)")
+    parser.add_argument("--no-live-updates", action="store_true",
+                        help="Only read shadows, without live updates (error codes are then not shown)")
     return parser.parse_args()
 
 def generate_device_names(prefix, count):
@@ -266,6 +530,6 @@ if __name__ == '__main__':
     devices = generate_device_names(args.device_prefix, args.count)
 
     app = QApplication(sys.argv)
-    window = DashboardWindow(devices)
+    window = DashboardWindow(devices, iot_endpoint=args.iot_endpoint, live_updates=not args.no_live_updates)
     window.show()
     sys.exit(app.exec_())
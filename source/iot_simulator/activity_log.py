@@ -0,0 +1,76 @@
+import datetime, threading, time
+from collections import deque, namedtuple
+from itertools import islice
+
+# Bounded activity log shared by the Flask and the Qt dashboards. Entries are small tuples that
+# are only formatted when read, and the oldest entries are dropped once the log is full, so memory
+# and the cost of an append stay flat however long the dashboard runs.
+
+ActivityEntry = namedtuple('ActivityEntry', ['id', 'timestamp', 'device', 'message', 'details'])
+
+class ActivityLog:
+    """
+    Ring buffer of activity entries with increasing ids, read incrementally with a since cursor.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.entries = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+        self.last_id = 0
+
+    def append(self, device, message, **details):
+        """
+        Record an activity, details are kept as values and formatted only when read.
+
+        :return: The new entry
+        """
+        with self.lock:
+            self.last_id += 1
+            entry = ActivityEntry(self.last_id, time.time(), device, message, details or None)
+            self.entries.append(entry)
+        return entry
+
+    def since(self, cursor=0, limit=None, device=None):
+        """
+        Return the entries after the cursor, oldest first.
+
+        Ids are consecutive, so the entries after the cursor are read from the tail of the buffer and
+        a poll only costs the entries added since the previous one.
+
+        :param cursor: Id of the last entry already read, 0 for the whole log
+        :param limit: Maximum number of entries to return
+        :param device: Only return the entries of this device
+        :return: List of entries, the cursor to read the next entries from and whether entries
+                 after the cursor were already dropped
+        """
+        with self.lock:
+            # A cursor from before a restart of the dashboard reads the log from the start
+            if cursor > self.last_id:
+                cursor = 0
+            if not self.entries:
+                return [], self.last_id, False
+            first_id = self.entries[0].id
+            dropped = cursor < first_id - 1
+            entries = reversed(list(islice(reversed(self.entries), min(self.last_id - cursor, len(self.entries)))))
+            if device:
+                entries = (entry for entry in entries if entry.device == device)
+            entries = list(islice(entries, limit))
+            next_cursor = entries[-1].id if limit is not None and len(entries) == limit else self.last_id
+            return entries, next_cursor, dropped
+
+def format_entry(entry):
+    timestamp = datetime.datetime.fromtimestamp(entry.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    line = f"[{timestamp}] {entry.device}: {entry.message}" if entry.device else f"[{timestamp}] {entry.message}"
+    if entry.details:
+        line += " (" + ", ".join(f"{key} {value}" for key, value in entry.details.items()) + ")"
+    return line
+
+def entry_json(entry):
+    return {
+        "id": entry.id,
+        "timestamp": entry.timestamp,
+        "device": entry.device,
+        "message": entry.message,
+        "details": entry.details or {},
+        "text": format_entry(entry)
+    }
@@ -1,67 +1,183 @@
-from flask import Flask, render_template, request, jsonify, url_for
-import boto3, certifi, json, datetime
+from flask import Flask, Response, render_template, request, jsonify, url_for, stream_with_context
+import boto3, certifi, json, os, queue, sys
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from activity_log import ActivityLog, entry_json
+from fleet_index import FleetIndex, INDEXED_FIELDS
+from fleet_state import FleetState, lookup_endpoint, start_subscriber
 
 app = Flask(__name__)
 
-# Create the IoT Data client using certifi’s CA bundle.
-iot_data = boto3.client('iot-data', verify=certifi.where())
+# Shadows are fetched concurrently by a bounded pool and cached for a short time, and the
+# device list is paginated, so a page load touches at most one page of devices.
+SHADOW_FETCH_CONCURRENCY = int(os.environ.get('SHADOW_FETCH_CONCURRENCY', 16))
+SHADOW_CACHE_TTL_SECONDS = float(os.environ.get('SHADOW_CACHE_TTL_SECONDS', 5))
+DEFAULT_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE', 25))
+MAX_PAGE_SIZE = int(os.environ.get('DASHBOARD_MAX_PAGE_SIZE', 100))
+ACTIVITY_LOG_SIZE = int(os.environ.get('ACTIVITY_LOG_SIZE', 1000))
+
+# With live updates, the dashboard subscribes to the shadow documents and telemetry over MQTT and
+# serves reads from its materialized view, shadows are then only read for devices it has not seen.
+LIVE_UPDATES = os.environ.get('DASHBOARD_LIVE_UPDATES', 'true').lower() == 'true'
+EVENT_HEARTBEAT_SECONDS = 15
+
+# Create the IoT Data client using certifi’s CA bundle, with a connection per fetch worker.
+iot_data = boto3.client('iot-data', verify=certifi.where(), config=Config(max_pool_connections=SHADOW_FETCH_CONCURRENCY))
+shadow_pool = ThreadPoolExecutor(max_workers=SHADOW_FETCH_CONCURRENCY)
+
+# Reported state, shadow version and update time of each device, kept current by MQTT when live,
+# and the index of the devices by error code, mode, compressor status and wattage mode.
+fleet_index = FleetIndex()
+fleet = FleetState(index=fleet_index)
 
 # Global in-memory log for shadow activity.
-shadow_log = []
+shadow_log = ActivityLog(maxlen=ACTIVITY_LOG_SIZE)
 
-def log_shadow_activity(device, message):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_line = f"[{timestamp}] {device}: {message}"
-    shadow_log.append(log_line)
-    if len(shadow_log) > 100:
-        del shadow_log[0]
+def log_shadow_activity(device, message, **details):
+    shadow_log.append(device, message, **details)
 
 def get_shadow_state(device):
     try:
         response = iot_data.get_thing_shadow(thingName=device)
         payload = response['payload'].read()
         shadow = json.loads(payload)
-        log_shadow_activity(device, f"Retrieved shadow:\n{json.dumps(shadow, indent=2)}")
         reported = shadow.get("state", {}).get("reported", {})
-        return reported
+        log_shadow_activity(device, "Retrieved shadow", version=shadow.get('version'), error_code=reported.get('error_code', 'N/A'))
+        return reported, shadow.get('version')
     except ClientError as e:
         error_msg = f"Error retrieving shadow: {e}"
         log_shadow_activity(device, error_msg)
-        return {"error": error_msg}
+        return {"error": error_msg}, None
     except Exception as e:
         error_msg = f"Unexpected error: {e}"
         log_shadow_activity(device, error_msg)
-        return {"error": error_msg}
+        return {"error": error_msg}, None
 
-@app.route('/')
-def index():
-    # Use query parameters to set device prefix and count.
-    device_prefix = request.args.get('device_prefix', 'aircon')
+def get_shadow_states(devices):
+    """
+    Return the reported state of each device from the fleet view, fetching the shadows missing
+    from it concurrently. Without live updates, states older than the cache TTL are fetched again.
+    """
+    known = {}
+    for device in devices:
+        state = fleet.get(device, max_age=SHADOW_CACHE_TTL_SECONDS)
+        if state is not None:
+            known[device] = state
+
+    missing = [device for device in devices if device not in known]
+    fetched = {}
+    for device, (state, version) in zip(missing, shadow_pool.map(get_shadow_state, missing)):
+        # Failed fetches are retried on the next request
+        if "error" not in state:
+            fleet.apply(device, state, version=version)
+            state = fleet.get(device)
+        fetched[device] = state
+
+    return {device: known[device] if device in known else fetched[device] for device in devices}
+
+def invalidate_shadow(device):
+    fleet.invalidate(device)
+
+def parse_int(value, default, minimum=1, maximum=None):
     try:
-        count = int(request.args.get('count', 2))
-    except ValueError:
-        count = 2
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    value = max(value, minimum)
+    return min(value, maximum) if maximum is not None else value
+
+def list_devices(args):
+    """
+    Build one page of the device list from the request arguments.
+
+    Devices are named {device_prefix}_{1..count} and can be filtered by name with `search`.
+    Error codes are only reported by telemetry, not by the shadow, so the `error_code` filter
+    ("any" or a code such as E1) is answered from the fleet index while live updates are
+    connected, and ignored while polling.
+    """
+    device_prefix = args.get('device_prefix', 'aircon')
+    count = parse_int(args.get('count'), 2)
+    page = parse_int(args.get('page'), 1)
+    page_size = parse_int(args.get('page_size'), DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE)
+    search = args.get('search', '').strip()
+    error_code = args.get('error_code', '').strip() if fleet.live else ''
+
     devices = [f"{device_prefix}_{i}" for i in range(1, count+1)]
-    
-    shadows = {}
-    for device in devices:
-        shadows[device] = get_shadow_state(device)
-    return render_template('index.html', devices=devices, shadows=shadows)
+    if search:
+        devices = [device for device in devices if search in device]
+
+    start = (page - 1) * page_size
+    if not error_code:
+        page_devices = devices[start:start + page_size]
+        shadows = get_shadow_states(page_devices)
+        has_more = start + page_size < len(devices)
+        total = len(devices)
+    else:
+        indexed = fleet_index.matching({'error_code': error_code})
+        matches = [device for device in devices if device in indexed]
+        page_devices = matches[start:start + page_size]
+        shadows = get_shadow_states(page_devices)
+        has_more = start + page_size < len(matches)
+        total = len(matches)
+
+    return {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "has_more": has_more,
+        "error_filter": fleet.live,
+        "devices": [{"device": device, "state": shadows[device]} for device in page_devices]
+    }
+
+@app.route('/')
+def index():
+    # Use query parameters to set device prefix, count, page and filters.
+    listing = list_devices(request.args)
+    return render_template('index.html', listing=listing, args=request.args)
 
 @app.route('/read_shadows')
 def read_shadows():
-    device_prefix = request.args.get('device_prefix', 'aircon')
-    try:
-        count = int(request.args.get('count', 2))
-    except ValueError:
-        count = 2
-    devices = [f"{device_prefix}_{i}" for i in range(1, count+1)]
-    
-    shadows = {}
-    for device in devices:
-        shadows[device] = get_shadow_state(device)
-    return jsonify(shadows)
+    return jsonify(list_devices(request.args))
+
+# The fleet endpoints answer from the index, over the devices the dashboard has seen: every
+# reporting device with live updates, otherwise the devices whose shadows were read.
+@app.route('/fleet/summary')
+def fleet_summary():
+    return jsonify(fleet_index.summary(parse_int(request.args.get('top'), 5, maximum=MAX_PAGE_SIZE)))
+
+@app.route('/fleet/aggregate')
+def fleet_aggregate():
+    group_by = request.args.get('group_by', 'mode')
+    if group_by not in INDEXED_FIELDS:
+        return jsonify({"status": "error", "message": f"group_by must be one of {', '.join(INDEXED_FIELDS)}."}), 400
+    counts = fleet_index.counts(group_by)
+    power = fleet_index.power_by(group_by)
+    return jsonify({value: {"devices": count, "power_consumption_watts": power.get(value, 0)} for value, count in counts.items()})
+
+@app.route('/fleet/top')
+def fleet_top():
+    return jsonify(fleet_index.top_power(parse_int(request.args.get('n'), 10, maximum=MAX_PAGE_SIZE)))
+
+@app.route('/fleet/devices')
+def fleet_devices():
+    """
+    Return one page of the devices matching the error_code ("any" for any fault), mode,
+    compressor_status and wattage_mode filters.
+    """
+    filters = {field: request.args[field] for field in INDEXED_FIELDS if request.args.get(field)}
+    page = parse_int(request.args.get('page'), 1)
+    page_size = parse_int(request.args.get('page_size'), DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE)
+    total, devices = fleet_index.query(filters, offset=(page - 1) * page_size, limit=page_size)
+    return jsonify({
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "has_more": page * page_size < total,
+        "devices": [{"device": device, "state": fleet.get(device) or state or {}} for device, state in devices]
+    })
 
 @app.route('/update_temp', methods=['POST'])
 def update_temp():
@@ -73,7 +189,8 @@ def update_temp():
     payload = {"state": {"desired": {"setpoint_temperature_c": desired_temp}}}
     try:
         response = iot_data.update_thing_shadow(thingName=device, payload=json.dumps(payload))
-        log_shadow_activity(device, f"Updated desired temp to {desired_temp}. Response: {response}")
+        invalidate_shadow(device)
+        log_shadow_activity(device, f"Updated desired temp to {desired_temp}", version=json.loads(response['payload'].read()).get('version'))
         return jsonify({"status": "success", "message": f"Desired temp for {device} updated."})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -96,14 +213,51 @@ def send_command():
     topic = f"aircon/commands/{device}"
     try:
         iot_data.publish(topic=topic, qos=1, payload=json.dumps(payload))
+        invalidate_shadow(device)
         log_shadow_activity(device, f"Published command to {topic}: {json.dumps(payload)}")
         return jsonify({"status": "success", "message": f"Command sent to {device}."})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/events')
+def events():
+    """
+    Stream the changes of the fleet view to the browser as Server-Sent Events.
+    """
+    subscription = fleet.subscribe()
+
+    def stream():
+        try:
+            yield f"event: status\ndata: {json.dumps({'live': fleet.live})}\n\n"
+            while True:
+                try:
+                    event = subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            fleet.unsubscribe(subscription)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @app.route('/shadow_logs')
 def get_shadow_logs():
-    return jsonify(shadow_log)
+    """
+    Return the log entries after the `since` cursor, optionally for one `device`. The returned
+    cursor is passed as `since` on the next call, `dropped` tells entries were lost in between.
+    """
+    since = parse_int(request.args.get('since'), 0, minimum=0)
+    limit = parse_int(request.args.get('limit'), ACTIVITY_LOG_SIZE, maximum=ACTIVITY_LOG_SIZE)
+    entries, cursor, dropped = shadow_log.since(since, limit=limit, device=request.args.get('device'))
+    return jsonify({"entries": [entry_json(entry) for entry in entries], "cursor": cursor, "dropped": dropped})
+
+def start_live_updates():
+    endpoint = lookup_endpoint()
+    return start_subscriber(fleet, endpoint) if endpoint else None
 
 if __name__ == '__main__':
+    if LIVE_UPDATES:
+        mqtt_client = start_live_updates()
     app.run(host='0.0.0.0', port=5000, debug=False)
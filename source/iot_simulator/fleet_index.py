@@ -0,0 +1,187 @@
+import bisect, threading
+from collections import defaultdict
+
+# In-memory index over the latest reported state of the fleet, shared by the Flask and the Qt
+# dashboards. Updates maintain the indexes and aggregates incrementally, so counts, sums, top-N
+# and filtered queries never scan the fleet.
+
+INDEXED_FIELDS = ('error_code', 'mode', 'compressor_status', 'wattage_mode')
+POWER_FIELD = 'power_consumption_watts'
+
+class FleetIndex:
+    """
+    Devices by value of each indexed field, with running counts and power sums per value and the
+    devices ordered by power consumption.
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS):
+        self.fields = fields
+        self.lock = threading.RLock()
+        self.states = {}
+        # Devices sorted by name and number, aircon_2 before aircon_10, to page query results.
+        # Positions are renumbered on the first query after devices were added.
+        self.sort_keys = []
+        self.ordered = []
+        self.order = {}
+        self.order_stale = False
+        # field -> value -> set of devices
+        self.indexes = {field: defaultdict(set) for field in fields}
+        # field -> value -> total power of the devices with that value
+        self.power_sums = {field: defaultdict(float) for field in fields}
+        self.total_power = 0.0
+        # (power, device) ascending, the top consumers are at the end
+        self.by_power = []
+
+    def register(self, devices):
+        """
+        Add devices to the listing order before their first state is known.
+        """
+        with self.lock:
+            for device in devices:
+                if device not in self.order:
+                    key = device_sort_key(device)
+                    position = bisect.bisect(self.sort_keys, key)
+                    self.sort_keys.insert(position, key)
+                    self.ordered.insert(position, device)
+                    self.order[device] = position
+                    self.order_stale = True
+
+    def update(self, device, state):
+        """
+        Replace a device's indexed state, only the fields whose value changed are re-indexed.
+        """
+        with self.lock:
+            self.register([device])
+            previous = self.states.get(device)
+            old_power = power_of(previous) if previous is not None else None
+            new_power = power_of(state)
+
+            for field in self.fields:
+                old_value = index_value(previous, field) if previous is not None else None
+                new_value = index_value(state, field)
+                if old_value != new_value:
+                    if previous is not None:
+                        self.remove_value(field, old_value, device, old_power)
+                    self.indexes[field][new_value].add(device)
+                    self.power_sums[field][new_value] += new_power
+                elif old_power != new_power:
+                    self.power_sums[field][new_value] += new_power - old_power
+
+            if old_power != new_power:
+                if old_power is not None:
+                    del self.by_power[bisect.bisect_left(self.by_power, (old_power, device))]
+                    self.total_power -= old_power
+                bisect.insort(self.by_power, (new_power, device))
+                self.total_power += new_power
+            self.states[device] = {field: state.get(field) for field in self.fields + (POWER_FIELD,)}
+
+    def remove(self, device):
+        with self.lock:
+            previous = self.states.pop(device, None)
+            if previous is None:
+                return
+            power = power_of(previous)
+            for field in self.fields:
+                self.remove_value(field, index_value(previous, field), device, power)
+            del self.by_power[bisect.bisect_left(self.by_power, (power, device))]
+            self.total_power -= power
+
+    def remove_value(self, field, value, device, power):
+        devices = self.indexes[field][value]
+        devices.discard(device)
+        self.power_sums[field][value] -= power
+        if not devices:
+            del self.indexes[field][value]
+            del self.power_sums[field][value]
+
+    def counts(self, field):
+        with self.lock:
+            return {value: len(devices) for value, devices in self.indexes[field].items()}
+
+    def power_by(self, field):
+        with self.lock:
+            return {value: round(total, 2) for value, total in self.power_sums[field].items()}
+
+    def top_power(self, n=10):
+        """
+        Return the n devices drawing the most power, highest first.
+        """
+        with self.lock:
+            return [{"device": device, POWER_FIELD: power} for power, device in reversed(self.by_power[-n:])] if n > 0 else []
+
+    def summary(self, top_n=5):
+        with self.lock:
+            return {
+                "devices": len(self.states),
+                "total_power_watts": round(self.total_power, 2),
+                "counts": {field: self.counts(field) for field in self.fields},
+                "power_by_mode": self.power_by('mode'),
+                "top_power": self.top_power(top_n)
+            }
+
+    def matching(self, filters, copy=True):
+        """
+        Return the set of devices matching every field filter, None when there is no filter.
+
+        :param filters: Dictionary of indexed field to value, "any" for error_code matches any fault
+        :param copy: Without a copy, a single filter returns the index's own set, read it under the lock
+        """
+        with self.lock:
+            candidates = []
+            for field, value in filters.items():
+                if field == 'error_code' and value == 'any':
+                    candidates.append(set().union(*(devices for code, devices in self.indexes[field].items() if code != 'None')))
+                else:
+                    candidates.append(self.indexes[field].get(str(value), set()))
+            if not candidates:
+                return None
+            # Intersect from the smallest set, the cost is bounded by the most selective filter
+            candidates.sort(key=len)
+            if len(candidates) == 1 and not copy:
+                return candidates[0]
+            return candidates[0].intersection(*candidates[1:])
+
+    def query(self, filters, offset=0, limit=25):
+        """
+        Return one page of the devices matching the filters, sorted by name and number.
+
+        Small result sets are sorted, large ones are read by walking the ordered devices until the
+        page is filled.
+
+        :return: Total number of matches and the page of (device, indexed state) pairs
+        """
+        with self.lock:
+            matches = self.matching(filters, copy=False)
+            if matches is None:
+                page = self.ordered[offset:offset + limit]
+                return len(self.ordered), [(device, self.states.get(device)) for device in page]
+
+            if self.order_stale:
+                self.order = {device: position for position, device in enumerate(self.ordered)}
+                self.order_stale = False
+            wanted = offset + limit
+            if len(matches) <= 4 * wanted or len(matches) * 8 <= len(self.ordered):
+                page = sorted(matches, key=self.order.__getitem__)[offset:wanted]
+            else:
+                page = []
+                for device in self.ordered:
+                    if device in matches:
+                        page.append(device)
+                        if len(page) == wanted:
+                            break
+                page = page[offset:]
+            return len(matches), [(device, self.states[device]) for device in page]
+
+def device_sort_key(device):
+    prefix, _, number = device.rpartition('_')
+    return (prefix, int(number), '') if number.isdigit() else (device, -1, device)
+
+def index_value(state, field):
+    # Values are indexed as strings, a missing field as "None" like a device without a fault
+    return str(state.get(field))
+
+def power_of(state):
+    try:
+        return float(state.get(POWER_FIELD) or 0)
+    except (TypeError, ValueError):
+        return 0.0
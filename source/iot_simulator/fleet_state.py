@@ -0,0 +1,167 @@
+import json, os, queue, threading, time, urllib.request
+
+# In-memory materialized view of the fleet, kept current by the devices' shadow documents and
+# telemetry instead of polling every shadow. Shared by the Flask dashboard, which pushes the
+# changes to its event streams, and the Qt dashboard, which applies them to its table.
+
+SHADOW_DOCUMENTS_TOPIC = '$aws/things/+/shadow/update/documents'
+TELEMETRY_TOPIC = os.environ.get('TELEMETRY_TOPIC', 'aircon/telemetry')
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 1000))
+
+class FleetState:
+    """
+    Latest reported state of each device, with the shadow version and the time it was last updated.
+    """
+
+    def __init__(self, index=None):
+        self.devices = {}
+        # Optional fleet index kept in step with the view for aggregate and filtered queries
+        self.index = index
+        self.lock = threading.Lock()
+        self.subscribers = []
+        # Set while the MQTT subscription is connected, the view is then kept current by pushes
+        self.live = False
+
+    def get(self, device, max_age=None):
+        """
+        Return the device's state, or None when unknown or older than max_age while not live.
+        """
+        entry = self.devices.get(device)
+        if entry is None:
+            return None
+        if not self.live and max_age is not None and time.time() - entry['updated_at'] >= max_age:
+            return None
+        return entry['state']
+
+    def apply(self, device, state, version=None):
+        """
+        Merge reported values into the view and publish the values that changed.
+
+        The shadow reports a subset of the telemetry fields, so both are merged rather than replaced.
+
+        :param state: Reported values from a shadow document or a telemetry message
+        :param version: Shadow version, updates older than the stored version are ignored
+        :return: Dictionary of changed values
+        """
+        with self.lock:
+            entry = self.devices.get(device)
+            if entry is not None and version is not None and entry['version'] is not None and version < entry['version']:
+                return {}
+            previous = entry['state'] if entry is not None else {}
+            current = dict(previous, **state)
+            changes = {key: value for key, value in current.items() if previous.get(key) != value}
+            self.devices[device] = {
+                'state': current,
+                'version': version if version is not None else (entry['version'] if entry is not None else None),
+                'updated_at': time.time()
+            }
+            if self.index is not None and (changes or entry is None):
+                self.index.update(device, current)
+        if changes:
+            self.publish({'device': device, 'changes': changes})
+        return changes
+
+    def invalidate(self, device):
+        with self.lock:
+            entry = self.devices.get(device)
+            if entry is not None:
+                entry['updated_at'] = 0
+
+    def subscribe(self):
+        events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # A stalled browser is told to reload the page instead of blocking the subscriber
+                with events.mutex:
+                    events.queue.clear()
+                events.put_nowait({'resync': True})
+
+    def on_message(self, topic, payload):
+        """
+        Apply a shadow document or a telemetry message received from AWS IoT.
+        """
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed message on {topic}")
+            return
+
+        parts = topic.split('/')
+        if len(parts) == 6 and parts[0] == '$aws' and parts[3:] == ['shadow', 'update', 'documents']:
+            current = message.get('current', {})
+            reported = current.get('state', {}).get('reported')
+            if reported is not None:
+                self.apply(parts[2], reported, version=current.get('version'))
+        elif topic == TELEMETRY_TOPIC and message.get('device_name'):
+            self.apply(message['device_name'], {key: value for key, value in message.items() if key != 'device_name'})
+
+def download_root_ca(root_ca_path):
+    url = 'https://www.amazontrust.com/repository/AmazonRootCA1.pem'
+    print(f"Downloading Amazon Root CA certificate from {url}...")
+    urllib.request.urlretrieve(url, root_ca_path)
+
+def lookup_endpoint():
+    """
+    Return the IOT_ENDPOINT setting, or the account's iot:Data-ATS endpoint, None when unavailable.
+    """
+    endpoint = os.environ.get('IOT_ENDPOINT')
+    if endpoint:
+        return endpoint
+    try:
+        import boto3
+        return boto3.client('iot').describe_endpoint(endpointType='iot:Data-ATS')['endpointAddress']
+    except Exception as e:
+        print(f"Live updates unavailable, could not look up the IoT endpoint: {e}")
+        return None
+
+def start_subscriber(fleet, endpoint, root_ca_path='AmazonRootCA1.pem', client_id=None):
+    """
+    Subscribe to the shadow documents and telemetry topics over MQTT on WebSocket, signed with the
+    AWS credentials of the dashboard, so no device certificate is needed.
+
+    :return: MQTT client, or None when the subscription could not be set up
+    """
+    try:
+        from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
+
+        if not os.path.exists(root_ca_path):
+            download_root_ca(root_ca_path)
+
+        client = AWSIoTMQTTClient(client_id or f"aircon-dashboard-{os.getpid()}", useWebsocket=True)
+        client.configureEndpoint(endpoint, 443)
+        client.configureCredentials(root_ca_path)
+        client.configureAutoReconnectBackoffTime(1, 32, 20)
+        client.configureConnectDisconnectTimeout(10)
+        client.configureMQTTOperationTimeout(5)
+
+        def set_live(live):
+            fleet.live = live
+            print(f"Live updates {'connected' if live else 'disconnected, falling back to polling'}")
+        client.onOnline = lambda: set_live(True)
+        client.onOffline = lambda: set_live(False)
+
+        client.connect()
+        callback = lambda client_, userdata, message: fleet.on_message(message.topic, message.payload)
+        client.subscribe(SHADOW_DOCUMENTS_TOPIC, 0, callback)
+        client.subscribe(TELEMETRY_TOPIC, 0, callback)
+        fleet.live = True
+        print(f"Subscribed to {SHADOW_DOCUMENTS_TOPIC} and {TELEMETRY_TOPIC}")
+        return client
+    except Exception as e:
+        fleet.live = False
+        print(f"Live updates unavailable, reading shadows on demand: {e}")
+        return None
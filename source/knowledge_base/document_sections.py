@@ -0,0 +1,82 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+# Splits the troubleshooting guide and the air conditioner manual into sections at their headings.
+# Shared by prepare_manual.py, which uploads the sections to the knowledge base, and bundled with
+# the user query function, which indexes the same sections for its in-process troubleshooting lookup.
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ERROR_CODE_PATTERN = re.compile(r'\b([EW]\d+)\b')
+
+def docx_paragraphs(path):
+    """
+    Read the paragraphs of a Word document as (style, text) pairs, without a docx library.
+    """
+    with zipfile.ZipFile(path) as document:
+        root = ET.fromstring(document.read('word/document.xml'))
+
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NAMESPACE}p'):
+        text = ''.join(node.text or '' for node in paragraph.iter(f'{WORD_NAMESPACE}t')).strip()
+        if not text:
+            continue
+        style = paragraph.find(f'{WORD_NAMESPACE}pPr/{WORD_NAMESPACE}pStyle')
+        paragraphs.append((style.get(f'{WORD_NAMESPACE}val') if style is not None else None, text))
+    return paragraphs
+
+def guide_sections(path):
+    """
+    Split the troubleshooting guide into its introduction and one section per error code.
+    """
+    sections = []
+    current = None
+    for style, text in docx_paragraphs(path):
+        if style == 'Title':
+            current = {'title': text, 'lines': [f"# {text}"], 'source': os.path.basename(path)}
+        elif style == 'Heading1' or text.startswith('## '):
+            title = text.lstrip('# ')
+            current = {'title': title, 'lines': [f"## {title}"], 'source': os.path.basename(path)}
+            match = ERROR_CODE_PATTERN.search(title)
+            if match:
+                current['error_code'] = match.group(1)
+        elif current is not None:
+            current['lines'].append(f"- {text}" if style == 'ListParagraph' else text)
+            continue
+        else:
+            continue
+        sections.append(current)
+
+    return [dict(section, text='\n'.join(section.pop('lines'))) for section in sections]
+
+def manual_sections(path):
+    """
+    Split the markdown manual at its numbered ## headings and its ### headings.
+
+    Some introductory paragraphs of the manual are marked as headings too, so only numbered
+    sections and subsections that do not end with a colon open a section.
+    """
+    with open(path, encoding='utf-8') as manual:
+        lines = manual.read().splitlines()
+
+    sections = []
+    current = None
+    for line in lines:
+        heading = re.match(r'(#{2,3}) (.+)', line)
+        if heading and (re.match(r'\d+\. ', heading.group(2)) or (heading.group(1) == '###' and not heading.group(2).endswith(':'))):
+            current = {'title': heading.group(2).strip(), 'lines': [line], 'source': os.path.basename(path)}
+            sections.append(current)
+        elif current is not None and line.strip() not in ('* * *', 'Copy'):
+            current['lines'].append(line)
+
+    result = []
+    for section in sections:
+        text = '\n'.join(section.pop('lines')).strip()
+        if '\n' not in text:
+            continue
+        error_codes = sorted(set(ERROR_CODE_PATTERN.findall(text)))
+        if error_codes:
+            section['error_code'] = ','.join(error_codes)
+        result.append(dict(section, text=text))
+    return result
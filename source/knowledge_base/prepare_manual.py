@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+from document_sections import guide_sections, manual_sections
+
+# Prepares the knowledge base documents before they are uploaded to the knowledge-base/ prefix.
+# The troubleshooting guide and the air conditioner manual are split at their headings into one
+# file per section, each with a metadata.json sidecar carrying its error code. The data source
+# uses no chunking, so every section is retrieved whole instead of being cut mid-procedure.
+#
+# A manifest of content hashes lets re-runs rewrite only the sections that changed, so
+# `aws s3 sync` uploads, and the next data source sync re-ingests, only those sections.
+
+REPO_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+DEFAULT_GUIDE = os.path.join(REPO_DIR, 'assets', 'data', 'Troubleshooting_Guide.docx')
+DEFAULT_MANUAL = os.path.join(REPO_DIR, 'source', 'iot_simulator', 'sample_air_conditioner_manual', 'aircon_manual.md')
+
+MANIFEST_FILE = 'manifest.json'
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Data source settings the sections replace, used by the report
+FIXED_SIZE_MAX_TOKENS = 1024
+FIXED_SIZE_OVERLAP_PERCENTAGE = 30
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+def metadata_document(section):
+    """
+    Build the metadata.json sidecar of a section in the knowledge base metadata format.
+    """
+    def attribute(value):
+        return {'value': {'type': 'STRING', 'stringValue': value}, 'includeForEmbedding': True}
+
+    attributes = {
+        'company': attribute('AnyCompany'),
+        'origin': attribute(section['source']),
+        'section': attribute(section['title'])
+    }
+    if 'error_code' in section:
+        attributes['error_code'] = attribute(section['error_code'])
+    return {'metadataAttributes': attributes}
+
+def build_chunks(sections):
+    """
+    Name each section's file after its source document and title.
+
+    :return: Dictionary of file name to the file content and its metadata document
+    """
+    chunks = {}
+    for section in sections:
+        name = f"{slugify(os.path.splitext(section['source'])[0])}--{slugify(section['title'])}.md"
+        chunks[name] = {'text': section['text'] + '\n', 'metadata': metadata_document(section)}
+    return chunks
+
+def content_hash(chunk):
+    digest = hashlib.sha256(chunk['text'].encode('utf-8'))
+    digest.update(json.dumps(chunk['metadata'], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def write_chunks(chunks, output_dir):
+    """
+    Write the section files and their sidecars, leaving unchanged sections untouched.
+
+    :return: Dictionary of added, changed, removed and unchanged file names
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest:
+            previous = json.load(manifest)
+
+    current = {name: content_hash(chunk) for name, chunk in chunks.items()}
+    changes = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+    for name, chunk in chunks.items():
+        if previous.get(name) == current[name] and os.path.exists(os.path.join(output_dir, name)):
+            changes['unchanged'].append(name)
+            continue
+        changes['changed' if name in previous else 'added'].append(name)
+        with open(os.path.join(output_dir, name), 'w', encoding='utf-8') as section_file:
+            section_file.write(chunk['text'])
+        with open(os.path.join(output_dir, f"{name}.metadata.json"), 'w') as metadata_file:
+            json.dump(chunk['metadata'], metadata_file, indent=2)
+
+    for name in previous:
+        if name not in chunks:
+            changes['removed'].append(name)
+            for path in (os.path.join(output_dir, name), os.path.join(output_dir, f"{name}.metadata.json")):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    with open(manifest_path, 'w') as manifest:
+        json.dump(current, manifest, indent=2, sort_keys=True)
+    return changes
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def fixed_size_chunks(text, max_tokens=FIXED_SIZE_MAX_TOKENS, overlap_percentage=FIXED_SIZE_OVERLAP_PERCENTAGE):
+    """
+    Approximate the FIXED_SIZE chunking of the data source with word and punctuation tokens.
+    """
+    spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    step = max(1, int(max_tokens * (1 - overlap_percentage / 100)))
+    chunks = []
+    for start in range(0, len(spans), step):
+        end = min(start + max_tokens, len(spans))
+        chunks.append(text[spans[start][0]:spans[end - 1][1]])
+        if end == len(spans):
+            break
+    return chunks
+
+def rank(chunks, query, k1=1.2, b=0.75):
+    """
+    Rank chunks with BM25, a lexical stand-in for the knowledge base's vector search.
+    """
+    stop_words = set(tokenize('what are the for a an of and to is how do i does which'))
+    chunk_terms = [[term for term in tokenize(chunk) if term not in stop_words] for chunk in chunks]
+    average_length = sum(len(terms) for terms in chunk_terms) / len(chunk_terms)
+    terms = set(tokenize(query)) - stop_words
+
+    scored = []
+    for index, words in enumerate(chunk_terms):
+        score = 0
+        for term in terms:
+            frequency = words.count(term)
+            if frequency:
+                document_frequency = sum(1 for other in chunk_terms if term in other)
+                idf = math.log(1 + (len(chunks) - document_frequency + 0.5) / (document_frequency + 0.5))
+                score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(words) / average_length))
+        if score > 0:
+            scored.append((score, -index, chunks[index]))
+    return [chunk for _, _, chunk in sorted(scored, reverse=True)]
+
+def evaluation_queries(guide):
+    """
+    Questions with the text a retrieved chunk must contain to answer them in full.
+    """
+    queries = []
+    for section in guide:
+        if 'error_code' not in section:
+            continue
+        steps = [line for line in section['text'].splitlines() if line.startswith('- Troubleshooting Steps') or line.startswith('- Action')]
+        queries.append((f"What are the troubleshooting steps and action for error code {section['error_code']}?", steps))
+    queries.extend([
+        ("How do I reset the runtime hours after replacing the filter?", ['"action": "reset_runtime"', 'Needs Cleaning']),
+        ("Which fields does a shadow delta message update?", ['setpoint_temperature_c', 'fan_only']),
+        ("What does the clear_fault command do?", ['{"action": "clear_fault"}'])
+    ])
+    return queries
+
+def report(guide, manual, top_k):
+    """
+    Compare FIXED_SIZE chunks of the documents with section chunks on chunk count, tokens per retrieval and hit rate.
+    """
+    whole_documents = ['\n'.join(section['text'] for section in guide), '\n'.join(section['text'] for section in manual)]
+    strategies = {
+        f"FIXED_SIZE ({FIXED_SIZE_MAX_TOKENS} tokens, {FIXED_SIZE_OVERLAP_PERCENTAGE}% overlap)": [chunk for document in whole_documents for chunk in fixed_size_chunks(document)],
+        'sections': [section['text'] for section in guide + manual]
+    }
+
+    queries = evaluation_queries(guide)
+    print(f"{len(queries)} queries, top {top_k} chunks retrieved per query")
+    for name, chunks in strategies.items():
+        hits = 0
+        retrieved_tokens = 0
+        for query, expected in queries:
+            retrieved = rank(chunks, query)[:top_k]
+            retrieved_tokens += sum(len(tokenize(chunk)) for chunk in retrieved)
+            # A hit needs one chunk holding the whole answer, not pieces spread over several chunks
+            if any(all(text in chunk for text in expected) for chunk in retrieved):
+                hits += 1
+        print(f"{name}: {len(chunks)} chunks, {sum(len(tokenize(chunk)) for chunk in chunks) / len(chunks):.0f} tokens per chunk, "
+              f"{retrieved_tokens / len(queries):.0f} tokens per retrieval, hit rate {hits / len(queries):.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Split the troubleshooting guide and the manual into section chunks for the knowledge base.')
+    parser.add_argument('--guide', type=str, default=DEFAULT_GUIDE, help='Path to the troubleshooting guide (.docx)')
+    parser.add_argument('--manual', type=str, default=DEFAULT_MANUAL, help='Path to the air conditioner manual (.md)')
+    parser.add_argument('--output', type=str, default=os.path.join('build', 'knowledge-base'), help='Folder to write the section files to')
+    parser.add_argument('--report', action='store_true', help='Compare fixed-size and section chunking instead of writing files')
+    parser.add_argument('--top-k', type=int, default=5, help='Chunks retrieved per query in the report')
+    args = parser.parse_args()
+
+    guide = guide_sections(args.guide)
+    manual = manual_sections(args.manual)
+
+    if args.report:
+        report(guide, manual, args.top_k)
+        return
+
+    changes = write_chunks(build_chunks(guide + manual), args.output)
+    for change in ('added', 'changed', 'removed'):
+        for name in changes[change]:
+            print(f"{change}: {name}")
+    print(f"{len(changes['added'])} added, {len(changes['changed'])} changed, {len(changes['removed'])} removed, "
+          f"{len(changes['unchanged'])} unchanged sections in {args.output}")
+
+if __name__ == '__main__':
+    main()
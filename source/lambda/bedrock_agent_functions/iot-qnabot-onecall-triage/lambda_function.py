@@ -1,10 +1,87 @@
 import json
-import boto3
 import datetime
 import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
+from aws_clients import get_client, get_table
+from structured_logging import PhaseTimer, get_logger
+
+logger = get_logger()
+
+# Device commands that can be sent to many devices at once by the 'clear_faults' function
+BULK_COMMANDS = ('clear_fault', 'reset_runtime')
+
+def get_iot_data_client():
+    # The client is cached by aws_clients, so every publish in the invocation shares its connection pool
+    return get_client('iot-data', endpoint_url=os.environ.get('IOT_DATA_ENDPOINT'))
+
+def publish_command(client, device_id, command):
+    """
+    Publish a command to a device's command topic.
+    """
+    topic = f"aircon/commands/{device_id}"
+    payload = json.dumps({"action": command})
+    client.publish(
+        topic=topic,
+        qos=1,
+        payload=payload
+    )
+    logger.debug("Published command", topic=topic, payload=payload)
+
+def resolve_devices(params_dict):
+    """
+    Resolve the target devices of a bulk command from a comma separated device_ids list
+    and/or every device of a site owner in the device data table.
+    """
+    device_ids = [device_id.strip() for device_id in params_dict.get('device_ids', '').split(',') if device_id.strip()]
+
+    site = params_dict.get('site', '').strip()
+    if site:
+        table = get_table(os.environ.get('DEVICE_DATA_TABLE'))
+        scan_kwargs = {
+            'FilterExpression': 'siteowner = :site',
+            'ExpressionAttributeValues': {':site': site},
+            'ProjectionExpression': 'deviceid'
+        }
+        while True:
+            response = table.scan(**scan_kwargs)
+            device_ids.extend(item['deviceid'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    # Keep the order the devices were given in, without duplicates
+    return list(dict.fromkeys(device_ids))
+
+def publish_bulk_command(device_ids, command):
+    """
+    Publish a command to many devices with bounded parallelism.
+
+    :return: List of per-device results with the publish status and latency
+    """
+    client = get_iot_data_client()
+    max_concurrency = int(os.environ.get('BULK_COMMAND_MAX_CONCURRENCY', 10))
+
+    def publish(device_id):
+        started_at = time.time()
+        try:
+            publish_command(client, device_id, command)
+            result = {'device_id': device_id, 'status': 'published'}
+        except ClientError as e:
+            result = {'device_id': device_id, 'status': 'failed', 'error': e.response['Error']['Code']}
+        except BotoCoreError as e:
+            # Connection errors and timeouts fail this device only, not the whole fan-out
+            result = {'device_id': device_id, 'status': 'failed', 'error': type(e).__name__}
+        result['latency_ms'] = round((time.time() - started_at) * 1000)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return list(executor.map(publish, device_ids))
 
 def lambda_handler(event, context):
+    timer = PhaseTimer()
     try:
 
         agent = event['agent']
@@ -15,136 +92,102 @@ def lambda_handler(event, context):
         # Create a dictionary from the parameters list
         params_dict = {param['name']: param['value'] for param in parameters}
 
-        if 'unique_id' in params_dict:
-            unique_id = params_dict['unique_id']
-        else:
-            unique_id = str(uuid.uuid4())  
-
-        device_id = params_dict['device_id'] 
-        error_code = params_dict['error_code']
-        time_stamp_epoch = float(params_dict['time_stamp'])
-        dt = datetime.datetime.fromtimestamp(time_stamp_epoch)
-        time_stamp = dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-2]
-        troubleshooting_steps = params_dict['troubleshooting_steps']
-        if 'start_end_datetime' in params_dict:
-            start_end_datetime = params_dict['start_end_datetime']
-        else:
-            start_end_datetime = ''
+        # Bulk commands target a set of devices or a site instead of a single error
+        if function != 'clear_faults':
+            device_id = params_dict['device_id'] 
+            error_code = params_dict['error_code']
+            time_stamp_epoch = float(params_dict['time_stamp'])
+            dt = datetime.datetime.fromtimestamp(time_stamp_epoch)
+            time_stamp = dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-2]
+            troubleshooting_steps = params_dict['troubleshooting_steps']
+            if 'start_end_datetime' in params_dict:
+                start_end_datetime = params_dict['start_end_datetime']
+            else:
+                start_end_datetime = ''
+
+            if 'unique_id' in params_dict:
+                unique_id = params_dict['unique_id']
+            else:
+                # Derive the ticket id from the error details, so a retried log_ticket call maps to the same ticket
+                unique_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{device_id}/{error_code}/{params_dict['time_stamp']}"))
 
         if function == 'log_ticket':
             # Connect to DynamoDB for the maintenance database
-            dynamodb = boto3.resource('dynamodb')
-            table_name = os.environ.get('IOT_DEVICE_ERROR_TABLE')
-            table = dynamodb.Table(table_name)
-            
-            ## Store data into DynamoDB
+            table = get_table(os.environ.get('IOT_DEVICE_ERROR_TABLE'))
+
+            # The notification is delivered from the table's stream by the notification drain function,
+            # so the ticket and its pending notification are written in a single DynamoDB operation
+            item = {
+                'unique_id': unique_id,
+                'device_id': device_id,
+                'error_code': error_code,
+                'time_stamp': time_stamp,
+                'troubleshooting_steps': troubleshooting_steps,
+                'notification_status': 'PENDING'
+            }
             if start_end_datetime != '':
                 start_str, end_str = start_end_datetime.split(',')
                 start_datetime = datetime.datetime.strptime(start_str, "%Y-%m-%dT%H:%M:%S.%f")
                 end_datetime = datetime.datetime.strptime(end_str, "%Y-%m-%dT%H:%M:%S.%f")
+                item['anomaly_start'] = start_datetime.isoformat()
+                item['anomaly_end'] = end_datetime.isoformat()
+
+            ## Store data into DynamoDB
+            try:
                 table.put_item(
-                Item={
-                    'unique_id': unique_id,
-                    'device_id': device_id,
-                    'error_code': error_code,
-                    'time_stamp': time_stamp,
-                    'troubleshooting_steps': troubleshooting_steps,
-                    'anomaly_start': start_datetime.isoformat(),
-                    'anomaly_end': end_datetime.isoformat()
-                }
+                    Item=item,
+                    ConditionExpression='attribute_not_exists(unique_id)'
                 )
-            else:
-                table.put_item(
-                Item={
+                action = f"Logged ticket in DynamoDB successfully - unique_id: {unique_id}, device_id: {device_id}"
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                action = f"Ticket already logged in DynamoDB - unique_id: {unique_id}, device_id: {device_id}"
+
+        elif function == 'call_operator':
+
+            # Queue the call for the call dispatcher, which deduplicates calls per device and site,
+            # orders them by error code priority and caps concurrent outbound calls
+            sqs = get_client('sqs')
+            sqs.send_message(
+                QueueUrl=os.environ.get('CALL_QUEUE_URL'),
+                MessageBody=json.dumps({
                     'unique_id': unique_id,
                     'device_id': device_id,
                     'error_code': error_code,
                     'time_stamp': time_stamp,
                     'troubleshooting_steps': troubleshooting_steps
-                }
-                )
-            action = f"Logged ticket in DynamoDB successfully - unique_id: {unique_id}, device_id: {device_id}"
-            print(action)
-
-            # Send Email  - working code via SES, with Identity spin up in Connect
-        
-            ses = boto3.client('ses')
-            email_subject = "Aircon Maintenance Ticket"
-            email_body = f"Ticket details:\n\nUnique ID: {unique_id}\nDevice ID: {device_id}\nError Code: {error_code}\nTime Stamp: {time_stamp}\nTroubleshooting Steps: {troubleshooting_steps}"
-            ses.send_email(
-                Source=os.environ.get('SENDER_EMAIL_ID'),
-                Destination={
-                    'ToAddresses': [
-                        os.environ.get('RECIPIENT_EMAIL_ID'),
-                    ]
-                },
-                Message={
-                    'Subject': {
-                        'Data': email_subject
-                    },
-                    'Body': {
-                        'Text': {
-                            'Data': email_body
-                        }
-                    }
-                }
+                })
             )
-            
-
-        elif function == 'call_operator':
 
-            # Connect to Amazon Connect
-            connect = boto3.client('connect')
-
-            params = {
-                'ContactFlowId': os.environ.get('CONTACT_FLOW_ID'),
-                'DestinationPhoneNumber': os.environ.get('DESTINATION_PHONE_NO'),  
-                'InstanceId': os.environ.get('INSTANCE_ID'),
-                'SourcePhoneNumber': os.environ.get('SOURCE_PHONE_NO'),
-                'TrafficType': 'GENERAL',
-                'Attributes': {
-                    'UniqueID' : unique_id,
-                    'deviceID' : device_id,
-                    'errorCode' : error_code,
-                    'troubleshootingSteps' : troubleshooting_steps,
-                    'recipientEmail' : os.environ.get('RECIPIENT_EMAIL_ID')
-                                    
-                }    
-            }
+            action = "Queued a call to the site operator"
 
-            connect.start_outbound_voice_contact(**params)
 
-            action = "Placed a call to the site operator"
-            print(action)
+        elif function == 'clear_fault':
+            # Publish the clear_fault command to the specific device's topic
+            publish_command(get_iot_data_client(), device_id, 'clear_fault')
+            action = "Cleared fault from the IoT device"
 
+        elif function == 'clear_faults':
+            command = params_dict.get('command', 'clear_fault')
+            if command not in BULK_COMMANDS:
+                raise ValueError(f"Unsupported bulk command: {command}")
 
-        elif function == 'clear_fault':
-            # Retrieve the IoT Data endpoint from an environment variable
-            iot_data_endpoint = os.environ.get('IOT_DATA_ENDPOINT')
+            device_ids = resolve_devices(params_dict)
+            max_devices = int(os.environ.get('BULK_COMMAND_MAX_DEVICES', 200))
+            if len(device_ids) > max_devices:
+                raise ValueError(f"{len(device_ids)} devices requested, the limit is {max_devices}")
 
-            # Construct the topic using the device identifier
-            topic = f"aircon/commands/{device_id}"
-        
-            # Define the JSON payload to clear fault codes
-            payload = json.dumps({"action": "clear_fault"})
+            with timer.phase('publish'):
+                results = publish_bulk_command(device_ids, command)
+            published = sum(1 for result in results if result['status'] == 'published')
+            logger.info("Bulk command published", metric='bulk_command', command=command, devices=len(device_ids), published=published)
 
-            # Create the IoT Data client using the custom endpoint URL
-            client = boto3.client('iot-data', endpoint_url=iot_data_endpoint)
+            action = "Published {} to {} of {} IoT devices. Results: {}".format(command, published, len(device_ids), json.dumps(results))
 
-            # Publish the clear_fault command to the specific device's topic
-            client.publish(
-                topic=topic,
-                qos=1,
-                payload=payload
-            )
-            print(f"Published to {topic}: {payload}")
-            action = "Cleared fault from the IoT device"
-            print(action)
-            
 
         else:
             action = "No action needs to be taken"
-            print(action)
 
         responseBody =  {
             "TEXT": {
@@ -162,11 +205,12 @@ def lambda_handler(event, context):
         }
 
         function_response = {'response': action_response, 'messageVersion': event['messageVersion']}
-        print("Response: {}".format(function_response))
+        logger.info("Action taken", function=function, action=action, **timer.fields())
+        logger.debug("Response", response=function_response)
 
         return function_response
     except Exception as e:
-        print("Error occurred:", str(e))
+        logger.error("Error occurred", error=str(e), exc_info=True)
         return {
             'statusCode': 500,
             'body': json.dumps('Error occurred while processing the request')
@@ -1,113 +1,275 @@
 
 import json
-import boto3
 import datetime
 import os
 import csv
+import time
+import zlib
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from aws_clients import get_client, get_table
+from structured_logging import PhaseTimer, get_logger
+import manual_retrieval
+import telemetry_summary
+
+logger = get_logger()
+
+# Ticket attributes returned by the ticket lookups, also projected into the table's secondary indexes
+TICKET_ATTRIBUTES = ('unique_id', 'device_id', 'error_code', 'time_stamp', 'anomaly_start', 'anomaly_end', 'notification_status')
 
 def get_ticket_data(unique_id, device_id):
-    #implement code to fetch ticket data from DynamoDB
     # Connect to DynamoDB for the maintenance database
-    dynamodb = boto3.resource('dynamodb')
-    table_name = os.environ.get('IOT_DEVICE_ERROR_TABLE') #'iot-qna-bot-device-error' 
-    table = dynamodb.Table(table_name)
-
-    # Define the partition key and sort key values
-    partition_key_value = unique_id
-    sort_key_value = device_id
-
-    # Perform the query
-    response = table.query(
-        KeyConditionExpression='#pk = :pkval AND #sk = :skval',
-        ExpressionAttributeNames={
-            '#pk': 'unique_id',
-            '#sk': 'device_id'
-        },
-        ExpressionAttributeValues={
-            ':pkval': partition_key_value,
-            ':skval': sort_key_value
-        }
-    )
+    table = get_table(os.environ.get('IOT_DEVICE_ERROR_TABLE')) #'iot-qna-bot-device-error' 
+
+    # unique_id and device_id are the full primary key of the ticket
+    response = table.get_item(Key={'unique_id': unique_id, 'device_id': device_id})
 
     ticket_data = []
-    # Process the results
-    items = response['Items']
-    for item in items:
-        #print(item)
-        ticket_data.append(item)
+    if 'Item' in response:
+        ticket_data.append(response['Item'])
 
     return ticket_data
 
+def query_tickets(table, index_name, key_name, key_value, start_time, limit, deadline, filters=None):
+    """
+    Query a ticket index for one key value, newest tickets first.
+
+    Pages are read until `limit` tickets are found, the index is exhausted or the deadline passes.
+
+    :return: Tuple of (tickets, True if more tickets may exist)
+    """
+    query_kwargs = {
+        'IndexName': index_name,
+        'KeyConditionExpression': Key(key_name).eq(key_value) & Key('time_stamp').gte(start_time),
+        'ProjectionExpression': ', '.join(f"#{attribute}" for attribute in TICKET_ATTRIBUTES),
+        'ExpressionAttributeNames': {f"#{attribute}": attribute for attribute in TICKET_ATTRIBUTES},
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    if filters is not None:
+        query_kwargs['FilterExpression'] = filters
+
+    tickets = []
+    while True:
+        response = table.query(**query_kwargs)
+        tickets.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return tickets[:limit], False
+        if len(tickets) >= limit or time.time() >= deadline:
+            return tickets[:limit], True
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def find_tickets(device_id=None, error_code=None, since_minutes=None, limit=None):
+    """
+    Find tickets by device and/or error code over a recent time range, newest first.
+
+    Device lookups use the DeviceTimeIndex and error code lookups the ErrorCodeTimeIndex.
+    Without either, every known error code is queried and the results are merged.
+    """
+    table = get_table(os.environ.get('IOT_DEVICE_ERROR_TABLE'))
+    if since_minutes is None:
+        since_minutes = int(os.environ.get('TICKET_LOOKBACK_MINUTES', 1440))
+    limit = min(limit or 50, int(os.environ.get('TICKET_MAX_RESULTS', 50)))
+    deadline = time.time() + float(os.environ.get('TICKET_QUERY_TIMEOUT_SECONDS', 5))
+
+    # Ticket time stamps are stored in the format written by the triage action group
+    start_time = (datetime.datetime.now() - datetime.timedelta(minutes=since_minutes)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-2]
+
+    if device_id:
+        filters = Attr('error_code').eq(error_code) if error_code else None
+        tickets, truncated = query_tickets(table, 'DeviceTimeIndex', 'device_id', device_id, start_time, limit, deadline, filters)
+    else:
+        error_codes = [error_code] if error_code else os.environ.get('TICKET_ERROR_CODES', 'E1,E2,E3,W1').split(',')
+        tickets, truncated = [], False
+        for code in error_codes:
+            code_tickets, code_truncated = query_tickets(table, 'ErrorCodeTimeIndex', 'error_code', code.strip(), start_time, limit, deadline)
+            tickets.extend(code_tickets)
+            truncated = truncated or code_truncated
+        tickets = sorted(tickets, key=lambda ticket: ticket['time_stamp'], reverse=True)
+        truncated = truncated or len(tickets) > limit
+        tickets = tickets[:limit]
+
+    return {'since': start_time, 'count': len(tickets), 'truncated': truncated, 'tickets': tickets}
+
+def telemetry_hours(start_datetime, end_datetime):
+    """
+    List the hour partitions (%Y/%m/%d/%H) covering the anomaly window, most recent first.
+
+    The window is capped at TELEMETRY_MAX_HOURS hours, keeping the hours closest to its end.
+    """
+    start_hour = start_datetime.replace(minute=0, second=0, microsecond=0)
+    end_hour = end_datetime.replace(minute=0, second=0, microsecond=0)
+    max_hours = int(os.environ.get('TELEMETRY_MAX_HOURS', 24))
+
+    hours = []
+    hour = end_hour
+    while hour >= start_hour and len(hours) < max_hours:
+        hours.append(hour.strftime("%Y/%m/%d/%H"))
+        hour -= datetime.timedelta(hours=1)
+    return hours
+
+def parse_telemetry_row(row):
+    return {
+        'device_id': row[1],
+        'indoor_temperature_c': row[2],
+        'outdoor_temperature_c': row[3],
+        'setpoint_temperature_c': row[4],
+        'mode': row[5],
+        #'indoor_humidity_percent': indoor_humidity_percent,
+        #'outdoor_humidity_percent': outdoor_humidity_percent,
+        'watts': row[6],
+        'compressor_status': row[7],
+        'fan_speed_rpm': row[8],
+        'refrigerant_pressure_psi': row[9],
+        'error_code': row[10],
+        'filter_status': row[11],
+        'timestamp': row[0]
+        }
+
+def iter_device_rows(lines, device_id):
+    """
+    Yield a device's rows from an iterable of encoded CSV lines.
+
+    Lines that do not contain the device id are dropped before they are decoded and parsed.
+    """
+    device_bytes = device_id.encode('utf-8')
+    for line in lines:
+        if device_bytes not in line:
+            continue
+        row = next(csv.reader([line.decode('utf-8')]))
+        if len(row) > 1 and row[1] == device_id:
+            yield row
+
+def device_index_shard(device_id, shards):
+    # Must match device_index_shard in the clean inference output function, which writes the shards
+    return zlib.crc32(device_id.encode('utf-8')) % shards
+
+def read_device_index(s3, bucket, device_id, hour):
+    """
+    Read a device's rows for one hour through the device index of the hour's processed output.
+
+    The manifest names the processed output and the shard count, the device's shard holds the
+    byte range of its rows, which is the only part of the processed output read.
+
+    :return: List of rows, or None if the hour was not indexed and has to be scanned
+    """
+    try:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=f"telemetry/device-index/{hour}/_manifest.json")["Body"].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None
+        raise
+
+    shard = device_index_shard(device_id, manifest['shards'])
+    byte_ranges = json.loads(s3.get_object(Bucket=bucket, Key=f"telemetry/device-index/{hour}/{shard:03d}.json")["Body"].read())
+    if device_id not in byte_ranges:
+        # The device had no rows in an indexed hour
+        return []
+
+    start, end = byte_ranges[device_id]
+    body = s3.get_object(Bucket=bucket, Key=manifest['key'], Range=f"bytes={start}-{end}")["Body"]
+    return list(iter_device_rows(body.iter_lines(), device_id))
+
+def read_block_index(s3, bucket, key):
+    """
+    Read the block index written next to a processed output file.
+
+    :return: The block index, or None for files written before block indexes existed
+    """
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=f"{key}.idx.json")["Body"].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None
+        raise
+
+def device_block_ranges(block_index, device_id):
+    """
+    Select the byte ranges of the blocks that can hold the device's rows, merging adjacent blocks.
+
+    Blocks are sorted by device name, so the scan stops at the first block past the device.
+    """
+    ranges = []
+    for block in block_index['blocks']:
+        if block['min_device'] > device_id:
+            break
+        if block['max_device'] < device_id:
+            continue
+        if ranges and ranges[-1][1] + 1 == block['start']:
+            ranges[-1][1] = block['end']
+        else:
+            ranges.append([block['start'], block['end']])
+    return ranges
+
+def scan_processed_output(s3, bucket, device_id, hour):
+    """
+    Read a device's rows for one hour from every processed output file of the hour.
+
+    Files with a block index are read only for the byte ranges that can hold the device's rows,
+    other files are streamed line by line, so memory use does not grow with the file size.
+    """
+    rows = []
+    path = f"telemetry/processed-output/{hour}"
+    logger.info("Scanning processed output", path=path)
+
+    response = s3.list_objects_v2(Bucket=bucket, Prefix=path)
+    for obj in response.get('Contents', []):
+        if not obj['Key'].endswith('.csv'):
+            continue
+
+        block_index = read_block_index(s3, bucket, obj['Key'])
+        if block_index is None:
+            logger.info("Streaming file", key=obj['Key'])
+            body = s3.get_object(Bucket=bucket, Key=obj['Key'])["Body"]
+            rows.extend(iter_device_rows(body.iter_lines(), device_id))
+            continue
+
+        ranges = device_block_ranges(block_index, device_id)
+        logger.info("Reading indexed file", key=obj['Key'], byte_ranges=len(ranges), blocks=len(block_index['blocks']))
+        for start, end in ranges:
+            body = s3.get_object(Bucket=bucket, Key=obj['Key'], Range=f"bytes={start}-{end}")["Body"]
+            rows.extend(iter_device_rows(body.iter_lines(), device_id))
+    return rows
+
 def get_device_telemetry_data(device_id, start_datetime, end_datetime):
-    s3 = boto3.client('s3')
+    s3 = get_client('s3')
     telemetry_s3Bucket = os.environ.get('TELEMETRY_ANOMALY_S3_BUCKET')
     
     start_datetime_obj = datetime.datetime.fromisoformat(start_datetime)
     end_datetime_obj = datetime.datetime.fromisoformat(end_datetime)
- 
-    time_difference_hrs = int((end_datetime_obj - start_datetime_obj).total_seconds() / 3600)
-    time_difference_hrs = 1 # REMOVE THIS 
-
-    #Get all the s3 paths to process
-    s3paths = []
-    for x in range(time_difference_hrs):
-        s3paths.append((end_datetime_obj - datetime.timedelta(hours=(x))).strftime("telemetry/processed-output/%Y/%m/%d/%H"))
 
-    print(s3paths)
+    hours = telemetry_hours(start_datetime_obj, end_datetime_obj)
+    logger.debug("Telemetry hours", hours=hours)
 
     telemetry_data = []
+    started_at = time.time()
+    scanned_hours = 0
+
+    # Read the device's rows from the per-device index, scanning only hours written before it existed
+    for hour in hours:
+        rows = read_device_index(s3, telemetry_s3Bucket, device_id, hour)
+        if rows is None:
+            scanned_hours += 1
+            rows = scan_processed_output(s3, telemetry_s3Bucket, device_id, hour)
+        telemetry_data.extend(parse_telemetry_row(row) for row in rows)
 
-    #Loop through all the S3 prefixes
-    for path in s3paths:
-        print("S3 path: ", path)
-
-        #  Read all CSV files from S3
-        response = s3.list_objects_v2(Bucket=telemetry_s3Bucket, Prefix=path)
-        for obj in response['Contents']:
-            if obj['Key'].endswith('.csv'):
-                print("Reading file: ", obj['Key'])
-                telemtery_csv_data = s3.get_object(Bucket=telemetry_s3Bucket, Key=obj['Key'])["Body"].read().decode('utf-8').splitlines()
-                telemtery_csvreader = csv.reader(telemtery_csv_data)
-                next(telemtery_csvreader) #skip the header
-
-                for row in telemtery_csvreader:
-                    device_name = row[1]
-                    if device_name == device_id:
-                        indoor_temperature_c = row[2]
-                        outdoor_temperature_c = row[3]
-                        setpoint_temperature_c = row[4]
-                        mode = row[5]
-                        power_consumption_watts = row[6]
-                        compressor_status = row[7]
-                        fan_speed_rpm = row[8]
-                        refrigerant_pressure_psi = row[9]
-                        error_code = row[10]
-                        filter_status = row[11]
-                        timestamp = row[0]                        
-                        
-                        telemetry_data.append({
-                            'device_id': device_id,
-                            'indoor_temperature_c': indoor_temperature_c,
-                            'outdoor_temperature_c': outdoor_temperature_c,
-                            'setpoint_temperature_c': setpoint_temperature_c,
-                            'mode': mode,
-                            #'indoor_humidity_percent': indoor_humidity_percent,
-                            #'outdoor_humidity_percent': outdoor_humidity_percent,
-                            'watts': power_consumption_watts,
-                            'compressor_status': compressor_status,
-                            'fan_speed_rpm': fan_speed_rpm,
-                            'refrigerant_pressure_psi': refrigerant_pressure_psi,
-                            'error_code': error_code,
-                            'filter_status': filter_status,
-                            'timestamp': timestamp
-                            })
+    logger.info(
+        "Telemetry lookup complete",
+        metric='telemetry_lookup',
+        device_id=device_id,
+        hours=len(hours),
+        scanned_hours=scanned_hours,
+        rows=len(telemetry_data),
+        latency_ms=round((time.time() - started_at) * 1000)
+    )
                  
     return telemetry_data
 
 
 def lambda_handler(event, context):
+    timer = PhaseTimer()
     try:
-        print(event)
+        logger.debug("Event", event=event)
         agent = event['agent']
         actionGroup = event['actionGroup']
         function = event['function']
@@ -117,13 +279,21 @@ def lambda_handler(event, context):
         params_dict = {param['name']: param['value'] for param in parameters}
 
         
-        unique_id = params_dict['unique_id']  
-        device_id = params_dict['device_id'] 
+        unique_id = params_dict.get('unique_id')
+        device_id = params_dict.get('device_id')
 
         if function == 'fetch_ticket_data':
             ticket_data = get_ticket_data(unique_id, device_id)
             action = "Fetched ticket data: " + str(ticket_data) 
-            print(action)
+
+        elif function == 'find_tickets':
+            tickets = find_tickets(
+                device_id=device_id,
+                error_code=params_dict.get('error_code'),
+                since_minutes=int(params_dict['since_minutes']) if 'since_minutes' in params_dict else None,
+                limit=int(params_dict['limit']) if 'limit' in params_dict else None
+            )
+            action = "Found tickets: " + json.dumps(tickets, separators=(',', ':'), default=str)
 
         elif function == 'fetch_telemetry_data':
             ticket_data = get_ticket_data(unique_id, device_id)
@@ -131,15 +301,36 @@ def lambda_handler(event, context):
             start_datetime = (ticket_data[0]['anomaly_start'])
             end_datetime = (ticket_data[0]['anomaly_end'])
 
-            telemetry_data = get_device_telemetry_data(device_id, start_datetime, end_datetime)
-            print(telemetry_data)
+            with timer.phase('telemetry_lookup'):
+                telemetry_data = get_device_telemetry_data(device_id, start_datetime, end_datetime)
+
+            # Return a bounded summary of the window rather than every raw row,
+            # plus one page of raw rows when the agent asks for it
+            telemetry_response = {
+                'device_id': device_id,
+                'anomaly_start': start_datetime,
+                'anomaly_end': end_datetime,
+                'summary': telemetry_summary.summarize_telemetry(telemetry_data, max_items=int(os.environ.get('TELEMETRY_SUMMARY_MAX_ITEMS', 5)))
+            }
+            if 'page' in params_dict:
+                page = max(int(params_dict['page']), 1)
+                max_page_size = int(os.environ.get('TELEMETRY_MAX_PAGE_SIZE', 100))
+                page_size = min(max(int(params_dict.get('page_size', max_page_size)), 1), max_page_size)
+                telemetry_response['raw_rows'] = telemetry_summary.page_rows(telemetry_data, page, page_size)
             
-            action = "Fetched telemetry data : " + str(telemetry_data) 
-            print(action)
+            action = "Fetched telemetry data : " + json.dumps(telemetry_response, separators=(',', ':'))
+
+        elif function == 'fetch_troubleshooting_steps':
+            # Served from the manual indexed in memory, without a knowledge base round trip
+            with timer.phase('manual_lookup'):
+                steps = manual_retrieval.troubleshooting_steps(
+                    error_code=params_dict.get('error_code'),
+                    question=params_dict.get('question')
+                )
+            action = "Fetched troubleshooting steps: " + json.dumps(steps, separators=(',', ':'), ensure_ascii=False)
 
         else:
             action = "No action needs to be taken"
-            print(action)
 
         # Execute your business logic here. For more information, refer to: https://docs.aws.amazon.com/bedrock/latest/userguide/agents-lambda.html
         responseBody =  {
@@ -159,12 +350,13 @@ def lambda_handler(event, context):
         }
 
         function_response = {'response': action_response, 'messageVersion': event['messageVersion']}
-        print("Response: {}".format(function_response))
+        logger.info("Action taken", function=function, action=action, **timer.fields())
+        logger.debug("Response", response=function_response)
 
         return function_response
     
     except Exception as e:
-        print("Error occurred:", str(e))
+        logger.error("Error occurred", error=str(e), exc_info=True)
         return {
             'statusCode': 500,
             'body': json.dumps('Error occurred while processing the request')
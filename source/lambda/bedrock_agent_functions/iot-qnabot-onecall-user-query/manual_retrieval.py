@@ -0,0 +1,186 @@
+import math
+import os
+import re
+from collections import Counter
+from document_sections import ERROR_CODE_PATTERN, guide_sections, manual_sections
+
+# In-process retrieval over the air conditioner manual, so troubleshooting steps for an error code
+# are served from memory instead of a knowledge base round trip. Both documents and the section
+# parser used to prepare the knowledge base (source/knowledge_base/document_sections.py) are bundled
+# with the function and indexed once per cold start: the troubleshooting guide, keyed by error code,
+# and the instruction manual, split by section and searched with BM25.
+
+TROUBLESHOOTING_GUIDE = 'Troubleshooting_Guide.docx'
+INSTRUCTION_MANUAL = 'aircon_manual.md'
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+# The function package holds the documents next to this module
+MANUAL_DIR = os.environ.get('MANUAL_DIR', MODULE_DIR)
+
+NUMBERED_STEP_PATTERN = re.compile(r'(?:^|[,.]?\s+)\d+\.\s+')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i', 'if', 'in',
+    'is', 'it', 'its', 'my', 'of', 'on', 'or', 'the', 'this', 'to', 'what', 'when', 'why', 'with', 'you'
+))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def find_document(file_name):
+    path = os.path.join(MANUAL_DIR, file_name)
+    return path if os.path.exists(path) else None
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def split_steps(text):
+    """
+    Split "1. Check A, 2. Verify B" into ["Check A", "Verify B"], dropping the closing "STOP! No more action."
+    """
+    text = text.replace('STOP! No more action.', '')
+    return [step.strip(' ,.') for step in NUMBERED_STEP_PATTERN.split(text) if step.strip(' ,.')]
+
+def parse_troubleshooting_guide(path):
+    """
+    Parse the troubleshooting guide into one entry per error code.
+
+    Each error code section holds "Field: value" lines for the fault type, internal effect,
+    troubleshooting steps and action.
+    """
+    entries = {}
+    for section in guide_sections(path):
+        if 'error_code' not in section:
+            continue
+        entry = {'error_code': section['error_code'], 'source': TROUBLESHOOTING_GUIDE}
+        for line in section['text'].splitlines()[1:]:
+            if ':' not in line:
+                continue
+            field, value = (part.strip() for part in line.lstrip('- ').split(':', 1))
+            field = field.lower().replace(' ', '_')
+            if field in ('troubleshooting_steps', 'action'):
+                entry[field] = split_steps(value)
+            else:
+                entry[field] = value
+        entries[entry['error_code']] = entry
+    return entries
+
+def parse_manual_fault_table(sections):
+    """
+    Read the error code rows of the manual's fault code table, used for codes missing from the guide.
+    """
+    entries = {}
+    for section in sections:
+        for line in section['text'].splitlines():
+            cells = [cell.strip().strip('`') for cell in line.strip().strip('|').split('|')]
+            if len(cells) == 4 and ERROR_CODE_PATTERN.fullmatch(cells[2]):
+                entries[cells[2]] = {
+                    'error_code': cells[2],
+                    'fault_type': cells[0],
+                    'internal_effect': cells[1].replace('`', ''),
+                    'troubleshooting_steps': split_steps(cells[3].replace('<br/>', ' ')),
+                    'source': INSTRUCTION_MANUAL
+                }
+    return entries
+
+def entry_text(entry):
+    return ' '.join([entry['error_code'], entry.get('fault_type', '').replace('_', ' '), entry.get('internal_effect', '')]
+                    + entry.get('troubleshooting_steps', []) + entry.get('action', []))
+
+class BM25Index:
+    """
+    Okapi BM25 over a small list of chunks, with term frequencies and idf computed once.
+    """
+
+    def __init__(self, chunks, text_of):
+        self.chunks = chunks
+        self.term_frequencies = [Counter(tokenize(text_of(chunk))) for chunk in chunks]
+        self.lengths = [sum(frequencies.values()) for frequencies in self.term_frequencies]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        document_frequencies = Counter(term for frequencies in self.term_frequencies for term in frequencies)
+        self.idf = {
+            term: math.log(1 + (len(chunks) - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequencies.items()
+        }
+
+    def search(self, query, limit=3):
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for index, frequencies in enumerate(self.term_frequencies):
+            score = 0
+            for term in terms:
+                frequency = frequencies.get(term)
+                if frequency:
+                    norm = K1 * (1 - B + B * self.lengths[index] / self.average_length)
+                    score += self.idf[term] * frequency * (K1 + 1) / (frequency + norm)
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(reverse=True)
+        return [(round(score, 3), self.chunks[index]) for score, index in scores[:limit]]
+
+def load_manual():
+    """
+    Load and index the bundled documents.
+
+    :return: Dictionary of error code entries and a BM25 index over the entries and the manual sections
+    """
+    sections = []
+    error_codes = {}
+
+    manual_path = find_document(INSTRUCTION_MANUAL)
+    if manual_path:
+        sections = manual_sections(manual_path)
+        error_codes.update(parse_manual_fault_table(sections))
+
+    # The troubleshooting guide is what the knowledge base serves, it wins over the manual's table
+    guide_path = find_document(TROUBLESHOOTING_GUIDE)
+    if guide_path:
+        error_codes.update(parse_troubleshooting_guide(guide_path))
+
+    chunks = [{'title': f"Error Code: {code}", 'entry': entry} for code, entry in error_codes.items()] + sections
+    index = BM25Index(chunks, lambda chunk: entry_text(chunk['entry']) if 'entry' in chunk else f"{chunk['title']} {chunk['text']}")
+    return error_codes, index
+
+# Indexed once per cold start
+ERROR_CODES, MANUAL_INDEX = load_manual()
+
+def lookup_error_code(error_code):
+    return ERROR_CODES.get(error_code.strip().upper()) if error_code else None
+
+def search_manual(question, limit=3, max_chars=1500):
+    """
+    Search the manual for a free text question.
+
+    :return: Best matching chunks with their score, section text truncated to max_chars
+    """
+    results = []
+    for score, chunk in MANUAL_INDEX.search(question, limit):
+        if 'entry' in chunk:
+            results.append({'score': score, 'title': chunk['title'], 'entry': chunk['entry']})
+        else:
+            results.append({'score': score, 'title': chunk['title'], 'text': chunk['text'][:max_chars], 'source': chunk['source']})
+    return results
+
+def troubleshooting_steps(error_code=None, question=None, limit=3):
+    """
+    Find the troubleshooting steps and actions for an error code, falling back to a search of the manual.
+
+    :param error_code: Error code such as E1 or W1, looked up directly
+    :param question: Free text question, searched when the error code is missing or unknown
+    :return: Dictionary with the matching error code entry or the best matching manual chunks
+    """
+    entry = lookup_error_code(error_code)
+    if entry is not None:
+        return {'error_code': entry['error_code'], 'match': 'error_code', 'entry': entry}
+
+    query = ' '.join(part for part in (error_code, question) if part)
+    if not query:
+        return {'match': 'none', 'known_error_codes': sorted(ERROR_CODES)}
+
+    # An error code mentioned in the question can still be served directly
+    match = ERROR_CODE_PATTERN.search(query.upper())
+    if match and match.group(1) in ERROR_CODES:
+        return {'error_code': match.group(1), 'match': 'error_code', 'entry': ERROR_CODES[match.group(1)]}
+
+    return {'match': 'search', 'results': search_manual(query, limit), 'known_error_codes': sorted(ERROR_CODES)}
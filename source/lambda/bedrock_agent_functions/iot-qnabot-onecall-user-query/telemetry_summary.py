@@ -0,0 +1,217 @@
+import datetime
+import math
+
+# Summarizes a device's telemetry rows into a compact, bounded payload for the Bedrock agent,
+# instead of returning every raw row of the anomaly window.
+
+NUMERIC_METRICS = ('indoor_temperature_c', 'outdoor_temperature_c', 'setpoint_temperature_c', 'watts', 'fan_speed_rpm', 'refrigerant_pressure_psi')
+STATE_METRICS = ('mode', 'compressor_status', 'filter_status')
+NO_ERROR_CODES = ('', 'None', 'nan')
+
+ROW_COLUMNS = ('timestamp',) + NUMERIC_METRICS + STATE_METRICS + ('error_code',)
+
+# Smallest change each metric reports, the devices send whole numbers
+METRIC_RESOLUTION = {metric: 1.0 for metric in NUMERIC_METRICS}
+# Lower bound of the noise estimate, as a fraction of the metric's standard deviation over the window
+NOISE_FLOOR_STD_FRACTION = 0.1
+
+def parse_float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+def parse_timestamp(value):
+    """
+    Parse an epoch or an ISO 8601 timestamp into epoch seconds, None when it is neither.
+
+    The simulator writes naive ISO timestamps from datetime.utcnow(), they are read as UTC.
+    """
+    epoch = parse_float(value)
+    if epoch is not None:
+        return epoch
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+def format_timestamp(value):
+    """
+    Format an epoch or ISO 8601 timestamp as ISO 8601 in UTC, leaving any other value as is.
+    """
+    epoch = parse_timestamp(value)
+    if epoch is None:
+        return value
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def sort_rows(rows):
+    """
+    Order rows oldest first, rows without a readable timestamp first.
+    """
+    def key(row):
+        epoch = parse_timestamp(row['timestamp'])
+        return (epoch is not None, epoch or 0)
+    return sorted(rows, key=key)
+
+def percentile(sorted_values, fraction):
+    """
+    Linearly interpolated percentile of an already sorted list.
+    """
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def metric_stats(values):
+    if not values:
+        return None
+    sorted_values = sorted(values)
+    return {
+        'min': round(sorted_values[0], 2),
+        'max': round(sorted_values[-1], 2),
+        'mean': round(sum(sorted_values) / len(sorted_values), 2),
+        'p50': round(percentile(sorted_values, 0.5), 2),
+        'p90': round(percentile(sorted_values, 0.9), 2),
+        'p99': round(percentile(sorted_values, 0.99), 2)
+    }
+
+def fault_intervals(rows, max_intervals):
+    """
+    Collapse consecutive rows reporting the same error code into intervals.
+    """
+    intervals = []
+    current = None
+    for row in rows:
+        error_code = row['error_code']
+        if error_code in NO_ERROR_CODES:
+            current = None
+            continue
+        if current is not None and current['error_code'] == error_code:
+            current['end'] = row['timestamp']
+            current['samples'] += 1
+            continue
+        current = {'error_code': error_code, 'start': row['timestamp'], 'end': row['timestamp'], 'samples': 1}
+        intervals.append(current)
+
+    return [dict(interval, start=format_timestamp(interval['start']), end=format_timestamp(interval['end'])) for interval in intervals[:max_intervals]], len(intervals)
+
+def change_points(rows, metric, window, sigma, max_points):
+    """
+    Find the largest level shifts of a metric.
+
+    A change point is a row where the mean of the next `window` samples differs from the mean
+    of the previous `window` samples by more than `sigma` times the metric's sample noise.
+
+    The noise is floored at the metric's resolution and at a fraction of its standard deviation,
+    since a metric that mostly holds still has a zero noise estimate and any change would pass.
+    Metrics whose noise is still zero, i.e. constant over the window, have no change points.
+    """
+    samples = [(row['timestamp'], parse_float(row[metric])) for row in rows]
+    samples = [(timestamp, value) for timestamp, value in samples if value is not None]
+    if len(samples) < 2 * window:
+        return []
+
+    values = [value for _, value in samples]
+
+    # Estimate the noise from successive differences, so the level shifts themselves do not inflate it
+    differences = sorted(abs(current - previous) for previous, current in zip(values, values[1:]))
+    noise = percentile(differences, 0.5) * 1.4826 / math.sqrt(2)
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+    noise = max(noise, METRIC_RESOLUTION.get(metric, 0.0) if std else 0.0, NOISE_FLOOR_STD_FRACTION * std)
+    if noise == 0:
+        return []
+
+    # Prefix sums give the mean of any window in constant time
+    prefix = [0.0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+
+    candidates = []
+    for index in range(window, len(values) - window + 1):
+        before = (prefix[index] - prefix[index - window]) / window
+        after = (prefix[index + window] - prefix[index]) / window
+        if abs(after - before) > sigma * noise:
+            candidates.append((abs(after - before), index, before, after))
+
+    # Keep the strongest shift of each neighbourhood, then the strongest overall
+    points = []
+    for shift, index, before, after in sorted(candidates, reverse=True):
+        if any(abs(index - point['index']) < window for point in points):
+            continue
+        points.append({'index': index, 'at': format_timestamp(samples[index][0]), 'before': round(before, 2), 'after': round(after, 2)})
+        if len(points) == max_points:
+            break
+
+    return [{key: value for key, value in point.items() if key != 'index'} for point in sorted(points, key=lambda point: point['index'])]
+
+def state_changes(rows, metric, max_changes):
+    changes = []
+    previous = None
+    for row in rows:
+        value = row[metric]
+        if previous is not None and value != previous:
+            changes.append({'at': format_timestamp(row['timestamp']), 'from': previous, 'to': value})
+        previous = value
+    return changes[-max_changes:], len(changes)
+
+def summarize_telemetry(rows, max_items=5, change_window=None, change_sigma=2):
+    """
+    Summarize a device's telemetry over the anomaly window.
+
+    :param rows: Telemetry rows as returned by get_device_telemetry_data
+    :param max_items: Maximum fault intervals, change points and state changes listed per metric
+    :param change_window: Samples averaged on each side of a change point, 5% of the window by default
+    :return: Dictionary with per-metric statistics, fault intervals, change points and state changes
+    """
+    rows = sort_rows(rows)
+    if not rows:
+        return {'samples': 0}
+
+    if change_window is None:
+        change_window = max(5, len(rows) // 20)
+
+    summary = {
+        'samples': len(rows),
+        'start': format_timestamp(rows[0]['timestamp']),
+        'end': format_timestamp(rows[-1]['timestamp']),
+        'metrics': {},
+        'change_points': {},
+        'state_changes': {}
+    }
+
+    for metric in NUMERIC_METRICS:
+        stats = metric_stats([value for value in (parse_float(row[metric]) for row in rows) if value is not None])
+        if stats is not None:
+            summary['metrics'][metric] = stats
+        points = change_points(rows, metric, change_window, change_sigma, max_items)
+        if points:
+            summary['change_points'][metric] = points
+
+    for metric in STATE_METRICS:
+        changes, total = state_changes(rows, metric, max_items)
+        summary['state_changes'][metric] = {'last': rows[-1][metric], 'changes': total, 'recent': changes}
+
+    intervals, total = fault_intervals(rows, max_items)
+    summary['fault_intervals'] = {'total': total, 'intervals': intervals}
+
+    return summary
+
+def page_rows(rows, page, page_size):
+    """
+    Return one page of raw rows as a column list plus value lists, oldest first.
+    """
+    rows = sort_rows(rows)
+    start = (page - 1) * page_size
+    return {
+        'page': page,
+        'page_size': page_size,
+        'total_rows': len(rows),
+        'total_pages': math.ceil(len(rows) / page_size),
+        'columns': list(ROW_COLUMNS),
+        'rows': [[row[column] for column in ROW_COLUMNS] for row in rows[start:start + page_size]]
+    }
@@ -0,0 +1,81 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# Shared, lazily initialized boto3 clients and resources for the solution's Lambda functions.
+# Clients are created on first use and cached at module level, so warm invocations reuse
+# the same connection pool (and its open TLS connections) instead of building a new client.
+
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+def client_config(**overrides):
+    """
+    Build the botocore Config used for every client.
+
+    Defaults can be tuned per function through environment variables and
+    per client through keyword arguments (e.g. read_timeout for long agent calls).
+    """
+    settings = {
+        'max_pool_connections': int(os.environ.get('AWS_CLIENT_MAX_POOL_CONNECTIONS', 20)),
+        'connect_timeout': float(os.environ.get('AWS_CLIENT_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(os.environ.get('AWS_CLIENT_READ_TIMEOUT', 60)),
+        'tcp_keepalive': True,
+        'retries': {
+            'mode': os.environ.get('AWS_CLIENT_RETRY_MODE', 'standard'),
+            'max_attempts': int(os.environ.get('AWS_CLIENT_MAX_ATTEMPTS', 3))
+        }
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+def _cache_key(service_name, endpoint_url, overrides):
+    return (service_name, endpoint_url, tuple(sorted((key, repr(value)) for key, value in overrides.items())))
+
+def get_client(service_name, endpoint_url=None, **config_overrides):
+    """
+    Return the cached client for a service, creating it on first use.
+
+    :param service_name: boto3 service name, e.g. 'dynamodb' or 'iot-data'
+    :param endpoint_url: Optional custom endpoint, e.g. the IoT data endpoint
+    :param config_overrides: botocore Config settings that differ from the defaults
+    """
+    key = _cache_key(service_name, endpoint_url, config_overrides)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = boto3.client(service_name, endpoint_url=endpoint_url, config=client_config(**config_overrides))
+                _clients[key] = client
+    return client
+
+def get_resource(service_name, **config_overrides):
+    """
+    Return the cached boto3 resource for a service, creating it on first use.
+    """
+    key = _cache_key(service_name, None, config_overrides)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = boto3.resource(service_name, config=client_config(**config_overrides))
+                _resources[key] = resource
+    return resource
+
+def get_table(table_name):
+    """
+    Return a DynamoDB Table from the cached DynamoDB resource.
+    """
+    return get_resource('dynamodb').Table(table_name)
+
+def reset_clients():
+    """
+    Drop every cached client and resource, so the next call builds a new one.
+    """
+    with _lock:
+        _clients.clear()
+        _resources.clear()
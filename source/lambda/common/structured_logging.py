@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import random
+import time
+import traceback
+from contextlib import contextmanager
+
+# Structured logging shared by the solution's Lambda functions.
+# Every record is written as a single compact JSON line. Field values are only formatted
+# once a record is known to be emitted, so records below the log level or dropped by
+# sampling cost a level check instead of a json.dumps of the whole event.
+
+LEVELS = {'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING, 'ERROR': logging.ERROR}
+
+REDACTED = '***'
+DEFAULT_REDACT_FIELDS = 'siteownercontact,recipientemail,destinationphonenumber,sourcephonenumber,phone,email,authorization,idtokenjwt,accesstoken'
+
+def _sample_rates():
+    # Warnings and errors are always kept unless a rate is set explicitly
+    return {
+        level: float(os.environ.get(f"LOG_SAMPLE_RATE_{name}", 1))
+        for name, level in LEVELS.items()
+    }
+
+class StructuredLogger:
+    """
+    Logger writing one JSON line per record, with lazy fields, redaction, size caps and sampling.
+
+    Field values may be callables; they are only called when the record is emitted.
+    """
+
+    def __init__(self, name=None):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO))
+        self.sample_rates = _sample_rates()
+        self.redact_fields = {field.strip().lower() for field in os.environ.get('LOG_REDACT_FIELDS', DEFAULT_REDACT_FIELDS).split(',') if field.strip()}
+        self.max_field_chars = int(os.environ.get('LOG_MAX_FIELD_CHARS', 2000))
+        self.max_record_chars = int(os.environ.get('LOG_MAX_RECORD_CHARS', 8000))
+
+    def enabled(self, level):
+        """
+        Check the log level and sampling rate for a record of the given level.
+        """
+        if not self.logger.isEnabledFor(level):
+            return False
+        rate = self.sample_rates.get(level, 1)
+        return rate >= 1 or random.random() < rate
+
+    def redact(self, value):
+        if isinstance(value, dict):
+            return {key: REDACTED if str(key).lower() in self.redact_fields else self.redact(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.redact(item) for item in value]
+        return value
+
+    def cap(self, value):
+        """
+        Truncate a field to LOG_MAX_FIELD_CHARS, serializing nested values to measure them.
+        """
+        if isinstance(value, (dict, list, tuple)):
+            text = json.dumps(value, separators=(',', ':'), default=str)
+            if len(text) <= self.max_field_chars:
+                return value
+            value = text
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return f"{value[:self.max_field_chars]}...[{len(value) - self.max_field_chars} more chars]"
+        return value
+
+    def log(self, level, message, exc_info=False, **fields):
+        if not self.enabled(level):
+            return
+
+        record = {'level': logging.getLevelName(level), 'message': message}
+        for key, value in fields.items():
+            if key.lower() in self.redact_fields:
+                record[key] = REDACTED
+                continue
+            if callable(value):
+                value = value()
+            record[key] = self.cap(self.redact(value))
+        if exc_info:
+            record['exception'] = self.cap(traceback.format_exc())
+
+        line = json.dumps(record, separators=(',', ':'), default=str)
+        if len(line) > self.max_record_chars:
+            line = json.dumps({'level': record['level'], 'message': message, 'truncated_record': line[:self.max_record_chars]}, separators=(',', ':'))
+        self.logger.log(level, line)
+
+    def debug(self, message, **fields):
+        self.log(logging.DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self.log(logging.INFO, message, **fields)
+
+    def warning(self, message, **fields):
+        self.log(logging.WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self.log(logging.ERROR, message, **fields)
+
+class PhaseTimer:
+    """
+    Measure the duration of named phases of a request, reported as timing fields.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        phase_started_at = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + round((time.time() - phase_started_at) * 1000, 1)
+
+    def fields(self):
+        return {'phases_ms': dict(self.phases), 'total_ms': round((time.time() - self.started_at) * 1000, 1)}
+
+def get_logger(name=None):
+    return StructuredLogger(name)
@@ -1,4 +1,3 @@
-import boto3
 import json
 import os
 import uuid
@@ -7,9 +6,15 @@ import io
 import pandas as pd
 import awswrangler as wr
 import time
+import suppression
+from botocore.exceptions import BotoCoreError, ClientError
+from aws_clients import get_client, get_table
+from structured_logging import get_logger
 
-bedrock_runtime = boto3.client('bedrock-agent-runtime')
-s3 = boto3.client('s3')
+logger = get_logger()
+
+bedrock_runtime = get_client('bedrock-agent-runtime')
+s3 = get_client('s3')
 
 def lambda_handler(event, context):
 
@@ -19,9 +24,7 @@ def lambda_handler(event, context):
   start_datetime = (current_datetime - datetime.timedelta(hours=evaluation_period_hours)).strftime("%Y-%m-%dT%H:00:00.000")
   end_datetime = (current_datetime - datetime.timedelta(hours=1)).strftime("%Y-%m-%dT%H:59:00.000")
 
-  print("Current datetime", current_datetime)
-  print("Evaluation Start datetime: ", start_datetime)
-  print("Evaluation End datetime: ", end_datetime)
+  logger.info("Evaluating telemetry", current_datetime=current_datetime.isoformat(), start_datetime=start_datetime, end_datetime=end_datetime)
 
   s3Paths = []
 
@@ -30,13 +33,13 @@ def lambda_handler(event, context):
     previous_hour = current_datetime - datetime.timedelta(hours=(x+1))
     prefix = previous_hour.strftime("telemetry/processed-output/%Y/%m/%d/%H")
 
-    print("S3 prefix: ", prefix)
+    logger.debug("Listing telemetry files", prefix=prefix)
 
     #  Read all CSV files from S3
     response = s3.list_objects_v2(Bucket=telemetry_s3Bucket, Prefix=prefix)
 
     if 'Contents' not in response:
-        print("No files found in path {}/{}!".format(telemetry_s3Bucket, prefix))
+        logger.info("No telemetry files found", bucket=telemetry_s3Bucket, prefix=prefix)
         return {
             'statusCode': 200,
             'body': 'Success'
@@ -44,7 +47,7 @@ def lambda_handler(event, context):
 
     for obj in response['Contents']:
         if obj['Key'].endswith('.csv'):
-            print("Adding file to list of files to process: ", obj['Key'])
+            logger.debug("Adding telemetry file", key=obj['Key'])
             s3Paths.append("s3://" + telemetry_s3Bucket + "/" + obj['Key'])
   
   # Read CSV files into Pandas dataframe
@@ -54,7 +57,7 @@ def lambda_handler(event, context):
   is_all_null = telemetryData['error_code'].isnull().all()
 
   if is_all_null:
-    print("No errors and warnings found! Nothing to report!")
+    logger.info("No errors or warnings found, nothing to report")
     return {
         'statusCode': 200,
         'body': 'Success'
@@ -72,7 +75,7 @@ def lambda_handler(event, context):
   )
 
   if telemetryAnamoliesCountByDeviceAndWarning.empty:
-    print("No anomalies found! Nothing to report!")
+    logger.info("No anomalies found, nothing to report")
     return {
         'statusCode': 200,
         'body': 'Success'
@@ -82,13 +85,19 @@ def lambda_handler(event, context):
   agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID')
   anomaly_threshold = int(os.environ.get('TELEMETRY_ANOMALY_THRESHOLD'))
 
-  print("Anomaly threshold: ", anomaly_threshold)
+  logger.info("Checking anomalies", anomaly_threshold=anomaly_threshold)
+
+  # Suppression store for anomalies already reported by previous runs over the overlapping evaluation window
+  suppression_table_name = os.environ.get('ANOMALY_SUPPRESSION_TABLE')
+  suppression_table = get_table(suppression_table_name) if suppression_table_name else None
+  cooldown_seconds = int(os.environ.get('ANOMALY_SUPPRESSION_COOLDOWN_HOURS', 6)) * 3600
+  ttl_seconds = int(os.environ.get('ANOMALY_SUPPRESSION_TTL_HOURS', 24)) * 3600
+  escalation_rate_increase = float(os.environ.get('ANOMALY_ESCALATION_RATE_INCREASE', 20))
   
   for index, row in telemetryAnamoliesCountByDeviceAndWarning.iterrows():
 
     warning_rate = row['count']/telemetryDataCountByDevice[row['device_name']] * 100
-    print("Device: ", row['device_name'])
-    print("Warning rate: ", warning_rate)
+    logger.info("Warning rate", device_id=row['device_name'], error_code=row['error_code'], warning_rate=float(warning_rate))
 
     if warning_rate >= anomaly_threshold:
         anomalyEventJson = {
@@ -98,14 +107,30 @@ def lambda_handler(event, context):
             "start_end_datetime": start_datetime + "," + end_datetime
         }
     else:
-        print("Warning rate {} is less than anomaly threshold {} for device {} , skipping!".format(warning_rate, anomaly_threshold, row['device_name']))
+        logger.info("Warning rate below anomaly threshold, skipping", device_id=row['device_name'], warning_rate=float(warning_rate), anomaly_threshold=anomaly_threshold)
         continue
 
+    if suppression_table is not None:
+        now = time.time()
+        record = suppression.get_suppression_record(suppression_table, row['device_name'], row['error_code'], now)
+        should_report, reason = suppression.evaluate_suppression(record, warning_rate, now, cooldown_seconds, escalation_rate_increase)
+
+        if not should_report:
+            logger.info("Anomaly already reported, skipping", device_id=row['device_name'], error_code=row['error_code'], reason=reason)
+            suppression.record_suppressed(suppression_table, row['device_name'], row['error_code'], now, ttl_seconds)
+            continue
+
+        if not suppression.claim_report(suppression_table, row['device_name'], row['error_code'], record, warning_rate, now, ttl_seconds):
+            logger.info("Anomaly claimed by another run, skipping", device_id=row['device_name'], error_code=row['error_code'])
+            continue
+
+        logger.info("Reporting anomaly", device_id=row['device_name'], error_code=row['error_code'], reason=reason)
+
     anomalyEventPrompt = "Please take action based on the anomaly details: " + json.dumps(anomalyEventJson)
-    print(anomalyEventPrompt)
+    logger.debug("Anomaly prompt", prompt=anomalyEventPrompt)
 
     try:
-        print("Calling Bedrock agent to report anomalies!")
+        logger.info("Calling Bedrock agent to report anomaly", device_id=row['device_name'], error_code=row['error_code'])
         # Invoke Bedrock agent with details of every anomaly
         response = bedrock_runtime.invoke_agent(
             agentId=agent_id,
@@ -116,8 +141,11 @@ def lambda_handler(event, context):
 
         # Sleep for 5 seconds to avoid Bedrock agent API call throttling
         time.sleep(5)
-    except:
-        raise RuntimeError('Error calling Bedrock agent to report anomalies!')
+    except (BotoCoreError, ClientError):
+        logger.error("Error calling Bedrock agent", device_id=row['device_name'], error_code=row['error_code'], exc_info=True)
+        if suppression_table is not None:
+            suppression.release_report(suppression_table, row['device_name'], row['error_code'], record, now)
+        raise
 
   return {
       'statusCode': 200,
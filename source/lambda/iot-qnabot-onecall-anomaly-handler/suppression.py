@@ -0,0 +1,153 @@
+import time
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+# Suppression records are keyed by device and error code, e.g. "aircon_3#W1"
+KEY_SEPARATOR = "#"
+
+def suppression_key(device_id, error_code):
+    return f"{device_id}{KEY_SEPARATOR}{error_code}"
+
+def get_suppression_record(table, device_id, error_code, now=None):
+    """
+    Fetch the suppression record for a device/error pair.
+
+    Records past their expiry are treated as missing, since DynamoDB TTL
+    deletes expired items lazily.
+
+    :param table: DynamoDB Table resource (or a local stand-in with get_item)
+    :param device_id: Device name reported by the anomaly model
+    :param error_code: Warning/error code for the anomaly
+    :param now: Epoch seconds, defaults to the current time
+    :return: Record dictionary or None
+    """
+    now = time.time() if now is None else now
+    response = table.get_item(
+        Key={'suppression_key': suppression_key(device_id, error_code)},
+        ConsistentRead=True
+    )
+    record = response.get('Item')
+    if record is None or float(record.get('expires_at', 0)) <= now:
+        return None
+    return record
+
+def evaluate_suppression(record, warning_rate, now, cooldown_seconds, escalation_rate_increase):
+    """
+    Decide whether an anomaly must be reported to the Bedrock agent.
+
+    An anomaly is reported when it has not been seen before (or its record
+    expired), when the cooldown since the last report has elapsed, or when
+    its warning rate has escalated by at least escalation_rate_increase
+    percentage points since the last report.
+
+    :return: Tuple of (should_report, reason)
+    """
+    if record is None:
+        return True, "new anomaly"
+
+    last_reported_at = float(record.get('last_reported_at', 0))
+    if now - last_reported_at >= cooldown_seconds:
+        return True, "cooldown of {}s elapsed".format(cooldown_seconds)
+
+    last_reported_rate = float(record.get('last_reported_rate', 0))
+    if warning_rate - last_reported_rate >= escalation_rate_increase:
+        return True, "warning rate escalated from {:.1f} to {:.1f}".format(last_reported_rate, warning_rate)
+
+    return False, "reported {:.0f}s ago at warning rate {:.1f}".format(now - last_reported_at, last_reported_rate)
+
+def claim_report(table, device_id, error_code, record, warning_rate, now, ttl_seconds):
+    """
+    Record that an anomaly is being reported.
+
+    The write is conditional on the record not having changed since it was
+    read, so concurrent handler runs do not both report the same anomaly.
+    claimed_at marks the claim so a failed report can be released without
+    touching a later claim.
+
+    :return: True if this run owns the report, False if another run claimed it
+    """
+    report_count = int(record.get('report_count', 0)) if record else 0
+    try:
+        table.update_item(
+            Key={'suppression_key': suppression_key(device_id, error_code)},
+            UpdateExpression=(
+                "SET device_id = :device_id, error_code = :error_code, "
+                "last_reported_at = :now, last_reported_rate = :rate, last_seen_at = :now, "
+                "expires_at = :expires_at, report_count = :next_count, suppressed_count = :zero, claimed_at = :now"
+            ),
+            ConditionExpression="attribute_not_exists(report_count) OR report_count = :report_count OR expires_at <= :now",
+            ExpressionAttributeValues={
+                ':device_id': device_id,
+                ':error_code': error_code,
+                ':now': Decimal(str(now)),
+                ':rate': Decimal(str(round(warning_rate, 2))),
+                ':expires_at': int(now + ttl_seconds),
+                ':report_count': report_count,
+                ':next_count': report_count + 1,
+                ':zero': 0
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def release_report(table, device_id, error_code, record, claimed_at):
+    """
+    Undo a claim after a failed report so the next run retries it.
+
+    The last report and the suppressed count are restored from the record read
+    before the claim, the rest of the record is kept. Nothing is changed when
+    another run has claimed the record since.
+
+    :param record: Record returned by get_suppression_record before the claim, or None
+    :param claimed_at: The now passed to claim_report
+    :return: True if the claim was released
+    """
+    try:
+        table.update_item(
+            Key={'suppression_key': suppression_key(device_id, error_code)},
+            UpdateExpression=(
+                "SET last_reported_at = :previous_at, last_reported_rate = :previous_rate, "
+                "suppressed_count = suppressed_count + :previous_suppressed REMOVE claimed_at"
+            ),
+            ConditionExpression="claimed_at = :claimed_at",
+            ExpressionAttributeValues={
+                ':previous_at': record.get('last_reported_at', 0) if record else 0,
+                ':previous_rate': record.get('last_reported_rate', 0) if record else 0,
+                ':previous_suppressed': record.get('suppressed_count', 0) if record else 0,
+                ':claimed_at': Decimal(str(claimed_at))
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def record_suppressed(table, device_id, error_code, now, ttl_seconds):
+    """
+    Count a suppressed occurrence and extend the record's TTL while the anomaly persists.
+
+    The update is conditional on the record existing, so it never recreates a
+    record that expired or was removed since it was read.
+
+    :return: True if the occurrence was counted
+    """
+    try:
+        table.update_item(
+            Key={'suppression_key': suppression_key(device_id, error_code)},
+            UpdateExpression="SET last_seen_at = :now, expires_at = :expires_at ADD suppressed_count :one",
+            ConditionExpression="attribute_exists(suppression_key)",
+            ExpressionAttributeValues={
+                ':now': Decimal(str(now)),
+                ':expires_at': int(now + ttl_seconds),
+                ':one': 1
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
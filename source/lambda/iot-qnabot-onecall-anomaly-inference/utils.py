@@ -1,23 +1,25 @@
 import pandas as pd
 import json
 from datetime import datetime, timedelta
-import boto3
 import io
 from io import StringIO
 import csv
+from aws_clients import get_client
+from structured_logging import get_logger
+
+logger = get_logger()
 
 def get_files_from_previous_hour(bucket_name):
-    # Create an S3 client
-    s3 = boto3.client('s3')
+    # Get the shared S3 client
+    s3 = get_client('s3')
 
     # Get the current time and calculate the previous hour
     current_time = datetime.now()
     previous_hour = current_time - timedelta(hours=1)
-    print("previous hour : ", previous_hour)
     # Format the prefix
     prefix = previous_hour.strftime('telemetry/firehose-streaming-data/%Y/%m/%d/%H/')
 
-    print(f"Searching for files with prefix: {prefix}")
+    logger.info("Searching for files", previous_hour=previous_hour.isoformat(), prefix=prefix)
 
     # List objects in the bucket with the specified prefix
     paginator = s3.get_paginator('list_objects_v2')
@@ -34,7 +36,7 @@ def get_files_from_previous_hour(bucket_name):
     return file_list
 
 def create_dataframe_from_s3_files(bucket_name, file_list):
-    s3 = boto3.client('s3')
+    s3 = get_client('s3')
     all_data = []
 
     for file in file_list:
@@ -51,11 +53,10 @@ def create_dataframe_from_s3_files(bucket_name, file_list):
                         json_data['timestamp'] = datetime.utcnow().isoformat()
                         all_data.append(json_data)
                     except json.JSONDecodeError as e:
-                        print(f"Error parsing JSON in file {file}, line: {line}")
-                        print(f"Error details: {str(e)}")
+                        logger.warning("Error parsing JSON line", file=file, line=line, error=str(e))
 
         except Exception as e:
-            print(f"Error processing file {file}: {str(e)}")
+            logger.error("Error processing file", file=file, error=str(e), exc_info=True)
 
     # Create DataFrame from all collected data
     if all_data:
@@ -64,7 +65,7 @@ def create_dataframe_from_s3_files(bucket_name, file_list):
 
         return df
     else:
-        print("No valid data found in the files.")
+        logger.warning("No valid data found in the files", files=len(file_list))
         return None
 
 def send_dataframe_to_s3(df, bucket_name, prefix):
@@ -75,7 +76,7 @@ def send_dataframe_to_s3(df, bucket_name, prefix):
     :param bucket_name: Name of the S3 bucket
     :param prefix: S3 prefix (folder) to store the file
     """
-    s3 = boto3.client('s3')
+    s3 = get_client('s3')
     new_columns = ['timestamp', 'device_name', 'indoor_temperature_c',
        'outdoor_temperature_c', 'setpoint_temperature_c', 'mode',
        'power_consumption_watts', 'compressor_status', 'fan_speed_rpm',
@@ -106,11 +107,11 @@ def send_dataframe_to_s3(df, bucket_name, prefix):
         Body=csv_buffer.getvalue()
     )
     
-    print(f"DataFrame successfully sent to S3: s3://{bucket_name}/{s3_key}")
+    logger.info("DataFrame sent to S3", bucket=bucket_name, key=s3_key, rows=len(df))
     return s3_key
 
 def create_sagemaker_batch_inference_job(s3_bucket, input_s3_path, model_name):
-    sagemaker = boto3.client('sagemaker')
+    sagemaker = get_client('sagemaker')
     timestamp = datetime.now().strftime("%Y%m%d-%H")
     output_path = datetime.now().strftime("%Y/%m/%d/%H")
 
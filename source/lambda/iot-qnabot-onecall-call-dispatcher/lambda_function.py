@@ -0,0 +1,321 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import get_client, get_resource, get_table
+from structured_logging import get_logger
+
+logger = get_logger()
+
+# Lower value is called first; unknown error codes are called after all known ones
+CALL_PRIORITY = {'E3': 0, 'E2': 1, 'E1': 2, 'W1': 3}
+
+# Amazon Connect errors that mean the call can be placed later
+RETRYABLE_ERRORS = ('LimitExceededException', 'ThrottlingException', 'ServiceQuotaExceededException', 'InternalServiceException')
+
+def call_priority(error_code):
+    return CALL_PRIORITY.get(error_code, len(CALL_PRIORITY))
+
+# Items of the dedup table that hold a live call, one per allowed concurrent call
+ACTIVE_CALL_KEY_PREFIX = 'active#'
+
+# batch_get_item calls made for keys DynamoDB left unprocessed before the batch is failed
+SITE_LOOKUP_ATTEMPTS = 5
+
+def parse_call_requests(event):
+    """
+    Turn an SQS batch of queued calls into call requests with their queue metadata.
+
+    :return: List of call requests and list of the message ids of malformed messages
+    """
+    call_requests = []
+    malformed_message_ids = []
+    for record in event['Records']:
+        try:
+            call_request = json.loads(record['body'])
+            for field in ('unique_id', 'device_id', 'error_code', 'troubleshooting_steps'):
+                call_request[field]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Malformed call request", message_id=record['messageId'], error=repr(e))
+            malformed_message_ids.append(record['messageId'])
+            continue
+        call_request['message_id'] = record['messageId']
+        call_request['sent_timestamp'] = float(record['attributes']['SentTimestamp']) / 1000
+        call_requests.append(call_request)
+    return call_requests, malformed_message_ids
+
+def lookup_sites(device_ids):
+    """
+    Map device ids to their site owner from the device data table.
+
+    Keys DynamoDB returns as unprocessed are requested again with backoff. The batch fails when
+    they are still unprocessed after SITE_LOOKUP_ATTEMPTS, since calls without their site would
+    skip the per site dedup.
+    """
+    sites = {}
+    device_ids = list(set(device_ids))
+    dynamodb = get_resource('dynamodb')
+    table_name = os.environ.get('DEVICE_DATA_TABLE', 'iot-qnabot-onecall-device-data')
+    for start in range(0, len(device_ids), 100):
+        request_items = {
+            table_name: {
+                'Keys': [{'deviceid': device_id} for device_id in device_ids[start:start + 100]],
+                'ProjectionExpression': 'deviceid, siteowner'
+            }
+        }
+        for attempt in range(SITE_LOOKUP_ATTEMPTS):
+            if attempt:
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response['Responses'].get(table_name, []):
+                sites[item['deviceid']] = item.get('siteowner')
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(f"Device sites still unprocessed after {SITE_LOOKUP_ATTEMPTS} attempts: {len(request_items[table_name]['Keys'])} devices")
+    return sites
+
+def schedule_calls(call_requests, sites):
+    """
+    Order call requests by priority and drop duplicates within the batch.
+
+    Only the highest priority (then oldest) request per device and per site is kept. Each
+    duplicate records the message id of the request kept in its place under superseded_by.
+
+    :return: Tuple of (calls to place, duplicate requests)
+    """
+    ordered = sorted(call_requests, key=lambda request: (call_priority(request['error_code']), request['sent_timestamp']))
+    scheduled, duplicates = [], []
+    seen_devices, seen_sites = {}, {}
+    for request in ordered:
+        site = sites.get(request['device_id'])
+        kept = seen_devices.get(request['device_id']) or (seen_sites.get(site) if site else None)
+        if kept is not None:
+            request['superseded_by'] = kept['message_id']
+            duplicates.append(request)
+            continue
+        seen_devices[request['device_id']] = request
+        if site:
+            seen_sites[site] = request
+        request['site'] = site
+        scheduled.append(request)
+    return scheduled, duplicates
+
+def dedup_keys(request):
+    keys = [f"device#{request['device_id']}"]
+    if request.get('site'):
+        keys.append(f"site#{request['site']}")
+    return keys
+
+def claim_call(table, request, window_seconds, now):
+    """
+    Claim the device and site for this call across dispatcher runs.
+
+    A call with a higher priority error code than the one already placed, e.g. an E3 after a W1
+    call to the same site, takes over the claim instead of waiting for the window to end.
+
+    :return: List of (key, replaced item or None) claims to pass to release_call, or None when a call
+        of the same or higher priority was placed for the device or site within the dedup window
+    """
+    claimed = []
+    for key in dedup_keys(request):
+        try:
+            response = table.put_item(
+                Item={
+                    'dedup_key': key,
+                    'unique_id': request['unique_id'],
+                    'error_code': request['error_code'],
+                    'priority': call_priority(request['error_code']),
+                    'expires_at': int(now + window_seconds)
+                },
+                ConditionExpression='attribute_not_exists(dedup_key) OR expires_at <= :now OR priority > :priority',
+                ExpressionAttributeValues={':now': int(now), ':priority': call_priority(request['error_code'])},
+                ReturnValues='ALL_OLD'
+            )
+            claimed.append((key, response.get('Attributes')))
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            release_call(table, request, claimed)
+            return None
+    return claimed
+
+def release_call(table, request, claims):
+    """
+    Undo the claims of a call that was not placed.
+
+    A claim taken over from a lower priority call is handed back to that call, which was placed.
+    Claims another run has taken since are left alone.
+    """
+    for key, replaced in claims:
+        try:
+            if replaced:
+                table.put_item(Item=replaced, ConditionExpression='unique_id = :unique_id', ExpressionAttributeValues={':unique_id': request['unique_id']})
+            else:
+                table.delete_item(Key={'dedup_key': key}, ConditionExpression='unique_id = :unique_id', ExpressionAttributeValues={':unique_id': request['unique_id']})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+def acquire_call_slot(table, max_active_calls, max_call_seconds, now):
+    """
+    Take one of the max_active_calls slots for a live call.
+
+    A slot is freed by release_contact when Amazon Connect reports the contact disconnected,
+    or expires after max_call_seconds in case that event is lost.
+
+    :return: Slot key and claim token, or (None, None) when every slot holds a live call
+    """
+    token = str(uuid.uuid4())
+    for slot in range(max_active_calls):
+        key = f"{ACTIVE_CALL_KEY_PREFIX}{slot}"
+        try:
+            table.put_item(
+                Item={'dedup_key': key, 'claim_token': token, 'expires_at': int(now + max_call_seconds)},
+                ConditionExpression='attribute_not_exists(dedup_key) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': int(now)}
+            )
+            return key, token
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    return None, None
+
+def assign_call_slot(table, key, token, contact_id):
+    table.update_item(
+        Key={'dedup_key': key},
+        UpdateExpression='SET contact_id = :contact_id',
+        ConditionExpression='claim_token = :token',
+        ExpressionAttributeValues={':contact_id': contact_id, ':token': token}
+    )
+
+def release_call_slot(table, key, condition, values):
+    try:
+        table.delete_item(Key={'dedup_key': key}, ConditionExpression=condition, ExpressionAttributeValues=values)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def release_contact(table, contact_id, max_active_calls):
+    """
+    Free the slot of a contact that ended.
+    """
+    for slot in range(max_active_calls):
+        if release_call_slot(table, f"{ACTIVE_CALL_KEY_PREFIX}{slot}", 'contact_id = :contact_id', {':contact_id': contact_id}):
+            return True
+    return False
+
+def place_call(connect, request):
+    """
+    Start the outbound call, the phone numbers are logged as fields so they are redacted.
+
+    :return: Amazon Connect contact id
+    """
+    params = {
+        'ContactFlowId': os.environ.get('CONTACT_FLOW_ID'),
+        'DestinationPhoneNumber': os.environ.get('DESTINATION_PHONE_NO'),
+        'InstanceId': os.environ.get('INSTANCE_ID'),
+        'SourcePhoneNumber': os.environ.get('SOURCE_PHONE_NO'),
+        'TrafficType': 'GENERAL',
+        'Attributes': {
+            'UniqueID' : request['unique_id'],
+            'deviceID' : request['device_id'],
+            'errorCode' : request['error_code'],
+            'troubleshootingSteps' : request['troubleshooting_steps'],
+            'recipientEmail' : os.environ.get('RECIPIENT_EMAIL_ID')
+        }
+    }
+    logger.debug("Placing outbound call", destinationPhoneNumber=params['DestinationPhoneNumber'], sourcePhoneNumber=params['SourcePhoneNumber'], attributes=params['Attributes'])
+    return connect.start_outbound_voice_contact(**params)['ContactId']
+
+def dispatch_calls(connect, table, scheduled, max_active_calls, window_seconds, max_call_seconds):
+    """
+    Place the scheduled calls in priority order with at most max_active_calls live calls.
+
+    :return: List of message ids to retry because every call slot was busy or Amazon Connect limits were hit
+    """
+    def dispatch(request):
+        started_at = time.time()
+        claims, slot, token = [], None, None
+        if table is not None:
+            claims = claim_call(table, request, window_seconds, started_at)
+            if claims is None:
+                return request, 'duplicate', None
+            slot, token = acquire_call_slot(table, max_active_calls, max_call_seconds, started_at)
+            if slot is None:
+                release_call(table, request, claims)
+                return request, 'busy', None
+        try:
+            contact_id = place_call(connect, request)
+        except ClientError as e:
+            if table is not None:
+                release_call_slot(table, slot, 'claim_token = :token', {':token': token})
+                release_call(table, request, claims)
+            if e.response['Error']['Code'] in RETRYABLE_ERRORS:
+                return request, 'retry', time.time() - started_at
+            # Retrying cannot fix the request, drop it instead of failing the batch
+            logger.error("Dropping call rejected by Amazon Connect", device_id=request['device_id'], error_code=request['error_code'], error=str(e))
+            return request, 'failed', time.time() - started_at
+        if slot is not None:
+            # Bind the slot to the contact, so the contact's DISCONNECTED event frees it
+            assign_call_slot(table, slot, token, contact_id)
+        return request, 'placed', time.time() - started_at
+
+    retry_message_ids = []
+    with ThreadPoolExecutor(max_workers=max_active_calls) as executor:
+        for request, status, placement_latency in executor.map(dispatch, scheduled):
+            logger.info(
+                "Outbound call dispatched",
+                metric='outbound_call',
+                unique_id=request['unique_id'],
+                device_id=request['device_id'],
+                error_code=request['error_code'],
+                status=status,
+                queue_wait_seconds=round(request['dispatched_at'] - request['sent_timestamp'], 3),
+                placement_latency_seconds=round(placement_latency, 3) if placement_latency is not None else None
+            )
+            if status in ('retry', 'busy'):
+                retry_message_ids.append(request['message_id'])
+    return retry_message_ids
+
+def lambda_handler(event, context):
+    logger.debug("Received event", event=event)
+
+    dedup_table_name = os.environ.get('CALL_DEDUP_TABLE')
+    table = get_table(dedup_table_name) if dedup_table_name else None
+    window_seconds = int(os.environ.get('CALL_DEDUP_WINDOW_MINUTES', 30)) * 60
+    max_active_calls = int(os.environ.get('CALL_MAX_ACTIVE_CALLS', 2))
+    max_call_seconds = int(os.environ.get('CALL_MAX_DURATION_MINUTES', 30)) * 60
+
+    # Amazon Connect contact events free the call slot of a contact that ended
+    if event.get('source') == 'aws.connect':
+        contact_id = event['detail']['contactId']
+        released = table is not None and release_contact(table, contact_id, max_active_calls)
+        logger.info("Contact ended", contact_id=contact_id, event_type=event['detail'].get('eventType'), slot_released=released)
+        return {'released': released}
+
+    call_requests, malformed_message_ids = parse_call_requests(event)
+    sites = lookup_sites([request['device_id'] for request in call_requests])
+    scheduled, duplicates = schedule_calls(call_requests, sites)
+
+    dispatched_at = time.time()
+    for request in scheduled:
+        request['dispatched_at'] = dispatched_at
+    for request in duplicates:
+        logger.info("Skipping duplicate call", device_id=request['device_id'], error_code=request['error_code'], superseded_by=request['superseded_by'])
+
+    retry_message_ids = dispatch_calls(get_client('connect'), table, scheduled, max_active_calls, window_seconds, max_call_seconds)
+    # A duplicate is only settled by a call placed (or deduplicated) in its place, retry it with its kept request
+    retried = set(retry_message_ids)
+    retry_message_ids += [request['message_id'] for request in duplicates if request['superseded_by'] in retried]
+
+    logger.info("Call requests dispatched", dispatched=len(scheduled), call_requests=len(call_requests), retries=len(retry_message_ids), malformed=len(malformed_message_ids))
+
+    # Report only calls waiting for a free call slot or rejected by Amazon Connect limits, so SQS redelivers them
+    # after the visibility timeout. Malformed messages are reported too and end up in the dead-letter queue.
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in retry_message_ids + malformed_message_ids]}
@@ -1,22 +1,28 @@
 import json
+import os
 import pandas as pd
-import boto3
 import io
 import numpy as np
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from aws_clients import get_client
+from structured_logging import get_logger
 
-s3 = boto3.client('s3')
+logger = get_logger()
+
+s3 = get_client('s3')
 
 def lambda_handler(event, context):
 
-    print("event : ", event)
+    logger.debug("Received event", event=event)
 
     bucket = event['Records'][0]['s3']['bucket']['name']
     key = event['Records'][0]['s3']['object']['key']
 
     # Check if the file has the correct extension
     if not key.endswith('.csv.out'):
-        print(f"Skipping file {key} as it doesn't have the .csv.out extension")
+        logger.info("Skipping file without the .csv.out extension", key=key)
         return
     
     try:
@@ -30,17 +36,30 @@ def lambda_handler(event, context):
         # Perform preprocessing
         df = preprocess_data(df)
         
+        # Sort rows by device, so a device's rows are contiguous and lookups can skip whole blocks of the file
+        df = df.sort_values('device_name', kind='stable')
+
         # Save the preprocessed data back to S3
         csv_buffer = io.StringIO()
         df.to_csv(csv_buffer, index=False)
+        body = csv_buffer.getvalue().encode('utf-8')
 
         timestamp = datetime.now().strftime("%Y/%m/%d/%H")
-        s3.put_object(Bucket=bucket, Key=f"telemetry/processed-output/{timestamp}/inference_output.csv", Body=csv_buffer.getvalue())
+        output_key = f"telemetry/processed-output/{timestamp}/inference_output.csv"
+        s3.put_object(Bucket=bucket, Key=output_key, Body=body)
+
+        # Write the block index next to the file, used to read only the byte ranges holding a device's rows
+        offsets = line_offsets(body)
+        block_rows = int(os.environ.get('BLOCK_INDEX_ROWS', 1000))
+        s3.put_object(Bucket=bucket, Key=f"{output_key}.idx.json", Body=json.dumps(build_block_index(df, offsets, block_rows)))
+
+        # Write the device index for the same hour, used by the agent's telemetry lookups
+        write_device_index(df, offsets, bucket, output_key, timestamp)
         
-        print(f"Successfully preprocessed and saved {key}")
+        logger.info("Preprocessed inference output", key=key, output_key=output_key, rows=len(df))
     
     except Exception as e:
-        print(f"Error processing {key}: {str(e)}")
+        logger.error("Error processing inference output", key=key, error=str(e), exc_info=True)
         raise
     return {
         'statusCode': 200,
@@ -48,14 +67,100 @@ def lambda_handler(event, context):
     }
 
 
+def line_offsets(body):
+    """
+    Byte offset where each line of a CSV file starts, the header being line 0.
+    """
+    offsets = [0]
+    position = body.find(b'\n')
+    while position != -1:
+        offsets.append(position + 1)
+        position = body.find(b'\n', position + 1)
+    return offsets
+
+def build_block_index(df, offsets, block_rows):
+    """
+    Build the block index of a CSV file sorted by device_name.
+
+    Every block covers up to block_rows consecutive rows and records their byte range
+    in the file along with the first and last device name, like row group statistics.
+    """
+    device_names = df['device_name'].astype(str).tolist()
+    blocks = []
+    for first_row in range(0, len(device_names), block_rows):
+        last_row = min(first_row + block_rows, len(device_names)) - 1
+        blocks.append({
+            'start': offsets[first_row + 1],
+            'end': offsets[last_row + 2] - 1,
+            'rows': last_row - first_row + 1,
+            'min_device': device_names[first_row],
+            'max_device': device_names[last_row]
+        })
+
+    return {
+        'sorted_by': 'device_name',
+        'columns': list(df.columns),
+        'blocks': blocks
+    }
+
+def device_index_shard(device_name, shards):
+    # Must match device_index_shard in the user query function, which reads the shards
+    return zlib.crc32(device_name.encode('utf-8')) % shards
+
+def device_byte_ranges(df, offsets):
+    """
+    Byte range of each device's rows in a CSV file sorted by device_name.
+    """
+    device_names = df['device_name'].astype(str).tolist()
+    ranges = {}
+    first_row = 0
+    for row, device_name in enumerate(device_names):
+        if row + 1 == len(device_names) or device_names[row + 1] != device_name:
+            ranges[device_name] = [offsets[first_row + 1], offsets[row + 2] - 1]
+            first_row = row + 1
+    return ranges
+
+def write_device_index(df, offsets, bucket, output_key, timestamp):
+    """
+    Write the device index of the hour's processed output to telemetry/device-index/{timestamp}/.
+
+    Devices are spread over DEVICE_INDEX_SHARDS shard objects mapping each device name to the
+    byte range of its rows in the processed output, so the index costs a fixed number of PUTs
+    however many devices report. A manifest written last names the processed output and the
+    shard count, and tells lookups a device missing from its shard had no rows that hour.
+    """
+    shards = int(os.environ.get('DEVICE_INDEX_SHARDS', 16))
+    shard_ranges = [{} for _ in range(shards)]
+    for device_name, byte_range in device_byte_ranges(df, offsets).items():
+        shard_ranges[device_index_shard(device_name, shards)][device_name] = byte_range
+
+    def put_shard(shard):
+        s3.put_object(
+            Bucket=bucket,
+            Key=f"telemetry/device-index/{timestamp}/{shard:03d}.json",
+            Body=json.dumps(shard_ranges[shard], separators=(',', ':'))
+        )
+
+    max_concurrency = int(os.environ.get('DEVICE_INDEX_WRITE_CONCURRENCY', 16))
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        list(executor.map(put_shard, range(shards)))
+
+    devices = sum(len(ranges) for ranges in shard_ranges)
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"telemetry/device-index/{timestamp}/_manifest.json",
+        Body=json.dumps({'key': output_key, 'shards': shards, 'devices': devices, 'rows': len(df)})
+    )
+    logger.info("Indexed devices", rows=len(df), devices=devices, shards=shards)
+
 def preprocess_data(df):
     df = df.iloc[:, :-3]
-    print("columns : " , df.columns)
+    logger.debug("Inference output columns", columns=list(df.columns))
 
     if 'normal' in df.columns:
         df = df.rename(columns={'normal': 'anomaly'})
     else:
-        print("Column 'normal' not found in the DataFrame")
+        logger.warning("Column 'normal' not found in the DataFrame", columns=list(df.columns))
 
     # Add W1 for the anomaly rows :
     df['error_code'] = np.where(
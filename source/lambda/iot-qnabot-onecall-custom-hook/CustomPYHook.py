@@ -1,50 +1,163 @@
-import traceback
-import boto3
-import json
-import logging
+import math
 import time
 import os
-from botocore.exceptions import ClientError
+import queue
+import re
+import threading
+from collections import OrderedDict
+from botocore.exceptions import ClientError, ReadTimeoutError
+from urllib3.exceptions import ProtocolError, ReadTimeoutError as StreamReadTimeoutError
+from aws_clients import get_client
+from structured_logging import PhaseTimer, get_logger
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# Full events are only serialized at LOG_LEVEL=DEBUG, see structured_logging for sampling, redaction and size caps
+logger = get_logger()
 
 #Environment Variables
 AGENT_ID = os.environ['AGENT_ID']
 AGENT_ALIAS_ID = os.environ['AGENT_ALIAS_ID']
 #DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
+DEVICE_DATA_TABLE = os.environ.get('DEVICE_DATA_TABLE', 'iot-qnabot-onecall-device-data')
+# Seconds kept back from the Lambda timeout to return a partial agent answer
+AGENT_DEADLINE_MARGIN_SECONDS = float(os.environ.get('AGENT_DEADLINE_MARGIN_SECONDS', 2))
+# Longest silence tolerated on the agent stream socket, the response deadline is enforced separately
+AGENT_READ_TIMEOUT_SECONDS = float(os.environ.get('AGENT_READ_TIMEOUT_SECONDS', 30))
+# Errors of a stream that stalled or was closed while it was read
+STREAM_ERRORS = (ReadTimeoutError, StreamReadTimeoutError, ProtocolError)
+PARTIAL_RESPONSE_NOTE = "\n\n_This answer was cut short because the agent took too long. Please ask again for the complete answer._"
+TIMEOUT_RESPONSE = "_The agent took too long to answer. Please ask again._"
+
+class TTLCache:
+    """
+    In-process LRU cache with a time to live per entry.
+
+    A None value records that the key is known not to exist (negative caching) and
+    expires after the shorter negative time to live.
+    The cache lives as long as the Lambda execution environment.
+    """
+    MISSING = object()
+
+    def __init__(self, max_entries, ttl_seconds, negative_ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.entries = OrderedDict()
+        self.counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'latency_saved_ms': 0}
+
+    def get(self, device_id):
+        """
+        Return the cached value, None for a key cached as missing, or TTLCache.MISSING.
+        """
+        entry = self.entries.get(device_id)
+        if entry is None or entry[1] <= time.time():
+            self.entries.pop(device_id, None)
+            self.counters['misses'] += 1
+            return TTLCache.MISSING
+
+        self.entries.move_to_end(device_id)
+        self.counters['hits' if entry[0] is not None else 'negative_hits'] += 1
+        return entry[0]
+
+    def put(self, device_id, device_data):
+        ttl_seconds = self.ttl_seconds if device_data is not None else self.negative_ttl_seconds
+        self.entries[device_id] = (device_data, time.time() + ttl_seconds)
+        self.entries.move_to_end(device_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['negative_hits'] + self.counters['misses']
+        hit_rate = (self.counters['hits'] + self.counters['negative_hits']) / lookups if lookups else 0
+        return dict(self.counters, entries=len(self.entries), hit_rate=round(hit_rate, 3))
+
+# Device addresses and site owner contacts rarely change, unknown devices are cached for a shorter time
+device_cache = TTLCache(
+    max_entries=int(os.environ.get('DEVICE_CACHE_MAX_ENTRIES', 1000)),
+    ttl_seconds=int(os.environ.get('DEVICE_CACHE_TTL_SECONDS', 900)),
+    negative_ttl_seconds=int(os.environ.get('DEVICE_CACHE_NEGATIVE_TTL_SECONDS', 60))
+)
+device_cache_warmed = False
+
+# Agent answers to anomaly questions, keyed by device, its latest ticket and the normalized question
+anomaly_response_cache = TTLCache(
+    max_entries=int(os.environ.get('ANOMALY_CACHE_MAX_ENTRIES', 200)),
+    ttl_seconds=int(os.environ.get('ANOMALY_CACHE_TTL_SECONDS', 300)),
+    negative_ttl_seconds=0
+)
+DEVICE_ID_PATTERN = re.compile(r'\b[a-z]+_\d+\b')
+QUESTION_STOPWORDS = {'a', 'an', 'the', 'is', 'are', 'was', 'with', 'for', 'of', 'on', 'to', 'me', 'please', 'can', 'you', 'tell', 'what', 'whats', 'show', 'give', 'about'}
+
+def convert_device_item(item):
+    # Convert DynamoDB AttributeValue to standard dictionary
+    return {
+        key: value['S'] 
+        for key, value in item.items() 
+        if 'S' in value
+    }
+
+def warm_device_cache():
+    """
+    Load the whole device table into the cache, once per execution environment.
+
+    Enabled with DEVICE_CACHE_WARM_UP=true. Loading stops when the cache is full.
+    """
+    global device_cache_warmed
+    if device_cache_warmed or os.environ.get('DEVICE_CACHE_WARM_UP', 'false').lower() != 'true':
+        return
+    device_cache_warmed = True
+
+    try:
+        dynamodb = get_client('dynamodb')
+        scan_kwargs = {'TableName': DEVICE_DATA_TABLE}
+        loaded = 0
+        while loaded < device_cache.max_entries:
+            response = dynamodb.scan(**scan_kwargs)
+            for item in response.get('Items', [])[:device_cache.max_entries - loaded]:
+                device_cache.put(item['deviceid']['S'], convert_device_item(item))
+                loaded += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        logger.info("Device cache warmed", devices=len(device_cache.entries))
+    except ClientError as e:
+        logger.error("Device cache warm-up failed", error=e.response['Error']['Message'])
 
 def query_device_data(device_type):
+    warm_device_cache()
+
+    cached = device_cache.get(device_type)
+    if cached is not TTLCache.MISSING:
+        logger.info("Device cache hit", device_id=device_type, cache=device_cache.stats())
+        return cached
+
     try:
-        dynamodb = boto3.client('dynamodb')
+        dynamodb = get_client('dynamodb')
         
         response = dynamodb.get_item(
-            TableName='iot-qnabot-onecall-device-data',
+            TableName=DEVICE_DATA_TABLE,
             Key={'deviceid': {'S': device_type}},
             ConsistentRead=False
         )
         
         # Check if item exists
         if 'Item' not in response:
-            logger.info(f"No device found with ID: {device_type}")
+            logger.info("No device found", device_id=device_type)
+            device_cache.put(device_type, None)
             return None
         
-        # Convert DynamoDB AttributeValue to standard dictionary
-        item = response['Item']
-        converted_data = {
-            key: value['S'] 
-            for key, value in item.items() 
-            if 'S' in value
-        }
+        converted_data = convert_device_item(response['Item'])
+        device_cache.put(device_type, converted_data)
         
-        logger.info(f"Device data retrieved: {json.dumps(converted_data, indent=2)}")
+        logger.debug("Device data retrieved", device_data=converted_data)
+        logger.info("Device cache miss", device_id=device_type, cache=device_cache.stats())
         return converted_data
     
     except ClientError as e:
-        logger.error(f"DynamoDB error: {e.response['Error']['Message']}")
+        logger.error("DynamoDB error", error=e.response['Error']['Message'])
         return None
     except Exception as e:
-        logger.error(f"Unexpected error querying device data: {str(e)}")
+        logger.error("Unexpected error querying device data", error=str(e))
         return None
 
 def handle_device_info(event):
@@ -74,7 +187,7 @@ def handle_device_info(event):
         # Handle case where no data is found
         if not device_data:
             event['res']['message'] = f"No data found for device {device_type}"
-            logger.info(f"event {json.dumps(event,indent=2)}")
+            logger.debug("Device info response", event=event)
             return event
         
         # Format response with device details
@@ -89,18 +202,22 @@ def handle_device_info(event):
         
         event['res']['message'] = message
         event['res']['session']['appContext']['altMessages']['markdown'] = message
-        logger.info(f"{json.dumps(event,indent=2)}")
+        logger.debug("Device info response", event=event)
         return event
         
     except ValueError as ve:
-        logger.error(f"Validation error: {str(ve)}")
+        logger.error("Validation error", error=str(ve))
         event['res']['message'] = str(ve)
         return event
     except Exception as e:
-        logger.error(f"Error processing device info: {str(e)}", exc_info=True)
+        logger.error("Error processing device info", error=str(e), exc_info=True)
         event['res']['message'] = "An error occurred while processing your request"
         return event
 
+# Patterns used by format_to_markdown, compiled once per execution environment
+QUOTED_TEXT_PATTERN = re.compile(r'"([^"]+)"')
+LINK_PATTERN = re.compile(r'(https?://[^\s]+)')
+
 def format_to_markdown(text):
     """
     Convert a plain text string into Markdown format based on basic syntax rules.
@@ -111,12 +228,11 @@ def format_to_markdown(text):
     Returns:
         str: The text formatted in Markdown.
     """
-    # Split the text into lines for processing
-    lines = text.strip().split('\n')
     markdown_lines = []
     in_list = False  # Track if we're in a list
     
-    for line in lines:
+    # Classify and render each line in a single scan
+    for line in text.strip().split('\n'):
         line = line.strip()
         if not line:
             # Preserve empty lines as paragraph breaks
@@ -126,33 +242,29 @@ def format_to_markdown(text):
 
         # Detect headers (assuming lines starting with 'Header:' or all caps are headers)
         if line.startswith('Header:') or line.isupper():
-            header_text = line.replace('Header:', '').strip()
-            markdown_lines.append(f'## {header_text}')
+            markdown_lines.append(f"## {line.replace('Header:', '').strip()}")
             in_list = False
             continue
 
         # Detect lists (lines starting with '-', '*', or numbers like '1.')
-        if line.startswith(('-', '*')) or (line.split('.')[0].isdigit() and line.split('.')[1].strip()):
-            if line.startswith(('-', '*')):
-                # Unordered list
-                markdown_lines.append(f'- {line[1:].strip()}')
-                in_list = True
-            else:
-                # Ordered list
-                num, content = line.split('.', 1)
-                markdown_lines.append(f'{num.strip()}. {content.strip()}')
-                in_list = True
+        if line[0] in '-*':
+            # Unordered list
+            markdown_lines.append(f'- {line[1:].strip()}')
+            in_list = True
             continue
 
-        # Detect bold/italic (e.g., words surrounded by * or ** in the original text)
-        import re
-        line = re.sub(r'\*\*(.+?)\*\*', r'**\1**', line)  # Preserve existing bold
-        line = re.sub(r'\*(.+?)\*', r'*\1*', line)        # Preserve existing italic
-        # Simple heuristic: capitalize words in quotes as bold
-        line = re.sub(r'"([^"]+)"', r'**\1**', line)
+        num, separator, content = line.partition('.')
+        if separator and num.isdigit() and content.split('.', 1)[0].strip():
+            # Ordered list
+            markdown_lines.append(f'{num.strip()}. {content.strip()}')
+            in_list = True
+            continue
 
-        # Detect links (e.g., text with http:// or https://)
-        line = re.sub(r'(https?://[^\s]+)', r'[\1](\1)', line)
+        # Quoted text becomes bold and URLs become links; existing bold, italic and inline code are kept as is
+        if '"' in line:
+            line = QUOTED_TEXT_PATTERN.sub(r'**\1**', line)
+        if 'http' in line:
+            line = LINK_PATTERN.sub(r'[\1](\1)', line)
 
         # Detect code (e.g., text in backticks or prefixed with 'Code:')
         if line.startswith('Code:'):
@@ -161,37 +273,94 @@ def format_to_markdown(text):
             in_list = False
         elif '`' in line:
             # Inline code
-            line = re.sub(r'`([^`]+)`', r'`\1`', line)
             markdown_lines.append(line)
             in_list = False
+        elif in_list:
+            markdown_lines.append(f'  {line}')  # Indent as list continuation
         else:
-            # Regular paragraph or continuation of list
-            if in_list:
-                markdown_lines.append(f'  {line}')  # Indent as list continuation
-            else:
-                markdown_lines.append(line)
+            # Regular paragraph
+            markdown_lines.append(line)
 
     # Join lines with proper Markdown spacing
     return '\n\n'.join(markdown_lines)
 
-def handle_iot_anomaly(event, context, logger):
+def normalize_question(text):
+    """
+    Lowercase the question, drop punctuation and filler words, so rephrasings share a cache entry.
+    """
+    words = re.findall(r'[a-z0-9_-]+', text.lower().replace("'", ''))
+    return ' '.join(word for word in words if word not in QUESTION_STOPWORDS)
+
+def latest_ticket_id(device_id):
+    """
+    Return the unique id of the device's most recent ticket, or None if it has no tickets.
+    """
+    dynamodb = get_client('dynamodb')
+    response = dynamodb.query(
+        TableName=os.environ.get('TICKET_TABLE', 'iot-qnabot-onecall-device-error'),
+        IndexName='DeviceTimeIndex',
+        KeyConditionExpression='device_id = :device_id',
+        ExpressionAttributeValues={':device_id': {'S': device_id}},
+        ProjectionExpression='unique_id',
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0]['unique_id']['S'] if items else None
+
+def anomaly_cache_key(event, input_transcript):
+    """
+    Build the response cache key for an anomaly question, or None if it should not be cached.
+
+    The key includes the device's latest ticket, so logging a new ticket invalidates earlier answers.
+    """
+    if anomaly_response_cache.ttl_seconds <= 0:
+        return None
+
+    device_id = event.get('req', {}).get('slots', {}).get('DeviceType', '')
+    if not device_id:
+        match = DEVICE_ID_PATTERN.search(input_transcript.lower())
+        device_id = match.group(0) if match else ''
+    if not device_id:
+        return None
+
+    try:
+        ticket_id = latest_ticket_id(device_id)
+    except ClientError as e:
+        logger.warning("Skipping anomaly response cache, ticket lookup failed", error=e.response['Error']['Message'])
+        return None
+
+    return (device_id, ticket_id or 'no-ticket', normalize_question(input_transcript))
+
+def handle_iot_anomaly(event, context, logger, timer=None):
     """
     Handle IOT.Anomaly events by invoking Bedrock agent and processing the response.
     
     Args:
         event (dict): The event object containing request details
         context (object): Lambda context object
-        logger (Logger): Logger instance for logging
+        logger (StructuredLogger): Logger instance for logging
+        timer (PhaseTimer): Timer recording the cache lookup and agent phases
     
     Returns:
         dict: Modified event object with response message
     """
     logger.info("Processing IOT.Anomaly event")
+    timer = timer or PhaseTimer()
     
     try:
-        # Initialize Bedrock agent client
-        bedrock_agent = boto3.client('bedrock-agent-runtime')
-        logger.debug("Bedrock agent client initialized")
+        # Stop reading the agent response in time to return a partial answer before the Lambda times out
+        deadline_seconds = context.get_remaining_time_in_millis() / 1000 - AGENT_DEADLINE_MARGIN_SECONDS
+        if 'AGENT_RESPONSE_DEADLINE_SECONDS' in os.environ:
+            deadline_seconds = min(deadline_seconds, float(os.environ['AGENT_RESPONSE_DEADLINE_SECONDS']))
+        started_at = time.time()
+        deadline = started_at + deadline_seconds
+
+        # Get the cached Bedrock agent client. The read timeout also bounds the wait for the agent to start
+        # answering, so it is kept below the deadline and a timed out call is not retried. Whole seconds
+        # keep the number of cached clients small.
+        read_timeout = max(1, min(AGENT_READ_TIMEOUT_SECONDS, math.floor(deadline_seconds)))
+        bedrock_agent = get_client('bedrock-agent-runtime', read_timeout=read_timeout, retries={'mode': 'standard', 'max_attempts': 1})
         
         # Extract input transcript and session ID from event
         input_transcript = (event.get('req', {})
@@ -202,6 +371,18 @@ def handle_iot_anomaly(event, context, logger):
             .get('_event', {})
             .get('sessionId', ''))
 
+        # Answer repeated questions about a device from the cache, until a new ticket is logged for it
+        with timer.phase('cache_lookup'):
+            cache_key = anomaly_cache_key(event, input_transcript)
+            cached = anomaly_response_cache.get(cache_key) if cache_key is not None else TTLCache.MISSING
+        if cached is not TTLCache.MISSING:
+            latency_saved_ms = max(cached['latency_ms'] - round((time.time() - started_at) * 1000), 0)
+            anomaly_response_cache.counters['latency_saved_ms'] += latency_saved_ms
+            logger.info("Anomaly response cache hit", device_id=cache_key[0], cache=anomaly_response_cache.stats())
+            event['res']['message'] = cached['response']
+            event['res']['session']['appContext']['altMessages']['markdown'] = cached['response']
+            return event
+
         # Prepare request parameters
         request_parameters = {
             'agentId': AGENT_ID,
@@ -209,64 +390,138 @@ def handle_iot_anomaly(event, context, logger):
             'sessionId': session_id,
             'inputText': input_transcript
         }
-        logger.info(f"Request parameters prepared: {json.dumps(request_parameters, indent=2)}")
+        if os.environ.get('AGENT_STREAM_FINAL_RESPONSE', 'false').lower() == 'true':
+            # Have the agent stream its final response in chunks as it is generated
+            request_parameters['streamingConfigurations'] = {'streamFinalResponse': True}
+        logger.debug("Request parameters prepared", request_parameters=request_parameters)
         
         # Invoke Bedrock agent and get response
-        response = bedrock_agent.invoke_agent(**request_parameters)
-        complete_response = process_bedrock_response(response, logger)
+        with timer.phase('agent'):
+            try:
+                response = bedrock_agent.invoke_agent(**request_parameters)
+            except STREAM_ERRORS as e:
+                logger.warning(
+                    "Agent did not start answering before the read timeout",
+                    metric='agent_response',
+                    error=str(e),
+                    total_latency_ms=round((time.time() - started_at) * 1000),
+                    chunks=0,
+                    partial=True
+                )
+                complete_response, partial = '', True
+            else:
+                complete_response, partial = process_bedrock_response(response, logger, started_at, deadline)
+
+        # Only complete answers are cached
+        if cache_key is not None and complete_response and not partial:
+            anomaly_response_cache.put(cache_key, {'response': complete_response, 'latency_ms': round((time.time() - started_at) * 1000)})
+            logger.info("Anomaly response cache miss", device_id=cache_key[0], cache=anomaly_response_cache.stats())
         
         # Update event with response
         if complete_response:
             event['res']['message'] = complete_response
             event['res']['session']['appContext']['altMessages']['markdown'] = complete_response
             logger.info("Response message set successfully")
+        elif partial:
+            event['res']['message'] = TIMEOUT_RESPONSE
+            event['res']['session']['appContext']['altMessages']['markdown'] = TIMEOUT_RESPONSE
+            logger.warning("Agent timed out before answering")
         else:
             event['res']['message'] = "No response received from the agent"
             logger.warning("No response content to set")
             
     except Exception as e:
-        logger.error(f"Error invoking Bedrock agent: {str(e)}")
-        logger.error(f"Error details: {traceback.format_exc()}")
+        logger.error("Error invoking Bedrock agent", error=str(e), exc_info=True)
         event['res']['message'] = f"Error processing anomaly detection request: {str(e)}"
     
-    logger.info(f"Final event object: {json.dumps(event, indent=2)}")
+    logger.debug("Final event object", event=event)
     return event
 
-def process_bedrock_response(response, logger):
+def read_stream(stream, events):
+    """
+    Read the agent event stream into a queue, ending with None or the error that stopped it.
+    """
+    try:
+        for agent_event in stream:
+            events.put(agent_event)
+        events.put(None)
+    except Exception as e:
+        events.put(e)
+
+def process_bedrock_response(response, logger, started_at=None, deadline=None):
     """
     Process the streaming response from Bedrock agent.
     
     Args:
         response (dict): Response from Bedrock agent
-        logger (Logger): Logger instance for logging
+        logger (StructuredLogger): Logger instance for logging
+        started_at (float): Time the agent was invoked, used for the latency metrics
+        deadline (float): Time after which reading stops and the partial response is returned
     
     Returns:
-        str: Concatenated response text
+        tuple: Concatenated response text and whether the response was cut short by the deadline
     """
-    complete_response = ""
+    started_at = started_at or time.time()
+    chunks = []
     chunk_count = 0
+    first_chunk_at = None
+    partial = False
     logger.info("Starting to process response stream...")
-    
-    for agent_event in response['completion']:
-        chunk_count += 1
-        logger.debug(f"Processing chunk {chunk_count}")
-        
-        if 'chunk' in agent_event:
-            chunk_obj = agent_event['chunk']
+
+    # The stream is read on a worker thread, so a read blocked on the socket cannot hold the
+    # response past the deadline
+    events = queue.Queue()
+    threading.Thread(target=read_stream, args=(response['completion'], events), daemon=True).start()
+
+    try:
+        while True:
+            try:
+                agent_event = events.get(timeout=max(deadline - time.time(), 0) if deadline is not None else None)
+            except queue.Empty:
+                logger.warning("Agent response deadline reached, returning partial response")
+                partial = True
+                response['completion'].close()
+                break
+            if agent_event is None:
+                break
+            if isinstance(agent_event, Exception):
+                raise agent_event
+            chunk_count += 1
+            logger.debug("Processing chunk", chunk=chunk_count)
             
-            if 'bytes' in chunk_obj:
-                chunk_text = chunk_obj['bytes'].decode('utf-8')
-                logger.debug(f"Decoded chunk text: {chunk_text}")
-                complete_response += chunk_text
+            if 'chunk' in agent_event:
+                chunk_obj = agent_event['chunk']
+                
+                if 'bytes' in chunk_obj:
+                    chunk_text = chunk_obj['bytes'].decode('utf-8')
+                    logger.debug("Decoded chunk text", chunk_text=chunk_text)
+                    if first_chunk_at is None:
+                        first_chunk_at = time.time()
+                    chunks.append(chunk_text)
+                else:
+                    logger.warning("No 'bytes' found in chunk object")
             else:
-                logger.warning("No 'bytes' found in chunk object")
-        else:
-            logger.warning("No 'chunk' found in agentEvent")
+                logger.warning("No 'chunk' found in agentEvent")
+    except STREAM_ERRORS as e:
+        logger.warning("Agent response stream stalled, returning partial response", error=str(e))
+        partial = True
     
-    logger.info(f"Stream processing complete. Total chunks processed: {chunk_count}")
-    logger.info(f"Final Bedrock agent response: {complete_response}")
+    complete_response = "".join(chunks)
+    if partial and complete_response:
+        complete_response += PARTIAL_RESPONSE_NOTE
+
+    logger.info(
+        "Stream processing complete",
+        metric='agent_response',
+        time_to_first_chunk_ms=round((first_chunk_at - started_at) * 1000) if first_chunk_at else None,
+        total_latency_ms=round((time.time() - started_at) * 1000),
+        chunks=chunk_count,
+        characters=len(complete_response),
+        partial=partial
+    )
+    logger.debug("Final Bedrock agent response", response=complete_response)
     
-    return complete_response
+    return complete_response, partial
 
 def handle_markdown(event):
     markdown_text = "# AWS QnABotThe Q and A Bot uses [Amazon Lex](https://aws.amazon.com/lex) and [Alexa](https://developer.amazon.com/alexa) to provide a natural language interface for your FAQ knowledge base.Now your users can just ask a *question* and get a quick and relevant *answer*."
@@ -274,11 +529,13 @@ def handle_markdown(event):
     event['res']['message'] = markdown_text
     event['res']['result']['alt']['markdown'] = markdown_text
     event['res']['session']['appContext']['altMessages']['markdown'] = markdown_text
-    logger.info(f"event message being sent back: {json.dumps(event,indent=2)}")
+    logger.debug("Event message being sent back", event=event)
     return event
 
 def handler(event, context):
-    logger.info(f"handler event: {json.dumps(event,indent=2)}")
+    logger.debug("Handler event", event=event)
+    timer = PhaseTimer()
+    qid = None
     try:
         #Look for 'qid': 'IOT.DeviceInfo'
         qid = (
@@ -287,18 +544,21 @@ def handler(event, context):
             .get('qid', {})
         )
 
-        if (qid == 'IOT.DeviceInfo'):
-            return handle_device_info(event)
-        elif (qid == 'IOT.Anomaly'):
-            return handle_iot_anomaly(event, context, logger)
-        elif (qid == 'IOT.TestMarkdown'):
-            return handle_markdown(event)
-        else:
-            event['res']['message'] = f"Unknown QID: {qid}"
-            return event
+        with timer.phase('handle'):
+            if (qid == 'IOT.DeviceInfo'):
+                return handle_device_info(event)
+            elif (qid == 'IOT.Anomaly'):
+                return handle_iot_anomaly(event, context, logger, timer)
+            elif (qid == 'IOT.TestMarkdown'):
+                return handle_markdown(event)
+            else:
+                event['res']['message'] = f"Unknown QID: {qid}"
+                return event
     
     except Exception as e:
-        logger.error(f"Handler error: {str(e)}")
+        logger.error("Handler error", error=str(e), exc_info=True)
         event['res']['message'] = "An error occurred processing the request"
-        logger.info(f"{json.dumps(event,indent=2)}")
+        logger.debug("Handler error response", event=event)
         return event
+    finally:
+        logger.info("Request complete", qid=qid, **timer.fields())
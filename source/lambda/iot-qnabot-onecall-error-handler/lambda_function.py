@@ -1,42 +1,157 @@
-import boto3
 import json
 import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aws_clients import get_client
+from structured_logging import get_logger
 
-bedrock_runtime = boto3.client('bedrock-agent-runtime')
+logger = get_logger()
 
-def lambda_handler(event, context):
-    print('Received event:', event)
+bedrock_runtime = get_client('bedrock-agent-runtime')
+
+ERROR_EVENT_FIELDS = ("device_name", "error_code", "timestamp")
+
+def parse_error_events(event):
+    """
+    Normalize the incoming event into a list of (message_id, error_event, sent_timestamp) tuples.
+
+    Error events arrive in batches from the SQS queue that buffers the 'aircon/errors' IoT rule.
+    A single error message invoked directly by the IoT rule is treated as a batch of one.
+
+    Each record is parsed on its own, so a malformed message does not fail the valid ones in its
+    batch. Malformed messages are returned separately to be reported as batch item failures, and
+    the queue's redrive policy moves them to the dead-letter queue.
+
+    :return: List of error event tuples and list of the message ids of malformed messages
+    """
+    if 'Records' not in event:
+        return [(None, event, None)], []
+
+    error_events = []
+    malformed_message_ids = []
+    for record in event['Records']:
+        try:
+            sent_timestamp = float(record['attributes']['SentTimestamp']) / 1000
+            error_event = json.loads(record['body'])
+            missing = [field for field in ERROR_EVENT_FIELDS if field not in error_event]
+            if missing:
+                raise KeyError(", ".join(missing))
+            float(error_event["timestamp"])
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Malformed error event", message_id=record.get('messageId'), error=repr(e))
+            malformed_message_ids.append(record['messageId'])
+            continue
+        error_events.append((record['messageId'], error_event, sent_timestamp))
+    return error_events, malformed_message_ids
 
-    device_id = event["device_name"] 
-    error_code = event["error_code"] 
-    time_stamp = str(event["timestamp"])
-    #unique_id = str(uuid.uuid4())
+def coalesce_error_events(error_events):
+    """
+    Group error events by device and error code.
+
+    Each group keeps the earliest event, which is the one reported to the agent,
+    along with every SQS message id it covers.
+    """
+    groups = {}
+    for message_id, error_event, sent_timestamp in error_events:
+        key = (error_event["device_name"], error_event["error_code"])
+        group = groups.setdefault(key, {'event': error_event, 'message_ids': [], 'sent_timestamps': []})
+        if float(error_event["timestamp"]) < float(group['event']["timestamp"]):
+            group['event'] = error_event
+        if message_id is not None:
+            group['message_ids'].append(message_id)
+        if sent_timestamp is not None:
+            group['sent_timestamps'].append(sent_timestamp)
+    return groups
+
+def invoke_agent(error_event):
+    device_id = error_event["device_name"]
+    error_code = error_event["error_code"]
+    time_stamp = str(error_event["timestamp"])
 
-    #input_text = "Please take action based on the error details: {'unique_id':" + unique_id + ",   'device_id':" +  device_id + ",   'error_code':" + error_code +",   'time_stamp':" + time_stamp + "}"
     input_text = "Please take action based on the error details: {'device_id':" +  device_id + ",   'error_code':" + error_code +",   'time_stamp':" + time_stamp + "}"
-    
-    print(input_text)
 
-    agent_id = os.environ.get('BEDROCK_AGENT_ID')
-    agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID')
-    
+    logger.debug("Agent input", input_text=input_text)
+
     response = bedrock_runtime.invoke_agent(
-        agentId=agent_id,
-        agentAliasId=agent_alias_id,
+        agentId=os.environ.get('BEDROCK_AGENT_ID'),
+        agentAliasId=os.environ.get('BEDROCK_AGENT_ALIAS_ID'),
         sessionId=str(uuid.uuid4()),
         inputText=input_text
     )
 
-    completion = ""
+    completion = []
 
     for event in response.get("completion"):
         chunk = event["chunk"]
-        completion = completion + chunk["bytes"].decode()
-    
-    print("Completion status: " + json.dumps (completion))
+        completion.append(chunk["bytes"].decode())
+
+    return "".join(completion)
+
+def lambda_handler(event, context):
+    logger.debug("Received event", event=event)
+    started_at = time.time()
+
+    error_events, malformed_message_ids = parse_error_events(event)
+    groups = coalesce_error_events(error_events)
+    max_concurrency = int(os.environ.get('AGENT_MAX_CONCURRENCY', 4))
+
+    logger.info("Coalesced error events", error_events=len(error_events), agent_requests=len(groups))
+
+    def dispatch(group):
+        try:
+            return invoke_agent(group['event']), None
+        except Exception as e:
+            return None, e
+
+    completions = {}
+    failed_message_ids = list(malformed_message_ids)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for (device_id, error_code), (completion, error) in zip(groups.keys(), executor.map(dispatch, groups.values())):
+            group = groups[(device_id, error_code)]
+            completed_at = time.time()
+
+            # Latency from the error message entering the queue to the agent completing its request
+            latencies = [completed_at - sent_timestamp for sent_timestamp in group['sent_timestamps']]
+            logger.info(
+                "Error event group processed",
+                metric='error_event_group',
+                device_id=device_id,
+                error_code=error_code,
+                events=len(group['message_ids']) or 1,
+                max_event_latency_seconds=round(max(latencies), 3) if latencies else None,
+                status='failed' if error else 'completed'
+            )
+
+            if error:
+                logger.error("Error calling Bedrock agent", device_id=device_id, error_code=error_code, error=str(error))
+                failed_message_ids.extend(group['message_ids'])
+                continue
+
+            logger.debug("Agent completion", device_id=device_id, error_code=error_code, completion=completion)
+            completions[device_id + ":" + error_code] = completion
+
+    # Time events spent waiting in the queue before this batch started, which grows with the queue backlog
+    queue_waits = [started_at - sent_timestamp for _, _, sent_timestamp in error_events if sent_timestamp is not None]
+    logger.info(
+        "Error event batch processed",
+        metric='error_event_batch',
+        batch_size=len(error_events),
+        max_queue_wait_seconds=round(max(queue_waits), 3) if queue_waits else None,
+        agent_requests=len(groups),
+        malformed_events=len(malformed_message_ids),
+        failed_events=len(failed_message_ids)
+    )
+
+    if 'Records' in event:
+        # Report only the failed messages so SQS retries them without re-sending the whole batch
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
+
+    if not completions:
+        raise RuntimeError('Error calling Bedrock agent to report errors!')
 
     return {
         'statusCode': 200,
-        'body': json.dumps (completion)
+        'body': json.dumps(next(iter(completions.values())))
     }
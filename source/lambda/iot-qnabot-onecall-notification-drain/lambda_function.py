@@ -0,0 +1,154 @@
+import json
+import os
+import time
+from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from aws_clients import get_client, get_table
+from structured_logging import get_logger
+
+logger = get_logger()
+
+deserializer = TypeDeserializer()
+
+# A SENDING claim older than this was left by a run that timed out or crashed, and can be taken over.
+# Must be longer than the function timeout.
+CLAIM_TIMEOUT_SECONDS = int(os.environ.get('NOTIFICATION_CLAIM_TIMEOUT_SECONDS', 90))
+
+def pending_tickets(event):
+    """
+    Extract tickets with a pending notification from a DynamoDB stream batch.
+    """
+    tickets = []
+    for record in event.get('Records', []):
+        if record.get('eventName') != 'INSERT':
+            continue
+        new_image = record['dynamodb'].get('NewImage', {})
+        ticket = {key: deserializer.deserialize(value) for key, value in new_image.items()}
+        if ticket.get('notification_status') == 'PENDING':
+            tickets.append(ticket)
+    return tickets
+
+def claim_notification(table, ticket, now):
+    """
+    Claim a ticket's notification for this run, PENDING or a stale SENDING claim becomes SENDING.
+
+    :return: 'claimed', 'in_flight' if another run holds a live claim, or 'done' if it was already sent
+    """
+    try:
+        table.update_item(
+            Key={'unique_id': ticket['unique_id'], 'device_id': ticket['device_id']},
+            UpdateExpression='SET notification_status = :sending, claimed_at = :now',
+            ConditionExpression='notification_status = :pending OR (notification_status = :sending AND claimed_at < :stale_before)',
+            ExpressionAttributeValues={
+                ':pending': 'PENDING',
+                ':sending': 'SENDING',
+                ':now': Decimal(str(now)),
+                ':stale_before': Decimal(str(now - CLAIM_TIMEOUT_SECONDS))
+            },
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return 'claimed'
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            status = e.response.get('Item', {}).get('notification_status', {}).get('S')
+            return 'in_flight' if status == 'SENDING' else 'done'
+        raise
+
+def finish_claim(table, ticket, claimed_at, to_status):
+    """
+    Move a notification claimed by this run to SENT, or back to PENDING after a failed send.
+
+    :return: True if the status changed, False if the claim was taken over by another run
+    """
+    try:
+        table.update_item(
+            Key={'unique_id': ticket['unique_id'], 'device_id': ticket['device_id']},
+            UpdateExpression='SET notification_status = :to_status REMOVE claimed_at',
+            ConditionExpression='notification_status = :sending AND claimed_at = :claimed_at',
+            ExpressionAttributeValues={':sending': 'SENDING', ':claimed_at': Decimal(str(claimed_at)), ':to_status': to_status}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def format_ticket(ticket):
+    return f"Unique ID: {ticket['unique_id']}\nDevice ID: {ticket['device_id']}\nError Code: {ticket['error_code']}\nTime Stamp: {ticket['time_stamp']}\nTroubleshooting Steps: {ticket['troubleshooting_steps']}"
+
+def send_notification(tickets):
+    """
+    Send one email covering every ticket in the batch.
+    """
+    if len(tickets) == 1:
+        email_subject = "Aircon Maintenance Ticket"
+        email_body = "Ticket details:\n\n" + format_ticket(tickets[0])
+    else:
+        email_subject = f"Aircon Maintenance Tickets ({len(tickets)})"
+        email_body = f"{len(tickets)} tickets were logged.\n\n" + "\n\n".join(
+            f"Ticket {index} details:\n\n{format_ticket(ticket)}" for index, ticket in enumerate(tickets, 1)
+        )
+
+    ses = get_client('ses')
+    ses.send_email(
+        Source=os.environ.get('SENDER_EMAIL_ID'),
+        Destination={
+            'ToAddresses': [
+                os.environ.get('RECIPIENT_EMAIL_ID'),
+            ]
+        },
+        Message={
+            'Subject': {
+                'Data': email_subject
+            },
+            'Body': {
+                'Text': {
+                    'Data': email_body
+                }
+            }
+        }
+    )
+
+def lambda_handler(event, context):
+    table = get_table(os.environ.get('IOT_DEVICE_ERROR_TABLE'))
+    tickets = pending_tickets(event)
+
+    # Claim each notification first, so a retried or duplicated stream record is not emailed twice.
+    # Claims left behind by a run that timed out or crashed are taken over once they are stale.
+    claimed_at = time.time()
+    claims = {}
+    for ticket in tickets:
+        claims.setdefault(claim_notification(table, ticket, claimed_at), []).append(ticket)
+    claimed = claims.get('claimed', [])
+    in_flight = claims.get('in_flight', [])
+    logger.info("Claimed ticket notifications", claimed=len(claimed), pending=len(tickets), in_flight=len(in_flight))
+
+    if claimed:
+        try:
+            send_notification(claimed)
+        except Exception as e:
+            logger.error("Error sending ticket notifications", error=str(e), unique_ids=[ticket['unique_id'] for ticket in claimed])
+            # Release the claims so the stream retry picks the tickets up again
+            for ticket in claimed:
+                finish_claim(table, ticket, claimed_at, 'PENDING')
+            raise
+
+        for ticket in claimed:
+            finish_claim(table, ticket, claimed_at, 'SENT')
+        logger.info("Sent ticket notification", unique_ids=[ticket['unique_id'] for ticket in claimed])
+
+    if in_flight:
+        # The claim may belong to a run that died, fail the batch so the stream retries it once the claim is stale
+        raise RuntimeError(f"Notifications claimed by another run: {[ticket['unique_id'] for ticket in in_flight]}")
+
+    if not claimed:
+        return {
+            'statusCode': 200,
+            'body': json.dumps('No pending notifications')
+        }
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"Sent notification for {len(claimed)} tickets")
+    }
@@ -1,6 +1,9 @@
 from opensearchpy import OpenSearch, RequestsHttpConnection
+from opensearchpy.exceptions import AuthenticationException, AuthorizationException, ConnectionError, RequestError, TransportError
 from requests_aws4auth import AWS4Auth
 import boto3
+import random
+import re
 import time
 import json
 import os
@@ -13,72 +16,549 @@ vector_index_name = os.environ['VECTOR_INDEX_NAME']
 text_field = os.environ['TEXT_FIELD']
 metadata_field = os.environ['METADATA_FIELD']
 
+# The knowledge base reads and writes the index through an alias named VECTOR_INDEX_NAME. Each mapping
+# change creates a new versioned index {alias}-v{n}, which becomes the physical id of the custom resource.
+# CloudFormation then deletes the previous version once the stack update completes. When the stack update
+# is rolled back instead, CloudFormation only deletes the version created by the failed update, so the
+# version it was migrated from (recorded in its _meta) is deleted by the rollback's own update.
+# Collections that reject alias requests get the index created under VECTOR_INDEX_NAME itself, and a
+# mapping change then recreates it in place.
+
+# Data access policies can take up to a minute to be enforced. Instead of a fixed wait, the collection
+# is probed with exponential backoff until requests are authorized, within an overall deadline.
+readiness_timeout = float(os.environ.get('INDEX_READINESS_TIMEOUT_SECONDS', 240))
+readiness_initial_delay = float(os.environ.get('INDEX_READINESS_INITIAL_DELAY_SECONDS', 1))
+readiness_max_delay = float(os.environ.get('INDEX_READINESS_MAX_DELAY_SECONDS', 15))
+# Time kept in reserve to send the response to CloudFormation before the function times out
+response_margin = float(os.environ.get('INDEX_RESPONSE_MARGIN_SECONDS', 15))
+
+# Status codes returned while access policies and the collection are still propagating
+RETRYABLE_STATUS_CODES = (401, 403, 429, 500, 502, 503, 504)
+# Status codes of a request for an API the collection does not support
+UNSUPPORTED_STATUS_CODES = (400, 404, 405, 501)
+
+# OpenSearch Serverless supports neither _reindex nor scroll, so documents are copied with paged searches
+# and bulk requests. from/size paging reads at most index.max_result_window documents.
+copy_page_size = int(os.environ.get('INDEX_COPY_PAGE_SIZE', 100))
+MAX_RESULT_WINDOW = 10000
+
+# Named knn settings for the vector index, selected with the IndexProfile property of the custom resource.
+# The dimension is fixed by the embedding model of the knowledge base (Titan Text Embeddings V2).
+VECTOR_DIMENSION = 1024
+DEFAULT_INDEX_PROFILE = 'default'
+INDEX_PROFILES = {
+  # Settings the index was always created with, HNSW graph parameters left to the engine defaults
+  'default': {
+    'method_parameters': {},
+    'ef_search': 512,
+    'number_of_shards': 2
+  },
+  # Smaller search queue, for the lowest query latency at a small recall cost
+  'low-latency': {
+    'method_parameters': {'m': 16, 'ef_construction': 128},
+    'ef_search': 64,
+    'number_of_shards': 2
+  },
+  # Denser graph built with a larger queue, for the best recall on larger corpora
+  'high-recall': {
+    'method_parameters': {'m': 32, 'ef_construction': 512},
+    'ef_search': 512,
+    'number_of_shards': 2
+  },
+  # Vectors stored as fp16 by the faiss scalar quantizer, halving the vector memory
+  'compressed-fp16': {
+    'method_parameters': {'m': 16, 'ef_construction': 256, 'encoder': {'name': 'sq', 'parameters': {'type': 'fp16'}}},
+    'ef_search': 256,
+    'number_of_shards': 2
+  }
+}
+
 
 def on_event(event, context):
-  physical_id = "CreatedIndexId"
+  physical_id = event.get('PhysicalResourceId', vector_index_name)
   reason = ''
   print(json.dumps(event))
   request_type = event['RequestType']
 
-  if request_type == 'Create': 
-    reason = on_create(event, physical_id=physical_id, region=region, endpoint=collection_endpoint, vector_field=vector_field,
-                            vector_index_name=vector_index_name, text_field=text_field, metadata_field=metadata_field)
-  
-  elif request_type == 'Update': 
-    reason = on_update(event, physical_id=physical_id)
-
-  elif request_type == 'Delete': 
-    reason = on_delete(event, physical_id=physical_id)
-  
-  else: 
-    responseData = {
-        'Status': 'FAILED',
-        'Reason': "Invalid request type: %s" % request_type,
-        'PhysicalResourceId': physical_id
-    }
-    cfnresponse.send(event, context, cfnresponse.FAILED, responseData)
+  deadline = time.time() + readiness_timeout
+  if context is not None:
+    deadline = min(deadline, time.time() + context.get_remaining_time_in_millis() / 1000 - response_margin)
+
+  try:
+    if request_type == 'Create': 
+      physical_id, reason = on_create(event, deadline=deadline)
+    
+    elif request_type == 'Update': 
+      physical_id, reason = on_update(event, physical_id=physical_id, deadline=deadline)
+
+    elif request_type == 'Delete': 
+      reason = on_delete(event, physical_id=physical_id)
+    
+    else: 
+      cfnresponse.send(event, context, cfnresponse.FAILED, {}, physical_id, reason="Invalid request type: %s" % request_type)
+      return
+  except Exception as e:
+    print("%s failed: %s" % (request_type, e))
+    if request_type != 'Delete':
+      # Report the failure right away, otherwise CloudFormation waits for the response until its own timeout
+      cfnresponse.send(event, context, cfnresponse.FAILED, {}, physical_id, reason=str(e))
+      return
+    # A failed clean-up must not block the stack deletion, the collection is deleted with the stack anyway
+    reason = "Could not delete index %s: %s" % (physical_id, e)
 
   responseData = {
-    'Status': 'SUCCESS',
-        'Reason': reason,
-        'PhysicalResourceId': physical_id
+    'IndexName': physical_id
+  }
+  cfnresponse.send(event, context, cfnresponse.SUCCESS, responseData, physical_id, reason=reason)
+
+
+def index_config(props):
+  """
+  Read the index alias, field names, dimension and profile from the custom resource properties.
+  """
+  return {
+    'alias': props.get('AOSSIndexName', vector_index_name),
+    'vector_field': props.get('VectorField', vector_field),
+    'text_field': props.get('TextField', text_field),
+    'metadata_field': props.get('MetadataField', metadata_field),
+    'vector_dimension': int(props.get('VectorDimension', VECTOR_DIMENSION)),
+    'index_profile': props.get('IndexProfile', DEFAULT_INDEX_PROFILE)
   }
-  cfnresponse.send(event, context, cfnresponse.SUCCESS, responseData)
- 
 
 
-def on_create(event, physical_id, region, endpoint, vector_index_name,
-              vector_field, text_field, metadata_field):
+def on_create(event, deadline):
   props = event["ResourceProperties"]
   print("create new resource with props %s" % props)
 
-  index_data(region=region, vector_index_name=vector_index_name, 
-             text_field=text_field, metadata_field=metadata_field, 
-             vector_field=vector_field, endpoint=endpoint)
+  config = index_config(props)
+  body = index_body(config)
 
-  reason = "Created new resource with props %s" % props
-  return reason
+  client = opensearch_client(region, collection_endpoint)
+  # It can take up to a minute for data access rules to be enforced, wait until requests are authorized
+  with_backoff(lambda: client.indices.exists(index=config['alias']), 'Readiness probe', deadline)
+
+  if is_concrete_index(client, config['alias']):
+    # An index created before indexes were versioned, keep serving it under its own name
+    print("Index %s already exists, keeping it" % config['alias'])
+    return config['alias'], "Kept existing index %s" % config['alias']
+
+  new_index = next_index_name(client, config['alias'])
+  create_version(client, new_index, body, deadline)
+  try:
+    swap_alias(client, config['alias'], new_index)
+  except TransportError as e:
+    client.indices.delete(index=new_index, ignore=[404])
+    if not is_unsupported(e):
+      raise
+    # Without aliases the knowledge base reads the index under its own name
+    print("Aliases are not supported (%s), creating index %s" % (e.status_code, config['alias']))
+    create_version(client, config['alias'], body, deadline)
+    return config['alias'], "Created index %s with the %s profile, the collection does not support aliases" % (config['alias'], config['index_profile'])
+
+  reason = "Created index %s behind alias %s with the %s profile" % (new_index, config['alias'], config['index_profile'])
+  return new_index, reason
 
 
-def on_update(event, physical_id):
-  # physical_id = event["PhysicalResourceId"]
+def on_update(event, physical_id, deadline):
   props = event["ResourceProperties"]
   print("update resource %s with props %s" % (physical_id, props))
 
-  reason = "Updated resource %s with props %s" % (physical_id, props)
-  return reason
+  config = index_config(props)
+  old_config = index_config(event.get("OldResourceProperties", {}))
+  body = index_body(config)
+
+  client = opensearch_client(region, collection_endpoint)
+  with_backoff(lambda: client.indices.exists(index=config['alias']), 'Readiness probe', deadline)
+
+  current_index = serving_index(client, old_config['alias'], physical_id)
+  if current_index is None:
+    # Nothing to migrate from, create the index as on Create
+    return on_create(event, deadline)
+
+  changes = []
+  if config['alias'] != old_config['alias']:
+    changes.append("alias %s -> %s" % (old_config['alias'], config['alias']))
+  live_mapping = client.indices.get_mapping(index=current_index)[current_index]['mappings']
+  changes.extend(mapping_changes(live_mapping, config))
+  if not changes:
+    print("Index %s already matches the requested mapping" % current_index)
+    return current_index, "Index %s unchanged" % current_index
+  print("Migrating index %s: %s" % (current_index, ', '.join(changes)))
+
+  new_index = next_index_name(client, config['alias'])
+  body['mappings']['_meta']['migrated_from'] = current_index
+  create_version(client, new_index, body, deadline)
+  # A legacy index named like the alias is removed in the same request that creates the alias
+  legacy_index = current_index if current_index == config['alias'] else None
+  in_place = False
+  try:
+    note = copy_documents(client, current_index, new_index, live_mapping, old_config, config, deadline)
+    try:
+      swap_alias(client, config['alias'], new_index, legacy_index=legacy_index)
+    except TransportError as e:
+      if legacy_index is None or not is_unsupported(e):
+        raise
+      print("Aliases are not supported (%s), recreating index %s in place" % (e.status_code, legacy_index))
+      in_place = True
+  except Exception:
+    print("Migration to %s failed, deleting it" % new_index)
+    client.indices.delete(index=new_index, ignore=[404])
+    raise
+
+  if in_place:
+    # From here new_index holds the only copy of the documents, it is kept if recreating the index fails
+    del body['mappings']['_meta']['migrated_from']
+    recreate_in_place(client, new_index, legacy_index, body, deadline)
+    reason = "Recreated index %s (%s), the collection does not support aliases. %s" % (legacy_index, ', '.join(changes), note)
+    return legacy_index, reason
+
+  delete_rolled_back_version(client, live_mapping, config['alias'], new_index)
+
+  reason = "Migrated index %s to %s (%s). %s" % (current_index, new_index, ', '.join(changes), note)
+  return new_index, reason
 
 
 def on_delete(event, physical_id):
-  # physical_id = event["PhysicalResourceId"]
+  props = event["ResourceProperties"]
   print("delete resource %s" % physical_id)
 
-  reason = "Deleted resource %s" % physical_id
+  alias = index_config(props)['alias']
+  if physical_id != alias and index_version(physical_id, alias) is None:
+    # Physical ids of resources created before indexes were versioned do not name an index
+    return "Nothing to delete for resource %s" % physical_id
+
+  client = opensearch_client(region, collection_endpoint)
+  if not is_concrete_index(client, physical_id):
+    return "Index %s already deleted" % physical_id
+
+  if physical_id == alias:
+    # A legacy index named like the alias serves the knowledge base until it is migrated
+    print("Index %s is served under its own name, keeping it" % physical_id)
+    return "Kept index %s" % physical_id
+
+  if physical_id in alias_targets(client, alias):
+    # The index still serves the knowledge base, which happens when a migration is rolled back:
+    # move the alias back to the previous version before deleting it
+    previous = sorted((index for index in versioned_indices(client, alias) if index != physical_id), key=lambda index: index_version(index, alias))
+    if not previous:
+      print("Index %s is the only version of %s, keeping it" % (physical_id, alias))
+      return "Kept index %s, it is the only version of %s" % (physical_id, alias)
+    swap_alias(client, alias, previous[-1])
+    print("Alias %s moved back to %s" % (alias, previous[-1]))
+
+  client.indices.delete(index=physical_id)
+  reason = "Deleted index %s" % physical_id
   return reason
 
 
-def index_data(region, vector_index_name, text_field, 
-               metadata_field, vector_field, endpoint):
+def is_retryable(error):
+  """
+  Check whether an OpenSearch error is expected while access policies are propagating.
+  """
+  if isinstance(error, (AuthenticationException, AuthorizationException, ConnectionError)):
+    return True
+  return isinstance(error, TransportError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def is_unsupported(error):
+  return isinstance(error, TransportError) and error.status_code in UNSUPPORTED_STATUS_CODES
+
+
+def is_already_exists(error):
+  return isinstance(error, RequestError) and error.error == 'resource_already_exists_exception'
+
+
+def with_backoff(operation, description, deadline):
+  """
+  Call operation until it succeeds, retrying retryable errors with exponential backoff and full jitter.
+
+  :param operation: Function without arguments performing one attempt
+  :param description: Name of the operation used in log messages
+  :param deadline: Epoch time after which the last error is raised instead of retried
+  :return: Result of the first successful attempt
+  """
+  delay = readiness_initial_delay
+  attempt = 1
+  started_at = time.time()
+  while True:
+    try:
+      result = operation()
+      print("%s succeeded after %d attempt(s) in %.1f s" % (description, attempt, time.time() - started_at))
+      return result
+    except TransportError as e:
+      if not is_retryable(e):
+        raise
+      wait = random.uniform(0, delay)
+      if time.time() + wait > deadline:
+        print("%s still failing after %d attempt(s) in %.1f s" % (description, attempt, time.time() - started_at))
+        raise
+      print("%s attempt %d failed with %s, retrying in %.1f s" % (description, attempt, e.status_code, wait))
+      time.sleep(wait)
+      delay = min(delay * 2, readiness_max_delay)
+      attempt += 1
+
+
+def create_index(client, vector_index_name, body):
+  """
+  Create the index, treating an index created by an earlier attempt as success.
+  """
+  try:
+    return client.indices.create(index=vector_index_name, body=body)
+  except RequestError as e:
+    if not is_already_exists(e):
+      raise
+    print("Index %s already exists" % vector_index_name)
+    return {'acknowledged': True, 'index': vector_index_name}
+
+
+def wait_for_index(client, vector_index_name):
+  """
+  Check that the created index is visible, raising a retryable error otherwise.
+  """
+  if not client.indices.exists(index=vector_index_name):
+    raise TransportError(503, 'index_not_visible', vector_index_name)
+
+
+def index_body(config):
+  """
+  Build the mapping and settings of the vector index for a named profile.
+  """
+  index_profile = config['index_profile']
+  if index_profile not in INDEX_PROFILES:
+    raise ValueError("Unknown index profile %s, expected one of %s" % (index_profile, ', '.join(INDEX_PROFILES)))
+  profile = INDEX_PROFILES[index_profile]
+
+  method = {
+    "engine": "faiss",
+    "space_type": "l2",
+    "name": "hnsw"
+  }
+  if profile['method_parameters']:
+    method["parameters"] = dict(profile['method_parameters'], ef_search=profile['ef_search'])
+
+  return {
+    "mappings": {
+      # Recorded so that updates can tell which profile the live index was created with
+      "_meta": {
+        "index_profile": index_profile
+      },
+      "properties": {
+        f"{config['metadata_field']}": {
+          "type": "text",
+          "index": False
+        },
+        "id": {
+          "type": "text",
+          "fields": {
+          "keyword": {
+            "type": "keyword",
+            "ignore_above": 256
+            }
+          }
+        },
+        f"{config['text_field']}": {
+          "type": "text",
+          "index": True
+        },
+        f"{config['vector_field']}": {
+          "type": "knn_vector",
+          "dimension": config['vector_dimension'],
+          "method": method
+        }
+      }
+    },
+    "settings": {
+      "index": {
+        "number_of_shards": profile['number_of_shards'],
+        "knn.algo_param": {
+          "ef_search": profile['ef_search']
+        },
+        "knn": True,
+      }
+    }
+  }
+
+
+def mapping_changes(live_mapping, config):
+  """
+  Compare the live mapping of the index with the requested configuration.
+
+  :return: List of human readable differences, empty when the index can be kept
+  """
+  changes = []
+  properties = live_mapping.get('properties', {})
+  for role in ('vector_field', 'text_field', 'metadata_field'):
+    if config[role] not in properties:
+      changes.append("%s %s" % (role.replace('_', ' '), config[role]))
+
+  vector_mapping = properties.get(config['vector_field'], {})
+  if vector_mapping and vector_mapping.get('dimension') != config['vector_dimension']:
+    changes.append("dimension %s -> %s" % (vector_mapping.get('dimension'), config['vector_dimension']))
+
+  # Indexes created before profiles were recorded use the default profile
+  live_profile = live_mapping.get('_meta', {}).get('index_profile', DEFAULT_INDEX_PROFILE)
+  if live_profile != config['index_profile']:
+    changes.append("profile %s -> %s" % (live_profile, config['index_profile']))
+  return changes
+
+
+def index_version(index_name, alias):
+  match = re.fullmatch(re.escape(alias) + r'-v(\d+)', index_name)
+  return int(match.group(1)) if match else None
+
+
+def versioned_indices(client, alias):
+  return [index for index in client.indices.get(index=f"{alias}-v*") if index_version(index, alias) is not None]
+
+
+def next_index_name(client, alias):
+  versions = [index_version(index, alias) for index in versioned_indices(client, alias)]
+  return f"{alias}-v{max(versions, default=0) + 1}"
+
+
+def alias_exists(client, name):
+  try:
+    return client.indices.exists_alias(name=name)
+  except TransportError as e:
+    # A collection that does not support aliases has none
+    if is_unsupported(e):
+      return False
+    raise
+
+
+def alias_targets(client, alias):
+  if not alias_exists(client, alias):
+    return []
+  return list(client.indices.get_alias(name=alias))
+
+
+def is_concrete_index(client, name):
+  return client.indices.exists(index=name) and not alias_exists(client, name)
+
+
+def serving_index(client, alias, physical_id):
+  """
+  Find the index currently served under the alias, or the legacy index named like the alias.
+  """
+  targets = alias_targets(client, alias)
+  if physical_id in targets:
+    return physical_id
+  if targets:
+    return sorted(targets, key=lambda index: index_version(index, alias) or 0)[-1]
+  if is_concrete_index(client, alias):
+    return alias
+  return None
+
+
+def create_version(client, index_name, body, deadline):
+  print("Creating index %s with the %s profile" % (index_name, body['mappings']['_meta']['index_profile']))
+
+  # Access can still be denied briefly on some nodes after the probe succeeds, so creation is retried too
+  response = with_backoff(lambda: create_index(client, index_name, body), 'Index creation', deadline)
+  print('\nCreating index:')
+  print(response)
+
+  # Wait until the index is visible before the knowledge base uses it
+  with_backoff(lambda: wait_for_index(client, index_name), 'Index visibility check', deadline)
+
+
+def copy_documents(client, source_index, dest_index, live_mapping, old_config, config, deadline):
+  """
+  Copy the documents of the previous index into the new one, renaming fields when needed.
+
+  Vectors of a different dimension cannot be copied, the data source must then be synced again.
+
+  :return: Note on how the new index was populated
+  """
+  live_dimension = live_mapping.get('properties', {}).get(old_config['vector_field'], {}).get('dimension')
+  if live_dimension != config['vector_dimension']:
+    return "Vector dimension changed, sync the knowledge base data source to re-ingest the documents."
+
+  total = client.count(index=source_index)['count']
+  if total > MAX_RESULT_WINDOW:
+    print("%s holds %d documents, more than a paged copy can read" % (source_index, total))
+    return "Documents were not copied, %s holds more than %d. Sync the knowledge base data source to re-ingest them." % (source_index, MAX_RESULT_WINDOW)
+
+  renames = {old_config[role]: config[role] for role in ('vector_field', 'text_field', 'metadata_field') if old_config[role] != config[role]}
+  copy_index(client, source_index, dest_index, total, renames, deadline)
+  return "Copied %s documents from %s." % (total, source_index)
+
+
+def copy_index(client, source_index, dest_index, total, renames, deadline):
+  """
+  Copy the total documents of source_index into dest_index page by page, keeping their ids.
+
+  The copy fails when the pages did not return every document exactly once, e.g. because the
+  knowledge base wrote to the source index meanwhile.
+  """
+  copied = set()
+  for start in range(0, total, copy_page_size):
+    if time.time() >= deadline:
+      raise RuntimeError("Copy from %s to %s stopped at the deadline after %d of %d documents" % (source_index, dest_index, len(copied), total))
+    hits = client.search(
+      index=source_index,
+      body={'query': {'match_all': {}}, 'sort': ['_doc'], 'from': start, 'size': copy_page_size}
+    )['hits']['hits']
+    if not hits:
+      break
+
+    actions = []
+    for hit in hits:
+      actions.append({'index': {'_index': dest_index, '_id': hit['_id']}})
+      actions.append({renames.get(field, field): value for field, value in hit['_source'].items()})
+    response = client.bulk(body=actions)
+    if response.get('errors'):
+      errors = [item['index']['error'] for item in response['items'] if 'error' in item['index']]
+      raise RuntimeError("Copy from %s to %s failed for %d documents: %s" % (source_index, dest_index, len(errors), errors[:3]))
+    copied.update(hit['_id'] for hit in hits)
+
+  if len(copied) != total:
+    raise RuntimeError("Copy from %s to %s read %d of %d documents" % (source_index, dest_index, len(copied), total))
+  print("Copied %d documents from %s to %s" % (total, source_index, dest_index))
+
+
+def recreate_in_place(client, staging_index, index_name, body, deadline):
+  """
+  Recreate index_name with the new mapping from its migrated copy in staging_index, for collections without aliases.
+
+  The knowledge base cannot query the index between its deletion and the end of the copy.
+  """
+  client.indices.delete(index=index_name)
+  create_version(client, index_name, body, deadline)
+  copy_index(client, staging_index, index_name, client.count(index=staging_index)['count'], {}, deadline)
+  client.indices.delete(index=staging_index)
+
+
+def delete_rolled_back_version(client, live_mapping, alias, new_index):
+  """
+  Delete the version the replaced index was migrated from, if it still exists.
+
+  After a completed stack update CloudFormation has deleted it already. When the update is rolled back,
+  the replaced index is the version created by the failed update, and CloudFormation never deletes the
+  version it was migrated from.
+  """
+  previous = live_mapping.get('_meta', {}).get('migrated_from')
+  if previous in (None, alias, new_index) or index_version(previous, alias) is None:
+    return
+  if not is_concrete_index(client, previous) or previous in alias_targets(client, alias):
+    return
+  print("Deleting index %s left by a rolled back update" % previous)
+  client.indices.delete(index=previous, ignore=[404])
+
+
+def swap_alias(client, alias, new_index, legacy_index=None):
+  """
+  Point the alias at new_index in a single atomic request.
+  """
+  actions = [{'remove': {'index': index, 'alias': alias}} for index in alias_targets(client, alias) if index != new_index]
+  if legacy_index is not None:
+    actions.append({'remove_index': {'index': legacy_index}})
+  actions.append({'add': {'index': new_index, 'alias': alias}})
+  client.indices.update_aliases(body={'actions': actions})
+  print("Alias %s now points to %s" % (alias, new_index))
+
+
+def opensearch_client(region, endpoint):
     
     host = endpoint.replace("https://", "")
     
@@ -88,9 +568,8 @@ def index_data(region, vector_index_name, text_field,
     awsauth = AWS4Auth(credentials.access_key, credentials.secret_key,
                        region, service, session_token=credentials.token)
     
-    """Create an index"""
     # Build the OpenSearch client
-    client = OpenSearch(
+    return OpenSearch(
         hosts=[{'host': host, 'port': 443}],
         http_auth=awsauth,
         use_ssl=True,
@@ -98,53 +577,3 @@ def index_data(region, vector_index_name, text_field,
         connection_class=RequestsHttpConnection,
         timeout=300
     )
-    # It can take up to a minute for data access rules to be enforced
-    time.sleep(45)
-    
-    # Create index
-    body = {
-      "mappings": {
-        "properties": {
-          f"{metadata_field}": {
-            "type": "text",
-            "index": False
-          },
-          "id": {
-            "type": "text",
-            "fields": {
-            "keyword": {
-              "type": "keyword",
-              "ignore_above": 256
-              }
-            }
-          },
-          f"{text_field}": {
-            "type": "text",
-            "index": True
-          },
-          f"{vector_field}": {
-            "type": "knn_vector",
-            "dimension": 1024,
-            "method": {
-              "engine": "faiss",
-              "space_type": "l2",
-              "name": "hnsw"
-            }
-          }
-        }
-      },
-      "settings": {
-        "index": {
-          "number_of_shards": 2,
-          "knn.algo_param": {
-            "ef_search": 512
-          },
-          "knn": True,
-        }
-      }
-    }
-
-    response = client.indices.create(index=vector_index_name, body=body)
-    print('\nCreating index:')
-    print(response)
-    
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Device index cost and lookup latency for a 10k device fleet, against moto's S3 stand-in.
+
+Run with: python tests/benchmarks/bench_device_index.py [devices] [rows_per_device]
+
+moto keeps objects in memory, so the latencies measure the index and parsing work and the number of
+requests, not S3 round trips. Multiply the request counts by the S3 latency for an estimate in AWS.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import inference_output, load_module
+
+import boto3
+from moto import mock_aws
+
+BUCKET = 'telemetry-bucket'
+LOOKUPS = 200
+
+class CountingS3:
+    """
+    Count the requests made through an S3 client.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.requests = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        def counted(*args, **kwargs):
+            self.requests[name] = self.requests.get(name, 0) + 1
+            return method(*args, **kwargs)
+        return counted
+
+def main(devices=10000, rows_per_device=12):
+    clean_inference_output = load_module('clean_inference_output', 'lambda', 'iot-qnabot-onecall-clean-inference-output', 'lambda_function.py')
+    user_query = load_module('user_query', 'lambda', 'bedrock_agent_functions', 'iot-qnabot-onecall-user-query', 'lambda_function.py')
+
+    with mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        body = inference_output(devices, rows_per_device)
+        client.put_object(Bucket=BUCKET, Key='telemetry/inference-output/batch.csv.out', Body=body)
+        event = {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': 'telemetry/inference-output/batch.csv.out'}}}]}
+
+        s3 = CountingS3(client)
+        clean_inference_output.s3 = s3
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        clean_inference_output.lambda_handler(event, None)
+        write_seconds = time.perf_counter() - started_at
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        index_keys = client.list_objects_v2(Bucket=BUCKET, Prefix='telemetry/device-index/')['Contents']
+        hour = index_keys[0]['Key'].rsplit('/', 1)[0].split('device-index/', 1)[1]
+        print(f"{devices} devices, {devices * rows_per_device} rows, processed output {len(body) / 1e6:.1f} MB")
+        print(f"write: {write_seconds:.2f}s, {s3.requests.get('put_object', 0)} PUTs "
+              f"({len(index_keys)} device index objects, {sum(obj['Size'] for obj in index_keys) / 1e3:.0f} kB), "
+              f"peak Python memory {peak_bytes / 1e6:.0f} MB")
+        print(f"one object per device and hour would take {devices + 1} PUTs for the index")
+
+        device_ids = random.Random(0).sample([f"aircon_{device}" for device in range(devices)], LOOKUPS)
+        for name, lookup in (('device index', user_query.read_device_index), ('block index scan', user_query.scan_processed_output)):
+            s3 = CountingS3(client)
+            latencies = []
+            for device_id in device_ids:
+                started_at = time.perf_counter()
+                rows = lookup(s3, BUCKET, device_id, hour)
+                latencies.append((time.perf_counter() - started_at) * 1000)
+                assert len(rows) == rows_per_device
+            requests = sum(s3.requests.values()) / LOOKUPS
+            print(f"{name}: p50 {statistics.median(latencies):.1f} ms, p95 {sorted(latencies)[int(LOOKUPS * 0.95)]:.1f} ms, {requests:.1f} requests per lookup")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Cost per log record of print and of structured_logging, for the S3 event logged by clean-inference-output.
+
+Run with: python tests/benchmarks/bench_logging.py [records]
+"""
+import contextlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conftest  # noqa: F401, puts the shared Lambda modules on sys.path
+from structured_logging import get_logger
+
+EVENT = {'Records': [{
+    'eventVersion': '2.1',
+    'eventSource': 'aws:s3',
+    'awsRegion': 'us-east-1',
+    'eventTime': '2025-03-04T13:00:00.000Z',
+    'eventName': 'ObjectCreated:Put',
+    's3': {
+        'bucket': {'name': 'iot-qnabot-onecall-bucket', 'arn': 'arn:aws:s3:::iot-qnabot-onecall-bucket'},
+        'object': {'key': 'telemetry/inference-output/2025/03/04/13/processed_data.csv.out', 'size': 11400000, 'eTag': '0123456789abcdef'}
+    }
+}]}
+
+def per_record_us(log, records):
+    started_at = time.perf_counter()
+    for _ in range(records):
+        log()
+    return (time.perf_counter() - started_at) / records * 1e6
+
+def main(records=50000):
+    with open(os.devnull, 'w') as devnull:
+        logging.basicConfig(stream=devnull, format='%(message)s', force=True)
+        info_logger = get_logger('bench')
+        info_logger.logger.setLevel(logging.INFO)
+
+        with contextlib.redirect_stdout(devnull):
+            results = [
+                ('print event', per_record_us(lambda: print("event : ", EVENT), records)),
+                ('print f-string', per_record_us(lambda: print(f"Successfully preprocessed and saved {EVENT['Records'][0]['s3']['object']['key']}"), records))
+            ]
+        results += [
+            ('logger.debug event, below level', per_record_us(lambda: info_logger.debug("Received event", event=EVENT), records)),
+            ('logger.info event', per_record_us(lambda: info_logger.info("Received event", event=EVENT), records)),
+            ('logger.info fields', per_record_us(lambda: info_logger.info("Preprocessed inference output", key=EVENT['Records'][0]['s3']['object']['key'], rows=120000), records))
+        ]
+
+    for name, microseconds in results:
+        print(f"{name}: {microseconds:.2f} us per record")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,43 @@
+"""
+format_to_markdown throughput on a large agent answer.
+
+Run with: python tests/benchmarks/bench_markdown.py [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import load_module
+
+os.environ.setdefault('AGENT_ID', 'agent')
+os.environ.setdefault('AGENT_ALIAS_ID', 'alias')
+
+ANSWER = (
+    'Header: Summary\n'
+    'The unit "aircon_3" reported E1, see https://example.com/e1\n'
+    '1. Check the filter\n'
+    '2. Restart the unit\n'
+    '- Inspect the compressor\n'
+    'continued line\n'
+    '\n'
+    'Code: reset\n'
+    'Run `reset` then wait\n'
+)
+
+def main(repeats=20):
+    hook = load_module('custom_hook', 'lambda', 'iot-qnabot-onecall-custom-hook', 'CustomPYHook.py')
+    text = ANSWER * 2000
+    hook.format_to_markdown(text)
+
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        hook.format_to_markdown(text)
+    seconds = (time.perf_counter() - started_at) / repeats
+
+    lines = text.count('\n')
+    print(f"{len(text) / 1e3:.0f} kB, {lines} lines: {seconds * 1000:.1f} ms per answer, {lines / seconds / 1e6:.2f} M lines/s, {len(text) / seconds / 1e6:.1f} MB/s")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
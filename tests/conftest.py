@@ -0,0 +1,109 @@
+import atexit
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+try:
+    # Imported before any client is created, so clients cached by aws_clients are routed to moto too
+    import moto
+except ImportError:
+    moto = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIR = os.path.join(REPO_DIR, 'source')
+LAMBDA_DIR = os.path.join(SOURCE_DIR, 'lambda')
+
+# Lambda modules create their clients at import, so the region and credentials have to be set first
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+sys.path.insert(0, os.path.join(LAMBDA_DIR, 'common'))
+sys.path.insert(0, os.path.join(SOURCE_DIR, 'knowledge_base'))
+
+# The user query function is packaged with both documents next to manual_retrieval.py, stage them the same way
+MANUAL_DIR = tempfile.mkdtemp(prefix='manual-')
+atexit.register(shutil.rmtree, MANUAL_DIR, True)
+shutil.copy(os.path.join(REPO_DIR, 'assets', 'data', 'Troubleshooting_Guide.docx'), MANUAL_DIR)
+shutil.copy(os.path.join(SOURCE_DIR, 'iot_simulator', 'sample_air_conditioner_manual', 'aircon_manual.md'), MANUAL_DIR)
+os.environ.setdefault('MANUAL_DIR', MANUAL_DIR)
+
+def load_module(name, *path):
+    """
+    Import a source file under a unique module name.
+
+    Most Lambdas are named lambda_function, so they cannot be imported by name side by side.
+    A module is loaded once and shared by the test modules using the same name. The file's directory is put on sys.path so the modules bundled next to it resolve.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    path = os.path.join(SOURCE_DIR, *path)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def create_table(dynamodb, name, hash_key, range_key=None):
+    key_schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+    attributes = [{'AttributeName': hash_key, 'AttributeType': 'S'}]
+    if range_key:
+        key_schema.append({'AttributeName': range_key, 'KeyType': 'RANGE'})
+        attributes.append({'AttributeName': range_key, 'AttributeType': 'S'})
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=key_schema,
+        AttributeDefinitions=attributes,
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+@pytest.fixture
+def aws():
+    """
+    Route every AWS call made during the test to moto's local stand-ins.
+    """
+    if moto is None:
+        pytest.skip('moto is not installed')
+    with moto.mock_aws():
+        yield
+
+@pytest.fixture
+def dynamodb(aws):
+    import boto3
+    return boto3.resource('dynamodb')
+
+@pytest.fixture
+def s3(aws):
+    import boto3
+    return boto3.client('s3')
+
+INFERENCE_OUTPUT_HEADER = (
+    'timestamp,device_name,indoor_temperature_c,outdoor_temperature_c,setpoint_temperature_c,mode,'
+    'power_consumption_watts,compressor_status,fan_speed_rpm,refrigerant_pressure_psi,error_code,filter_status,'
+    'normal,label,probability_normal,probability_anomaly'
+)
+
+def inference_output(devices, rows_per_device, hour='2025-03-04 13'):
+    """
+    Batch transform output for an hour of telemetry, one row per device every few minutes.
+
+    The last three columns are the model's label and probabilities, dropped by clean-inference-output.
+    """
+    lines = [INFERENCE_OUTPUT_HEADER]
+    step = 60 // rows_per_device
+    for row in range(rows_per_device):
+        for device in range(devices):
+            error_code = 'E1' if (device + row) % 97 == 0 else 'None'
+            anomaly = 'anomaly' if error_code != 'None' else 'normal'
+            lines.append(
+                f"{hour}:{row * step:02d}:00,aircon_{device},{20 + device % 5},{30 + row % 4},24,cool,"
+                f"{800 + device % 300},On,{1200 + row},{230 + device % 9},{error_code},Clean,{anomaly},{anomaly},0.9,0.1"
+            )
+    return ('\n'.join(lines) + '\n').encode('utf-8')
@@ -0,0 +1,74 @@
+import pytest
+
+from conftest import create_table, load_module
+
+suppression = load_module('anomaly_suppression', 'lambda', 'iot-qnabot-onecall-anomaly-handler', 'suppression.py')
+
+NOW = 1_700_000_000.0
+TTL_SECONDS = 24 * 3600
+
+@pytest.fixture
+def table(dynamodb):
+    return create_table(dynamodb, 'anomaly-suppression', 'suppression_key')
+
+def item(table, device_id='aircon_1', error_code='W1'):
+    return table.get_item(Key={'suppression_key': suppression.suppression_key(device_id, error_code)}).get('Item')
+
+def test_new_anomaly_is_reported():
+    assert suppression.evaluate_suppression(None, 50, NOW, 6 * 3600, 20) == (True, 'new anomaly')
+
+def test_recent_report_is_suppressed_until_cooldown_or_escalation():
+    record = {'last_reported_at': NOW - 3600, 'last_reported_rate': 50}
+    assert not suppression.evaluate_suppression(record, 60, NOW, 6 * 3600, 20)[0]
+    assert suppression.evaluate_suppression(record, 70, NOW, 6 * 3600, 20)[0]
+    assert suppression.evaluate_suppression(record, 50, NOW + 5 * 3600, 6 * 3600, 20)[0]
+
+def test_expired_record_is_treated_as_missing(table):
+    assert suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    assert suppression.get_suppression_record(table, 'aircon_1', 'W1', NOW + 1) is not None
+    assert suppression.get_suppression_record(table, 'aircon_1', 'W1', NOW + TTL_SECONDS) is None
+
+def test_suppressed_occurrence_never_creates_a_record(table):
+    assert not suppression.record_suppressed(table, 'aircon_1', 'W1', NOW, TTL_SECONDS)
+    assert item(table) is None
+
+def test_suppressed_occurrences_extend_the_ttl(table):
+    suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    for offset in range(1, 4):
+        assert suppression.record_suppressed(table, 'aircon_1', 'W1', NOW + offset, TTL_SECONDS)
+
+    record = item(table)
+    assert record['suppressed_count'] == 3
+    assert record['expires_at'] == int(NOW + 3 + TTL_SECONDS)
+
+def test_concurrent_claims_report_once(table):
+    assert suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    # A second run that read the same (missing) record loses the conditional write
+    assert not suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    assert item(table)['report_count'] == 1
+
+def test_release_restores_the_previous_report(table):
+    suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    for offset in range(1, 4):
+        suppression.record_suppressed(table, 'aircon_1', 'W1', NOW + offset, TTL_SECONDS)
+    record = suppression.get_suppression_record(table, 'aircon_1', 'W1', NOW + 10)
+
+    later = NOW + 7 * 3600
+    assert suppression.claim_report(table, 'aircon_1', 'W1', record, 60, later, TTL_SECONDS)
+    assert suppression.release_report(table, 'aircon_1', 'W1', record, later)
+
+    released = item(table)
+    assert 'claimed_at' not in released
+    assert released['suppressed_count'] == 3
+    assert float(released['last_reported_at']) == float(record['last_reported_at'])
+    # The next run sees the cooldown elapsed again and retries the report
+    assert suppression.evaluate_suppression(released, 60, later + 60, 6 * 3600, 20)[0]
+
+def test_release_leaves_a_later_claim_alone(table):
+    suppression.claim_report(table, 'aircon_1', 'W1', None, 50, NOW, TTL_SECONDS)
+    record = suppression.get_suppression_record(table, 'aircon_1', 'W1', NOW + 1)
+    later = NOW + 7 * 3600
+    suppression.claim_report(table, 'aircon_1', 'W1', record, 60, later, TTL_SECONDS)
+
+    assert not suppression.release_report(table, 'aircon_1', 'W1', record, NOW)
+    assert float(item(table)['claimed_at']) == later
@@ -0,0 +1,160 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import create_table, load_module
+
+dispatcher = load_module('call_dispatcher', 'lambda', 'iot-qnabot-onecall-call-dispatcher', 'lambda_function.py')
+
+class StubConnect:
+    """
+    Amazon Connect stand-in that records the calls started and fails them on request.
+    """
+    def __init__(self):
+        self.calls = []
+        self.errors = {}
+
+    def start_outbound_voice_contact(self, **params):
+        device_id = params['Attributes']['deviceID']
+        if device_id in self.errors:
+            raise ClientError({'Error': {'Code': self.errors[device_id], 'Message': 'stub'}}, 'StartOutboundVoiceContact')
+        self.calls.append((device_id, params['Attributes']['errorCode']))
+        return {'ContactId': f"contact-{len(self.calls)}"}
+
+def record(message_id, device_id, error_code, sent_timestamp=1_700_000_000_000):
+    body = {'unique_id': message_id, 'device_id': device_id, 'error_code': error_code, 'troubleshooting_steps': ''}
+    return {'messageId': message_id, 'body': json.dumps(body), 'attributes': {'SentTimestamp': str(sent_timestamp)}}
+
+def failures(response):
+    return sorted(failure['itemIdentifier'] for failure in response['batchItemFailures'])
+
+@pytest.fixture
+def table(dynamodb, monkeypatch):
+    monkeypatch.setenv('CALL_DEDUP_TABLE', 'call-dedup')
+    monkeypatch.setenv('CALL_MAX_ACTIVE_CALLS', '1')
+    devices = create_table(dynamodb, 'iot-qnabot-onecall-device-data', 'deviceid')
+    for device_id, site in (('aircon_1', 'site_a'), ('aircon_2', 'site_a'), ('aircon_3', 'site_b')):
+        devices.put_item(Item={'deviceid': device_id, 'siteowner': site})
+    return create_table(dynamodb, 'call-dedup', 'dedup_key')
+
+@pytest.fixture
+def connect(monkeypatch):
+    stub = StubConnect()
+    monkeypatch.setattr(dispatcher, 'get_client', lambda service: stub)
+    return stub
+
+def item(table, key):
+    return table.get_item(Key={'dedup_key': key}).get('Item')
+
+def test_highest_priority_call_per_site_is_placed(table, connect):
+    response = dispatcher.lambda_handler({'Records': [
+        record('m1', 'aircon_1', 'W1'),
+        record('m2', 'aircon_2', 'E3'),
+        {'messageId': 'm3', 'body': 'not json', 'attributes': {}}
+    ]}, None)
+
+    assert connect.calls == [('aircon_2', 'E3')]
+    # Only the malformed message is reported, the W1 duplicate is settled by the E3 call
+    assert failures(response) == ['m3']
+
+def test_duplicates_are_retried_with_their_busy_call(table, connect):
+    dispatcher.lambda_handler({'Records': [record('m1', 'aircon_3', 'E1')]}, None)
+
+    response = dispatcher.lambda_handler({'Records': [
+        record('m2', 'aircon_1', 'E2'),
+        record('m3', 'aircon_2', 'W1')
+    ]}, None)
+
+    assert connect.calls == [('aircon_3', 'E1')]
+    assert failures(response) == ['m2', 'm3']
+    assert item(table, 'site#site_a') is None
+
+def test_duplicates_are_retried_with_their_throttled_call(table, connect):
+    connect.errors['aircon_1'] = 'ThrottlingException'
+
+    response = dispatcher.lambda_handler({'Records': [
+        record('m1', 'aircon_1', 'E2'),
+        record('m2', 'aircon_2', 'W1')
+    ]}, None)
+
+    assert failures(response) == ['m1', 'm2']
+    assert item(table, 'device#aircon_1') is None
+    assert item(table, f"{dispatcher.ACTIVE_CALL_KEY_PREFIX}0") is None
+
+def test_rejected_call_is_dropped_with_its_duplicates(table, connect):
+    connect.errors['aircon_1'] = 'InvalidParameterException'
+
+    response = dispatcher.lambda_handler({'Records': [
+        record('m1', 'aircon_1', 'E2'),
+        record('m2', 'aircon_2', 'W1')
+    ]}, None)
+
+    assert failures(response) == []
+    assert connect.calls == []
+
+def test_busy_takeover_hands_the_claim_back(table, connect):
+    dispatcher.lambda_handler({'Records': [record('m1', 'aircon_1', 'W1')]}, None)
+    placed_claim = item(table, 'site#site_a')
+
+    # The E3 call outranks the placed W1 call and takes over the site, but every call slot is busy
+    response = dispatcher.lambda_handler({'Records': [record('m2', 'aircon_2', 'E3')]}, None)
+
+    assert failures(response) == ['m2']
+    assert item(table, 'site#site_a') == placed_claim
+    assert item(table, 'device#aircon_2') is None
+
+def test_release_leaves_a_claim_taken_by_another_run(table):
+    request = {'unique_id': 'm1', 'device_id': 'aircon_3', 'error_code': 'W1', 'site': None}
+    claims = dispatcher.claim_call(table, request, 1800, 1_700_000_000)
+    table.put_item(Item={'dedup_key': 'device#aircon_3', 'unique_id': 'm2', 'priority': 0, 'expires_at': 1_700_001_800})
+
+    dispatcher.release_call(table, request, claims)
+
+    assert item(table, 'device#aircon_3')['unique_id'] == 'm2'
+
+def test_same_priority_call_is_deduplicated_across_runs(table, connect, monkeypatch):
+    monkeypatch.setenv('CALL_MAX_ACTIVE_CALLS', '2')
+    dispatcher.lambda_handler({'Records': [record('m1', 'aircon_1', 'E1')]}, None)
+
+    response = dispatcher.lambda_handler({'Records': [record('m2', 'aircon_2', 'E1')]}, None)
+
+    assert failures(response) == []
+    assert connect.calls == [('aircon_1', 'E1')]
+
+def test_disconnected_contact_frees_its_slot(table, connect):
+    dispatcher.lambda_handler({'Records': [record('m1', 'aircon_1', 'E1')]}, None)
+
+    released = dispatcher.lambda_handler({'source': 'aws.connect', 'detail': {'contactId': 'contact-1', 'eventType': 'DISCONNECTED'}}, None)
+    response = dispatcher.lambda_handler({'Records': [record('m2', 'aircon_3', 'E1')]}, None)
+
+    assert released == {'released': True}
+    assert failures(response) == []
+    assert connect.calls == [('aircon_1', 'E1'), ('aircon_3', 'E1')]
+
+class PartialDynamoDB:
+    """
+    DynamoDB resource stand-in that leaves every other key unprocessed on the first request.
+    """
+    def __init__(self, sites):
+        self.sites = sites
+        self.requests = 0
+
+    def batch_get_item(self, RequestItems):
+        self.requests += 1
+        (table_name, request), = RequestItems.items()
+        keys = request['Keys']
+        processed, unprocessed = (keys[::2], keys[1::2]) if self.requests == 1 else (keys, [])
+        response = {'Responses': {table_name: [{'deviceid': key['deviceid'], 'siteowner': self.sites[key['deviceid']]} for key in processed]}}
+        if unprocessed:
+            response['UnprocessedKeys'] = {table_name: dict(request, Keys=unprocessed)}
+        return response
+
+def test_unprocessed_site_lookups_are_retried(monkeypatch):
+    sites = {f"aircon_{index}": f"site_{index % 7}" for index in range(150)}
+    dynamodb = PartialDynamoDB(sites)
+    monkeypatch.setattr(dispatcher, 'get_resource', lambda service: dynamodb)
+    monkeypatch.setattr(dispatcher.time, 'sleep', lambda seconds: None)
+
+    assert dispatcher.lookup_sites(list(sites)) == sites
+    assert dynamodb.requests == 3
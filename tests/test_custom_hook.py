@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+from botocore.exceptions import ReadTimeoutError
+from urllib3.exceptions import ReadTimeoutError as StreamReadTimeoutError
+
+from conftest import load_module
+
+os.environ.setdefault('AGENT_ID', 'agent')
+os.environ.setdefault('AGENT_ALIAS_ID', 'alias')
+
+hook = load_module('custom_hook', 'lambda', 'iot-qnabot-onecall-custom-hook', 'CustomPYHook.py')
+
+class AgentStream:
+    """
+    Agent event stream stand-in that sends two chunks, hanging or failing between them on request.
+    """
+    def __init__(self, mode='complete'):
+        self.mode = mode
+        self.closed = False
+
+    def __iter__(self):
+        yield {'chunk': {'bytes': b'Check the '}}
+        if self.mode == 'hang':
+            time.sleep(5)
+        if self.mode == 'stall':
+            raise StreamReadTimeoutError(None, None, 'Read timed out.')
+        yield {'chunk': {'bytes': b'filter.'}}
+
+    def close(self):
+        self.closed = True
+
+class StubAgent:
+    def __init__(self, stream=None, error=None):
+        self.stream = stream
+        self.error = error
+
+    def invoke_agent(self, **request_parameters):
+        if self.error is not None:
+            raise self.error
+        return {'completion': self.stream}
+
+class LambdaContext:
+    def __init__(self, remaining_seconds):
+        self.remaining_seconds = remaining_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining_seconds * 1000)
+
+def anomaly_event(question='Why is the unit making noise?'):
+    return {
+        'req': {'_event': {'inputTranscript': question, 'sessionId': 'session'}},
+        'res': {'message': '', 'session': {'appContext': {'altMessages': {}}}}
+    }
+
+class ClientRequests(list):
+    """
+    Clients requested by the hook, each answered with the stub agent.
+    """
+    agent = None
+
+    def get_client(self, service_name, **config_overrides):
+        self.append((service_name, config_overrides))
+        return self.agent
+
+@pytest.fixture
+def clients(monkeypatch):
+    requests = ClientRequests()
+    monkeypatch.setattr(hook, 'get_client', requests.get_client)
+    return requests
+
+def answer(clients, agent, remaining_seconds=30):
+    clients.agent = agent
+    event = hook.handle_iot_anomaly(anomaly_event(), LambdaContext(remaining_seconds), hook.logger)
+    return event['res']['message']
+
+def test_complete_answer(clients):
+    assert answer(clients, StubAgent(AgentStream())) == 'Check the filter.'
+
+def test_agent_client_is_bounded_by_the_deadline(clients):
+    answer(clients, StubAgent(AgentStream()), remaining_seconds=12.5)
+
+    assert clients == [('bedrock-agent-runtime', {'read_timeout': 10, 'retries': {'mode': 'standard', 'max_attempts': 1}})]
+
+def test_read_timeout_before_the_agent_answers(clients):
+    error = ReadTimeoutError(endpoint_url='https://bedrock-agent-runtime.us-east-1.amazonaws.com')
+
+    assert answer(clients, StubAgent(error=error)) == hook.TIMEOUT_RESPONSE
+
+def test_stalled_stream_returns_the_partial_answer(clients):
+    assert answer(clients, StubAgent(AgentStream('stall'))) == 'Check the ' + hook.PARTIAL_RESPONSE_NOTE
+
+def test_deadline_returns_the_partial_answer(clients):
+    stream = AgentStream('hang')
+    started_at = time.time()
+
+    message = answer(clients, StubAgent(stream), remaining_seconds=hook.AGENT_DEADLINE_MARGIN_SECONDS + 1)
+
+    assert message == 'Check the ' + hook.PARTIAL_RESPONSE_NOTE
+    assert stream.closed
+    assert time.time() - started_at < 2
+
+def test_other_agent_errors_are_reported(clients):
+    assert answer(clients, StubAgent(error=ValueError('bad request'))).startswith('Error processing anomaly detection request')
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from conftest import inference_output, load_module
+
+pytest.importorskip('pandas')
+
+clean_inference_output = load_module('clean_inference_output', 'lambda', 'iot-qnabot-onecall-clean-inference-output', 'lambda_function.py')
+user_query = load_module('user_query', 'lambda', 'bedrock_agent_functions', 'iot-qnabot-onecall-user-query', 'lambda_function.py')
+
+BUCKET = 'telemetry-bucket'
+
+@pytest.fixture
+def bucket(s3, monkeypatch):
+    s3.create_bucket(Bucket=BUCKET)
+    monkeypatch.setattr(clean_inference_output, 's3', s3)
+    monkeypatch.setenv('DEVICE_INDEX_SHARDS', '4')
+    return s3
+
+def process(s3, body):
+    s3.put_object(Bucket=BUCKET, Key='telemetry/inference-output/batch.csv.out', Body=body)
+    event = {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': 'telemetry/inference-output/batch.csv.out'}}}]}
+    clean_inference_output.lambda_handler(event, None)
+    keys = [obj['Key'] for obj in s3.list_objects_v2(Bucket=BUCKET, Prefix='telemetry/device-index/')['Contents']]
+    return keys, keys[0].rsplit('/', 1)[0].split('device-index/', 1)[1]
+
+def test_index_size_does_not_grow_with_devices(bucket):
+    keys, hour = process(bucket, inference_output(devices=50, rows_per_device=3))
+
+    assert sorted(key.rsplit('/', 1)[1] for key in keys) == ['000.json', '001.json', '002.json', '003.json', '_manifest.json']
+    manifest = json.loads(bucket.get_object(Bucket=BUCKET, Key=f"telemetry/device-index/{hour}/_manifest.json")['Body'].read())
+    assert manifest == {'key': f"telemetry/processed-output/{hour}/inference_output.csv", 'shards': 4, 'devices': 50, 'rows': 150}
+
+def test_lookup_reads_the_device_rows_only(bucket):
+    _, hour = process(bucket, inference_output(devices=50, rows_per_device=3))
+
+    for device_id in ('aircon_0', 'aircon_1', 'aircon_49'):
+        rows = user_query.read_device_index(bucket, BUCKET, device_id, hour)
+        assert len(rows) == 3
+        assert {row[1] for row in rows} == {device_id}
+        assert rows == user_query.scan_processed_output(bucket, BUCKET, device_id, hour)
+
+def test_device_without_rows_in_an_indexed_hour(bucket):
+    _, hour = process(bucket, inference_output(devices=5, rows_per_device=2))
+
+    assert user_query.read_device_index(bucket, BUCKET, 'aircon_404', hour) == []
+
+def test_hour_without_index_is_scanned(bucket):
+    assert user_query.read_device_index(bucket, BUCKET, 'aircon_0', '2020/01/01/00') is None
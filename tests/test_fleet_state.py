@@ -0,0 +1,191 @@
+import io
+import json
+import sys
+import threading
+import types
+
+import pytest
+
+from conftest import load_module
+
+fleet_state = load_module('fleet_state', 'iot_simulator', 'fleet_state.py')
+fleet_index = load_module('fleet_index', 'iot_simulator', 'fleet_index.py')
+
+def shadow_document(version, **reported):
+    return json.dumps({'current': {'state': {'reported': reported}, 'version': version}})
+
+class Broker:
+    """
+    In-process stand-in for AWS IoT: routes publishes to the callbacks of matching topic filters.
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self.clients = []
+        self.refuse_connections = False
+
+    def publish(self, topic, payload):
+        for topic_filter, callback in self.subscriptions:
+            if self.matches(topic_filter, topic):
+                callback(None, None, types.SimpleNamespace(topic=topic, payload=payload.encode()))
+
+    @staticmethod
+    def matches(topic_filter, topic):
+        filter_levels, topic_levels = topic_filter.split('/'), topic.split('/')
+        return len(filter_levels) == len(topic_levels) and all(level in ('+', name) for level, name in zip(filter_levels, topic_levels))
+
+@pytest.fixture
+def broker(monkeypatch, tmp_path):
+    broker = Broker()
+
+    class MQTTClient:
+        def __init__(self, client_id, useWebsocket=False):
+            self.client_id = client_id
+            self.websocket = useWebsocket
+            self.onOnline = self.onOffline = None
+            broker.clients.append(self)
+
+        def __getattr__(self, name):
+            # configure* calls
+            return lambda *args: True
+
+        def connect(self):
+            if broker.refuse_connections:
+                raise ConnectionError('connection refused')
+            return True
+
+        def subscribe(self, topic, qos, callback):
+            broker.subscriptions.append((topic, callback))
+            return True
+
+    mqtt_lib = types.ModuleType('AWSIoTPythonSDK.MQTTLib')
+    mqtt_lib.AWSIoTMQTTClient = MQTTClient
+    monkeypatch.setitem(sys.modules, 'AWSIoTPythonSDK', types.ModuleType('AWSIoTPythonSDK'))
+    monkeypatch.setitem(sys.modules, 'AWSIoTPythonSDK.MQTTLib', mqtt_lib)
+    # An existing certificate is not downloaded again
+    broker.root_ca_path = str(tmp_path / 'AmazonRootCA1.pem')
+    (tmp_path / 'AmazonRootCA1.pem').write_text('certificate')
+    return broker
+
+@pytest.fixture
+def fleet(broker):
+    fleet = fleet_state.FleetState(index=fleet_index.FleetIndex())
+    assert fleet_state.start_subscriber(fleet, 'example-ats.iot.us-east-1.amazonaws.com', broker.root_ca_path) is not None
+    return fleet
+
+def test_subscriber_listens_to_shadow_documents_and_telemetry(broker, fleet):
+    assert fleet.live
+    assert broker.clients[0].websocket
+    assert sorted(topic for topic, _ in broker.subscriptions) == [fleet_state.SHADOW_DOCUMENTS_TOPIC, fleet_state.TELEMETRY_TOPIC]
+
+def test_shadow_and_telemetry_updates_are_merged(broker, fleet):
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(5, mode='cool', indoor_temperature_c=22))
+    broker.publish('aircon/telemetry', json.dumps({'device_name': 'aircon_1', 'error_code': 'E1', 'indoor_temperature_c': 23}))
+
+    assert fleet.get('aircon_1') == {'mode': 'cool', 'indoor_temperature_c': 23, 'error_code': 'E1'}
+    assert fleet.index.matching({'error_code': 'E1'}) == {'aircon_1'}
+
+def test_older_shadow_version_is_ignored(broker, fleet):
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(5, indoor_temperature_c=22))
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(3, indoor_temperature_c=10))
+
+    assert fleet.get('aircon_1') == {'indoor_temperature_c': 22}
+
+def test_unrelated_and_malformed_messages_are_ignored(broker, fleet):
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', 'not json')
+    broker.publish('aircon/telemetry', json.dumps({'indoor_temperature_c': 23}))
+    fleet.on_message('$aws/things/aircon_1/shadow/get/accepted', shadow_document(1, mode='cool'))
+
+    assert fleet.devices == {}
+
+def test_subscribers_receive_only_the_changed_values(broker, fleet):
+    events = fleet.subscribe()
+
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(1, mode='cool', indoor_temperature_c=22))
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(2, mode='cool', indoor_temperature_c=24))
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(3, mode='cool', indoor_temperature_c=24))
+
+    assert events.get_nowait() == {'device': 'aircon_1', 'changes': {'mode': 'cool', 'indoor_temperature_c': 22}}
+    assert events.get_nowait() == {'device': 'aircon_1', 'changes': {'indoor_temperature_c': 24}}
+    assert events.empty()
+
+def test_stalled_subscriber_is_asked_to_resync(broker, fleet, monkeypatch):
+    monkeypatch.setattr(fleet_state, 'SUBSCRIBER_QUEUE_SIZE', 2)
+    events = fleet.subscribe()
+
+    for version in range(1, 4):
+        broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(version, indoor_temperature_c=20 + version))
+
+    assert events.get_nowait() == {'resync': True}
+    assert events.empty()
+
+def test_going_offline_expires_the_view(broker, fleet):
+    broker.publish('$aws/things/aircon_1/shadow/update/documents', shadow_document(1, mode='cool'))
+    fleet.invalidate('aircon_1')
+    assert fleet.get('aircon_1', max_age=5) == {'mode': 'cool'}
+
+    broker.clients[0].onOffline()
+
+    assert not fleet.live
+    assert fleet.get('aircon_1', max_age=5) is None
+
+def test_refused_connection_falls_back_to_polling(broker):
+    broker.refuse_connections = True
+    fleet = fleet_state.FleetState()
+
+    assert fleet_state.start_subscriber(fleet, 'example-ats.iot.us-east-1.amazonaws.com', broker.root_ca_path) is None
+    assert not fleet.live
+
+class TestDashboard:
+    """
+    The Flask dashboard served from the view the broker keeps current.
+    """
+
+    @pytest.fixture
+    def application(self, broker, monkeypatch):
+        pytest.importorskip('flask')
+        pytest.importorskip('certifi')
+        application = load_module('dashboard_application', 'iot_simulator', 'aircon_dashboard', 'application.py')
+        fleet = fleet_state.FleetState(index=fleet_index.FleetIndex())
+        monkeypatch.setattr(application, 'fleet', fleet)
+        monkeypatch.setattr(application, 'fleet_index', fleet.index)
+        monkeypatch.setattr(application, 'shadow_fetches', [], raising=False)
+
+        def get_thing_shadow(thingName):
+            application.shadow_fetches.append(thingName)
+            shadow = {'state': {'reported': {'mode': 'cool', 'indoor_temperature_c': 20}}, 'version': 1}
+            return {'payload': io.BytesIO(json.dumps(shadow).encode())}
+        monkeypatch.setattr(application.iot_data, 'get_thing_shadow', get_thing_shadow)
+
+        assert application.start_subscriber(fleet, 'example-ats.iot.us-east-1.amazonaws.com', broker.root_ca_path) is not None
+        for number in range(1, 101):
+            device = f"aircon_{number}"
+            broker.publish(f"$aws/things/{device}/shadow/update/documents", shadow_document(5, mode='cool', indoor_temperature_c=22))
+            broker.publish('aircon/telemetry', json.dumps({'device_name': device, 'error_code': 'E1' if number % 25 == 0 else 'None'}))
+        return application
+
+    def test_error_code_filter_is_answered_from_the_view(self, application):
+        response = application.app.test_client().get('/read_shadows?count=100&error_code=E1')
+
+        assert [device['device'] for device in response.json['devices']] == ['aircon_25', 'aircon_50', 'aircon_75', 'aircon_100']
+        assert response.json['error_filter']
+        assert application.shadow_fetches == []
+
+    def test_only_unseen_devices_read_their_shadow(self, application):
+        response = application.app.test_client().get('/read_shadows?count=102&page=2&page_size=100')
+
+        assert [device['device'] for device in response.json['devices']] == ['aircon_101', 'aircon_102']
+        assert application.shadow_fetches == ['aircon_101', 'aircon_102']
+
+    def test_changes_are_streamed_to_the_browser(self, application, broker):
+        response = application.app.test_client().get('/events', buffered=False)
+        stream = response.response
+
+        assert json.loads(next(stream).decode().split('data: ')[1]) == {'live': True}
+        publisher = threading.Timer(0.1, broker.publish, ('$aws/things/aircon_2/shadow/update/documents', shadow_document(6, indoor_temperature_c=25)))
+        publisher.start()
+        assert json.loads(next(stream).decode().split('data: ')[1]) == {'device': 'aircon_2', 'changes': {'indoor_temperature_c': 25}}
+        publisher.join()
+
+        response.close()
+        assert application.fleet.subscribers == []
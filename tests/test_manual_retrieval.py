@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import load_module
+
+retrieval = load_module('manual_retrieval', 'lambda', 'bedrock_agent_functions', 'iot-qnabot-onecall-user-query', 'manual_retrieval.py')
+
+# Questions and the section that must rank first, taken from the bundled troubleshooting guide and manual
+TOP_RESULTS = [
+    ('how do I reset runtime hours', '9. Maintenance & Filter Management'),
+    ('clean the air filter', '9. Maintenance & Filter Management'),
+    ('refrigerant leak', 'Error Code: E2'),
+    ('compressor overheating', 'Error Code: E3'),
+    ('high electricity bill', 'Error Code: W1'),
+    ('what do the fan speeds mean', '5. Operational Modes'),
+    ('what does the remote control timer do', 'Key Features')
+]
+
+def test_every_error_code_comes_from_the_troubleshooting_guide():
+    assert sorted(retrieval.ERROR_CODES) == ['E1', 'E2', 'E3', 'W1']
+    for entry in retrieval.ERROR_CODES.values():
+        assert entry['source'] == retrieval.TROUBLESHOOTING_GUIDE
+        assert entry['troubleshooting_steps']
+        assert entry['action']
+
+def test_error_code_entry_has_its_steps_and_actions():
+    entry = retrieval.lookup_error_code(' e1 ')
+
+    assert entry['fault_type'] == 'high_temperature'
+    assert entry['troubleshooting_steps'][:2] == ['Check compressor functionality', 'Verify refrigerant pressure']
+    assert entry['action'] == ['Log a ticket']
+    assert not any('STOP' in step for step in entry['troubleshooting_steps'])
+
+def test_manual_fault_table_agrees_with_the_guide():
+    sections = retrieval.manual_sections(retrieval.find_document(retrieval.INSTRUCTION_MANUAL))
+    table = retrieval.parse_manual_fault_table(sections)
+
+    assert sorted(table) == ['E1', 'E2', 'E3']
+    for code, entry in table.items():
+        assert entry['fault_type'] == retrieval.ERROR_CODES[code]['fault_type']
+        assert entry['troubleshooting_steps'][0] == retrieval.ERROR_CODES[code]['troubleshooting_steps'][0]
+
+@pytest.mark.parametrize('question, title', TOP_RESULTS)
+def test_question_ranks_the_expected_section_first(question, title):
+    results = retrieval.search_manual(question)
+
+    assert results[0]['title'] == title
+    assert [result['score'] for result in results] == sorted((result['score'] for result in results), reverse=True)
+
+def test_section_text_is_truncated():
+    result = retrieval.search_manual('how do I reset runtime hours', limit=1, max_chars=100)[0]
+
+    assert len(result['text']) == 100
+    assert result['source'] == retrieval.INSTRUCTION_MANUAL
+
+def test_question_without_known_terms_has_no_results():
+    assert retrieval.search_manual('zzz qqq') == []
+
+def test_known_error_code_is_answered_directly():
+    assert retrieval.troubleshooting_steps('W1')['entry'] is retrieval.ERROR_CODES['W1']
+    assert retrieval.troubleshooting_steps(question='my unit shows e2 since this morning')['error_code'] == 'E2'
+
+def test_unknown_error_code_falls_back_to_a_search():
+    result = retrieval.troubleshooting_steps('E9', 'refrigerant leak')
+
+    assert result['match'] == 'search'
+    assert result['results'][0]['title'] == 'Error Code: E2'
+    assert result['known_error_codes'] == ['E1', 'E2', 'E3', 'W1']
+
+def test_empty_request_lists_the_known_error_codes():
+    assert retrieval.troubleshooting_steps() == {'match': 'none', 'known_error_codes': ['E1', 'E2', 'E3', 'W1']}
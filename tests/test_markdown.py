@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from conftest import load_module
+
+os.environ.setdefault('AGENT_ID', 'agent')
+os.environ.setdefault('AGENT_ALIAS_ID', 'alias')
+
+hook = load_module('custom_hook', 'lambda', 'iot-qnabot-onecall-custom-hook', 'CustomPYHook.py')
+
+# Agent answers and the Markdown format_to_markdown renders for them. The cases marked as kept render
+# oddly, but exactly as before the single pass rewrite, so answers look the same to users.
+GOLDEN = [
+    ('Header: Troubleshooting', '## Troubleshooting'),
+    ('ERROR CODE E1', '## ERROR CODE E1'),
+    ('- Check the filter\n* Restart the unit', '- Check the filter\n\n- Restart the unit'),
+    (
+        '1. Check the filter\n2. Restart the unit\nIf it persists, call support',
+        '1. Check the filter\n\n2. Restart the unit\n\n  If it persists, call support'
+    ),
+    ('- item\ncontinued line\n\nnew paragraph', '- item\n\n  continued line\n\n\n\nnew paragraph'),
+    ('Version 2.0.1', 'Version 2.0.1'),
+    ('The unit "aircon_3" reported E1', 'The unit **aircon_3** reported E1'),
+    ('See https://example.com/manual for details', 'See [https://example.com/manual](https://example.com/manual) for details'),
+    ('Code: reset --hard', '```\nreset --hard\n```'),
+    ('Run `reset` then wait', 'Run `reset` then wait'),
+    ('  padded line  \n\n\n', 'padded line'),
+    # A line of digits only used to raise IndexError
+    ('2024', '2024'),
+    # Kept: a decimal number at the start of a line reads as an ordered list item
+    ('1.5 degrees above setpoint', '1. 5 degrees above setpoint'),
+    # Kept: a line starting with bold reads as an unordered list item
+    ('**Bold** and *italic* stay', '- *Bold** and *italic* stay'),
+]
+
+@pytest.mark.parametrize('text, markdown', GOLDEN)
+def test_golden(text, markdown):
+    assert hook.format_to_markdown(text) == markdown
+
+def test_agent_answer():
+    answer = (
+        'TROUBLESHOOTING STEPS\n'
+        'The unit "aircon_3" reported E1.\n'
+        '1. Check the filter\n'
+        '2. Restart the unit\n'
+        'If it persists, see https://example.com/e1\n'
+        '\n'
+        'Code: reset'
+    )
+
+    assert hook.format_to_markdown(answer) == (
+        '## TROUBLESHOOTING STEPS\n\n'
+        'The unit **aircon_3** reported E1.\n\n'
+        '1. Check the filter\n\n'
+        '2. Restart the unit\n\n'
+        '  If it persists, see [https://example.com/e1](https://example.com/e1)\n\n'
+        '\n\n'
+        '```\nreset\n```'
+    )
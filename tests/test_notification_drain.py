@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+from conftest import create_table, load_module
+
+drain = load_module('notification_drain', 'lambda', 'iot-qnabot-onecall-notification-drain', 'lambda_function.py')
+
+def ticket(unique_id):
+    return {
+        'unique_id': unique_id,
+        'device_id': 'aircon_1',
+        'notification_status': 'PENDING',
+        'error_code': 'E1',
+        'time_stamp': '2024-01-01 00:00:00',
+        'troubleshooting_steps': 'Check the compressor'
+    }
+
+def stream_event(*tickets):
+    return {'Records': [
+        {'eventName': 'INSERT', 'dynamodb': {'NewImage': {key: {'S': value} for key, value in item.items()}}}
+        for item in tickets
+    ]}
+
+@pytest.fixture
+def table(dynamodb, monkeypatch):
+    monkeypatch.setenv('IOT_DEVICE_ERROR_TABLE', 'device-error')
+    return create_table(dynamodb, 'device-error', 'unique_id', 'device_id')
+
+@pytest.fixture
+def sent(monkeypatch):
+    batches = []
+    monkeypatch.setattr(drain, 'send_notification', lambda tickets: batches.append([item['unique_id'] for item in tickets]))
+    return batches
+
+def status(table, unique_id):
+    return table.get_item(Key={'unique_id': unique_id, 'device_id': 'aircon_1'})['Item']['notification_status']
+
+def test_claim_timeout_matches_the_deployed_value():
+    assert drain.CLAIM_TIMEOUT_SECONDS == 90
+
+def test_batch_is_sent_in_one_email(table, sent):
+    tickets = [ticket('u1'), ticket('u2')]
+    for item in tickets:
+        table.put_item(Item=item)
+
+    response = drain.lambda_handler(stream_event(*tickets), None)
+
+    assert json.loads(response['body']) == 'Sent notification for 2 tickets'
+    assert sent == [['u1', 'u2']]
+    assert status(table, 'u1') == status(table, 'u2') == 'SENT'
+
+def test_redelivered_record_is_not_sent_twice(table, sent):
+    table.put_item(Item=ticket('u1'))
+    drain.lambda_handler(stream_event(ticket('u1')), None)
+
+    response = drain.lambda_handler(stream_event(ticket('u1')), None)
+
+    assert json.loads(response['body']) == 'No pending notifications'
+    assert sent == [['u1']]
+
+def test_live_claim_fails_the_batch_and_stale_claim_is_taken_over(table, sent):
+    table.put_item(Item=ticket('u1'))
+    assert drain.claim_notification(table, ticket('u1'), time.time()) == 'claimed'
+
+    with pytest.raises(RuntimeError):
+        drain.lambda_handler(stream_event(ticket('u1')), None)
+    assert sent == []
+
+    stale = time.time() - drain.CLAIM_TIMEOUT_SECONDS - 1
+    table.update_item(
+        Key={'unique_id': 'u1', 'device_id': 'aircon_1'},
+        UpdateExpression='SET claimed_at = :stale',
+        ExpressionAttributeValues={':stale': int(stale)}
+    )
+    drain.lambda_handler(stream_event(ticket('u1')), None)
+    assert sent == [['u1']]
+    assert status(table, 'u1') == 'SENT'
+
+def test_failed_send_releases_the_claim(table, monkeypatch):
+    def fail(tickets):
+        raise RuntimeError('SES unavailable')
+    monkeypatch.setattr(drain, 'send_notification', fail)
+    table.put_item(Item=ticket('u1'))
+
+    with pytest.raises(RuntimeError):
+        drain.lambda_handler(stream_event(ticket('u1')), None)
+    assert status(table, 'u1') == 'PENDING'
@@ -0,0 +1,66 @@
+import json
+import logging
+
+import pytest
+
+from conftest import load_module
+
+structured_logging = load_module('structured_logging', 'lambda', 'common', 'structured_logging.py')
+
+@pytest.fixture
+def logger(monkeypatch, caplog):
+    monkeypatch.setenv('LOG_MAX_FIELD_CHARS', '50')
+    caplog.set_level(logging.DEBUG)
+    logger = structured_logging.get_logger('test')
+    logger.logger.setLevel(logging.INFO)
+    return logger
+
+def records(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records]
+
+def test_one_json_line_per_record(logger, caplog):
+    logger.info("Preprocessed inference output", key='telemetry/batch.csv.out', rows=120)
+
+    assert records(caplog) == [{'level': 'INFO', 'message': 'Preprocessed inference output', 'key': 'telemetry/batch.csv.out', 'rows': 120}]
+
+def test_fields_below_the_level_are_not_evaluated(logger, caplog):
+    def expensive():
+        raise AssertionError('evaluated')
+
+    logger.debug("Received event", event=expensive)
+
+    assert caplog.records == []
+
+def test_sensitive_fields_are_redacted(logger, caplog):
+    logger.info("Placing outbound call", destinationPhoneNumber='+15555550100', attributes={'recipientEmail': 'a@example.com', 'deviceID': 'aircon_1'})
+
+    record, = records(caplog)
+    assert record['destinationPhoneNumber'] == structured_logging.REDACTED
+    assert record['attributes'] == {'recipientEmail': structured_logging.REDACTED, 'deviceID': 'aircon_1'}
+
+def test_long_fields_are_capped(logger, caplog):
+    logger.info("Error parsing JSON line", line='x' * 80, rows=list(range(40)))
+
+    record, = records(caplog)
+    assert record['line'] == 'x' * 50 + '...[30 more chars]'
+    assert record['rows'].endswith('more chars]')
+
+def test_exception_traceback_is_included(logger, caplog):
+    logger.max_field_chars = 2000
+    try:
+        raise ValueError('bad row')
+    except ValueError:
+        logger.error("Error processing inference output", exc_info=True)
+
+    record, = records(caplog)
+    assert 'ValueError: bad row' in record['exception']
+
+def test_sampled_out_records_are_dropped(monkeypatch, caplog):
+    monkeypatch.setenv('LOG_SAMPLE_RATE_INFO', '0')
+    caplog.set_level(logging.INFO)
+    logger = structured_logging.get_logger('test')
+
+    logger.info("Telemetry lookup complete")
+    logger.warning("Column 'normal' not found in the DataFrame")
+
+    assert [record['level'] for record in records(caplog)] == ['WARNING']
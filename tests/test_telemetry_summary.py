@@ -0,0 +1,79 @@
+import random
+
+from conftest import load_module
+
+telemetry_summary = load_module('telemetry_summary', 'lambda', 'bedrock_agent_functions', 'iot-qnabot-onecall-user-query', 'telemetry_summary.py')
+
+START = 1_700_000_000
+
+def telemetry(samples, **metrics):
+    """
+    Rows of a device sending every 10 seconds, metrics given as functions of the sample index.
+    """
+    defaults = {
+        'indoor_temperature_c': lambda index: 22,
+        'outdoor_temperature_c': lambda index: 30,
+        'setpoint_temperature_c': lambda index: 22,
+        'watts': lambda index: 1000,
+        'fan_speed_rpm': lambda index: 1200,
+        'refrigerant_pressure_psi': lambda index: 235,
+        'mode': lambda index: 'cool',
+        'compressor_status': lambda index: 'On',
+        'filter_status': lambda index: 'Clean',
+        'error_code': lambda index: 'None'
+    }
+    defaults.update(metrics)
+    return [
+        dict({metric: str(value(index)) for metric, value in defaults.items()}, device_id='aircon_1', timestamp=str(START + index * 10))
+        for index in range(samples)
+    ]
+
+def test_constant_metric_has_no_change_points():
+    assert telemetry_summary.change_points(telemetry(600), 'watts', 30, 2, 5) == []
+
+def test_rare_single_step_blips_are_not_change_points():
+    rows = telemetry(600, indoor_temperature_c=lambda index: 23 if index % 50 == 0 else 22)
+
+    assert telemetry_summary.change_points(rows, 'indoor_temperature_c', 30, 2, 5) == []
+
+def test_level_shift_of_a_flat_metric_is_found():
+    rows = telemetry(600, indoor_temperature_c=lambda index: 27 if index >= 300 else 22)
+
+    points = telemetry_summary.change_points(rows, 'indoor_temperature_c', 30, 2, 5)
+
+    assert points == [{'at': telemetry_summary.format_timestamp(START + 300 * 10), 'before': 22.0, 'after': 27.0}]
+
+def test_level_shift_in_noise_is_found_once():
+    noise = random.Random(0)
+    rows = telemetry(3000, watts=lambda index: round(1000 + noise.gauss(0, 10) + (200 if index >= 1500 else 0)))
+
+    points = telemetry_summary.change_points(rows, 'watts', 150, 2, 5)
+
+    assert len(points) == 1
+    assert points[0]['at'] == telemetry_summary.format_timestamp(START + 1500 * 10)
+
+def test_summary_is_bounded_and_ordered():
+    rows = telemetry(
+        3000,
+        mode=lambda index: 'cool' if index < 2000 else 'fan',
+        error_code=lambda index: 'W1' if 1600 < index < 1700 or 2500 < index < 2510 else 'None'
+    )
+    random.Random(1).shuffle(rows)
+
+    summary = telemetry_summary.summarize_telemetry(rows)
+
+    assert summary['samples'] == 3000
+    assert summary['start'] == telemetry_summary.format_timestamp(START)
+    assert summary['change_points'] == {}
+    assert summary['metrics']['watts'] == {'min': 1000.0, 'max': 1000.0, 'mean': 1000.0, 'p50': 1000.0, 'p90': 1000.0, 'p99': 1000.0}
+    assert summary['state_changes']['mode'] == {
+        'last': 'fan', 'changes': 1, 'recent': [{'at': telemetry_summary.format_timestamp(START + 20000), 'from': 'cool', 'to': 'fan'}]
+    }
+    assert summary['fault_intervals']['total'] == 2
+    assert [interval['samples'] for interval in summary['fault_intervals']['intervals']] == [99, 9]
+
+def test_page_rows():
+    page = telemetry_summary.page_rows(telemetry(25), 3, 10)
+
+    assert (page['total_rows'], page['total_pages'], len(page['rows'])) == (25, 3, 5)
+    assert page['rows'][0][0] == str(START + 200)
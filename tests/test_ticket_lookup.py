@@ -0,0 +1,108 @@
+import datetime
+
+import pytest
+
+from conftest import load_module
+
+user_query = load_module('user_query', 'lambda', 'bedrock_agent_functions', 'iot-qnabot-onecall-user-query', 'lambda_function.py')
+
+TICKETS = 3000
+DEVICES = 20
+ERROR_CODES = ('E1', 'E2', 'E3', 'W1')
+SUMMARY_ATTRIBUTES = set(user_query.TICKET_ATTRIBUTES)
+
+def index(name, hash_key, non_key_attributes):
+    return {
+        'IndexName': name,
+        'KeySchema': [{'AttributeName': hash_key, 'KeyType': 'HASH'}, {'AttributeName': 'time_stamp', 'KeyType': 'RANGE'}],
+        'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': non_key_attributes}
+    }
+
+@pytest.fixture
+def tickets(dynamodb, monkeypatch):
+    """
+    One ticket a minute over the last 3000 minutes, as in the ticket table and its indexes of the agent stack.
+    """
+    monkeypatch.setenv('IOT_DEVICE_ERROR_TABLE', 'device-error')
+    table = dynamodb.create_table(
+        TableName='device-error',
+        KeySchema=[{'AttributeName': 'unique_id', 'KeyType': 'HASH'}, {'AttributeName': 'device_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[
+            {'AttributeName': attribute, 'AttributeType': 'S'} for attribute in ('unique_id', 'device_id', 'error_code', 'time_stamp')
+        ],
+        GlobalSecondaryIndexes=[
+            index('DeviceTimeIndex', 'device_id', ['error_code', 'anomaly_start', 'anomaly_end', 'notification_status']),
+            index('ErrorCodeTimeIndex', 'error_code', ['anomaly_start', 'anomaly_end', 'notification_status'])
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    now = datetime.datetime.now()
+    items = []
+    with table.batch_writer() as batch:
+        for number in range(TICKETS):
+            # Ticket time stamps are written in the format of the triage action group
+            time_stamp = (now - datetime.timedelta(minutes=number, seconds=30)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-2]
+            item = {
+                'unique_id': f"ticket-{number}",
+                'device_id': f"aircon_{number % DEVICES}",
+                'error_code': ERROR_CODES[number % 7 % len(ERROR_CODES)],
+                'time_stamp': time_stamp,
+                'anomaly_start': time_stamp,
+                'anomaly_end': time_stamp,
+                'notification_status': 'SENT',
+                'troubleshooting_steps': 'Check the compressor ' * 20
+            }
+            batch.put_item(Item=item)
+            items.append(item)
+    return items
+
+def expected(tickets, since_minutes, limit, device_id=None, error_code=None):
+    matches = [
+        ticket for ticket in tickets[:since_minutes]
+        if (device_id is None or ticket['device_id'] == device_id) and (error_code is None or ticket['error_code'] == error_code)
+    ]
+    return [ticket['unique_id'] for ticket in matches[:limit]], len(matches) > limit
+
+def check(result, tickets, since_minutes, limit, **keys):
+    unique_ids, truncated = expected(tickets, since_minutes, limit, **keys)
+    assert [ticket['unique_id'] for ticket in result['tickets']] == unique_ids
+    assert result['count'] == len(unique_ids)
+    assert result['truncated'] == truncated
+    # Only the ticket summary is read from the indexes, never the troubleshooting steps
+    assert all(set(ticket) <= SUMMARY_ATTRIBUTES for ticket in result['tickets'])
+
+def test_device_tickets_newest_first(tickets):
+    result = user_query.find_tickets(device_id='aircon_3', since_minutes=600)
+
+    check(result, tickets, 600, 50, device_id='aircon_3')
+
+def test_device_tickets_filtered_by_error_code(tickets):
+    result = user_query.find_tickets(device_id='aircon_3', error_code='E1', since_minutes=1440)
+
+    check(result, tickets, 1440, 50, device_id='aircon_3', error_code='E1')
+
+def test_error_code_tickets(tickets):
+    result = user_query.find_tickets(error_code='W1', since_minutes=60, limit=10)
+
+    check(result, tickets, 60, 10, error_code='W1')
+
+def test_recent_tickets_merge_every_error_code(tickets):
+    result = user_query.find_tickets(since_minutes=60)
+
+    check(result, tickets, 60, 50)
+
+def test_limit_is_capped(tickets, monkeypatch):
+    monkeypatch.setenv('TICKET_MAX_RESULTS', '20')
+
+    result = user_query.find_tickets(since_minutes=TICKETS, limit=500)
+
+    check(result, tickets, TICKETS, 20)
+
+def test_lookback_excludes_older_tickets(tickets):
+    result = user_query.find_tickets(device_id='aircon_0', since_minutes=30)
+
+    check(result, tickets, 30, 50, device_id='aircon_0')
+
+def test_ticket_by_primary_key(tickets):
+    assert user_query.get_ticket_data('ticket-7', 'aircon_7') == [tickets[7]]
+    assert user_query.get_ticket_data('ticket-7', 'aircon_8') == []
@@ -0,0 +1,290 @@
+import fnmatch
+import os
+import time
+
+import pytest
+
+pytest.importorskip('opensearchpy')
+pytest.importorskip('requests_aws4auth')
+
+from opensearchpy.exceptions import AuthorizationException, NotFoundError, RequestError, TransportError
+
+from conftest import load_module
+
+for name, value in {
+    'AWS_REGION': 'us-east-1',
+    'COLLECTION_ENDPOINT': 'https://collection.us-east-1.aoss.amazonaws.com',
+    'VECTOR_FIELD_NAME': 'vector',
+    'VECTOR_INDEX_NAME': 'kb',
+    'TEXT_FIELD': 'text',
+    'METADATA_FIELD': 'metadata'
+}.items():
+    os.environ.setdefault(name, value)
+
+index = load_module('vector_index_creation', 'lambda', 'vector_index_creation', 'index.py')
+
+PROPERTIES = {'AOSSIndexName': 'kb', 'VectorField': 'vector', 'TextField': 'text', 'MetadataField': 'metadata', 'IndexProfile': 'default'}
+
+class StubIndices:
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def exists(self, index):
+        self.cluster.authorize()
+        return index in self.cluster.indices or bool(self.cluster.aliases.get(index))
+
+    def exists_alias(self, name):
+        self.cluster.check_aliases()
+        return bool(self.cluster.aliases.get(name))
+
+    def get_alias(self, name):
+        self.cluster.check_aliases()
+        if not self.cluster.aliases.get(name):
+            raise NotFoundError(404, 'aliases_not_found_exception', name)
+        return {target: {'aliases': {name: {}}} for target in self.cluster.aliases[name]}
+
+    def get(self, index):
+        return {name: {'mappings': self.cluster.indices[name]['mappings']} for name in self.cluster.indices if fnmatch.fnmatch(name, index)}
+
+    def get_mapping(self, index):
+        return {index: {'mappings': self.cluster.indices[index]['mappings']}}
+
+    def create(self, index, body):
+        self.cluster.authorize()
+        if index in self.cluster.indices or index in self.cluster.aliases:
+            raise RequestError(400, 'resource_already_exists_exception', index)
+        self.cluster.indices[index] = {'mappings': body['mappings'], 'documents': {}}
+        return {'acknowledged': True, 'index': index}
+
+    def delete(self, index, ignore=()):
+        if index not in self.cluster.indices:
+            if 404 in ignore:
+                return {}
+            raise NotFoundError(404, 'index_not_found_exception', index)
+        del self.cluster.indices[index]
+        for targets in self.cluster.aliases.values():
+            targets.discard(index)
+        return {'acknowledged': True}
+
+    def update_aliases(self, body):
+        self.cluster.check_aliases()
+        for action in body['actions']:
+            (kind, arguments), = action.items()
+            if kind == 'add':
+                if arguments['alias'] in self.cluster.indices and {'remove_index': {'index': arguments['alias']}} not in body['actions']:
+                    raise RequestError(400, 'invalid_alias_name_exception', arguments['alias'])
+                self.cluster.aliases.setdefault(arguments['alias'], set()).add(arguments['index'])
+            elif kind == 'remove':
+                self.cluster.aliases[arguments['alias']].discard(arguments['index'])
+            elif kind == 'remove_index':
+                del self.cluster.indices[arguments['index']]
+        return {'acknowledged': True}
+
+class StubOpenSearch:
+    """
+    In-memory OpenSearch Serverless collection: no _reindex or scroll, aliases optional.
+    """
+    def __init__(self):
+        self.indices = {}
+        self.aliases = {}
+        self.aliases_supported = True
+        self.denied_requests = 0
+        self.rejected_documents = set()
+        self.requests = []
+        self.indices_client = StubIndices(self)
+
+    def authorize(self):
+        if self.denied_requests:
+            self.denied_requests -= 1
+            raise AuthorizationException(403, 'security_exception', 'access denied')
+
+    def check_aliases(self):
+        if not self.aliases_supported:
+            raise TransportError(404, 'no handler found for uri', 'aliases')
+
+    def count(self, index):
+        return {'count': len(self.indices[index]['documents'])}
+
+    def search(self, index, body):
+        self.requests.append(('search', index, body['from'], body['size']))
+        documents = sorted(self.indices[index]['documents'].items())
+        page = documents[body['from']:body['from'] + body['size']]
+        return {'hits': {'hits': [{'_id': document_id, '_source': dict(source)} for document_id, source in page]}}
+
+    def bulk(self, body):
+        items = []
+        for action, source in zip(body[::2], body[1::2]):
+            target = action['index']
+            if target['_id'] in self.rejected_documents:
+                items.append({'index': {'_id': target['_id'], 'status': 400, 'error': {'type': 'mapper_parsing_exception'}}})
+                continue
+            self.indices[target['_index']]['documents'][target['_id']] = source
+            items.append({'index': {'_id': target['_id'], 'status': 201}})
+        return {'errors': any('error' in item['index'] for item in items), 'items': items}
+
+@pytest.fixture
+def cluster(monkeypatch):
+    cluster = StubOpenSearch()
+    # The module reads client.indices, served here by the StubIndices namespace
+    client = type('Client', (), {
+        'indices': cluster.indices_client,
+        'count': staticmethod(cluster.count),
+        'search': staticmethod(cluster.search),
+        'bulk': staticmethod(cluster.bulk)
+    })()
+    monkeypatch.setattr(index, 'opensearch_client', lambda region, endpoint: client)
+    monkeypatch.setattr(index, 'readiness_initial_delay', 0.01)
+    monkeypatch.setattr(index, 'readiness_max_delay', 0.02)
+    monkeypatch.setattr(index, 'copy_page_size', 3)
+    return cluster
+
+@pytest.fixture
+def responses(monkeypatch):
+    sent = []
+    def send(event, context, status, data, physical_id=None, noEcho=False, reason=None):
+        sent.append({'status': status, 'physical_id': physical_id, 'reason': reason})
+    monkeypatch.setattr(index.cfnresponse, 'send', send)
+    return sent
+
+def request(responses, request_type, properties, physical_id=None, old_properties=None):
+    event = {'RequestType': request_type, 'ResourceProperties': dict(properties, ServiceToken='token')}
+    if physical_id is not None:
+        event['PhysicalResourceId'] = physical_id
+    if old_properties is not None:
+        event['OldResourceProperties'] = old_properties
+    index.on_event(event, None)
+    return responses[-1]
+
+def add_documents(cluster, index_name, count):
+    for number in range(count):
+        cluster.indices[index_name]['documents'][f"doc-{number:03d}"] = {'vector': [float(number)] * 2, 'text': f"section {number}", 'metadata': '{}'}
+
+def served(cluster, alias='kb'):
+    return sorted(cluster.aliases.get(alias, ()))
+
+def test_create_waits_for_access_and_serves_a_version_behind_the_alias(cluster, responses):
+    cluster.denied_requests = 3
+
+    response = request(responses, 'Create', PROPERTIES)
+
+    assert response['status'] == 'SUCCESS'
+    assert response['physical_id'] == 'kb-v1'
+    assert served(cluster) == ['kb-v1']
+    assert cluster.indices['kb-v1']['mappings']['_meta'] == {'index_profile': 'default'}
+
+def test_create_fails_right_away_at_the_deadline(cluster, responses, monkeypatch):
+    monkeypatch.setattr(index, 'readiness_timeout', 0.05)
+    cluster.denied_requests = 10 ** 6
+
+    started_at = time.time()
+    response = request(responses, 'Create', PROPERTIES)
+
+    assert response['status'] == 'FAILED'
+    assert time.time() - started_at < 1
+
+def test_profile_change_copies_the_documents_page_by_page(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 8)
+
+    response = request(responses, 'Update', dict(PROPERTIES, IndexProfile='low-latency'), physical_id, PROPERTIES)
+
+    assert response['status'] == 'SUCCESS'
+    assert response['physical_id'] == 'kb-v2'
+    assert 'Copied 8 documents from kb-v1' in response['reason']
+    assert served(cluster) == ['kb-v2']
+    assert cluster.indices['kb-v2']['documents'] == cluster.indices['kb-v1']['documents']
+    assert [page for page in cluster.requests if page[0] == 'search'] == [('search', 'kb-v1', start, 3) for start in (0, 3, 6)]
+
+    # CloudFormation deletes the previous version once the update completes
+    assert request(responses, 'Delete', PROPERTIES, 'kb-v1')['reason'] == 'Deleted index kb-v1'
+    assert sorted(cluster.indices) == ['kb-v2']
+
+def test_renamed_fields_are_copied_under_their_new_name(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 2)
+
+    request(responses, 'Update', dict(PROPERTIES, TextField='body'), physical_id, PROPERTIES)
+
+    assert cluster.indices['kb-v2']['documents']['doc-001'] == {'vector': [1.0, 1.0], 'body': 'section 1', 'metadata': '{}'}
+
+def test_dimension_change_asks_for_a_data_source_sync(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 2)
+
+    response = request(responses, 'Update', dict(PROPERTIES, VectorDimension='512'), physical_id, PROPERTIES)
+
+    assert 'sync the knowledge base data source' in response['reason']
+    assert cluster.indices['kb-v2']['documents'] == {}
+
+def test_index_too_large_to_page_asks_for_a_data_source_sync(cluster, responses, monkeypatch):
+    monkeypatch.setattr(index, 'MAX_RESULT_WINDOW', 5)
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 6)
+
+    response = request(responses, 'Update', dict(PROPERTIES, IndexProfile='high-recall'), physical_id, PROPERTIES)
+
+    assert response['status'] == 'SUCCESS'
+    assert 'Documents were not copied' in response['reason']
+    assert served(cluster) == ['kb-v2']
+
+def test_failed_copy_keeps_the_served_index(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 5)
+    cluster.rejected_documents.add('doc-004')
+
+    response = request(responses, 'Update', dict(PROPERTIES, IndexProfile='low-latency'), physical_id, PROPERTIES)
+
+    assert response['status'] == 'FAILED'
+    assert response['physical_id'] == 'kb-v1'
+    assert sorted(cluster.indices) == ['kb-v1']
+    assert served(cluster) == ['kb-v1']
+
+def test_rolled_back_update_leaves_no_index_behind(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+    add_documents(cluster, physical_id, 4)
+    updated = dict(PROPERTIES, IndexProfile='low-latency')
+    new_id = request(responses, 'Update', updated, physical_id, PROPERTIES)['physical_id']
+
+    # Another resource fails: CloudFormation updates back to the old properties, then deletes the failed update's index
+    rollback = request(responses, 'Update', PROPERTIES, new_id, updated)
+    request(responses, 'Delete', updated, new_id)
+
+    assert rollback['physical_id'] == 'kb-v3'
+    assert sorted(cluster.indices) == ['kb-v3']
+    assert served(cluster) == ['kb-v3']
+    assert len(cluster.indices['kb-v3']['documents']) == 4
+
+def test_legacy_index_named_like_the_alias_is_migrated(cluster, responses):
+    cluster.indices['kb'] = {'mappings': index.index_body(index.index_config(PROPERTIES))['mappings'], 'documents': {}}
+    add_documents(cluster, 'kb', 2)
+
+    kept = request(responses, 'Update', PROPERTIES, '2024/01/01/[$LATEST]stream', PROPERTIES)
+    migrated = request(responses, 'Update', dict(PROPERTIES, IndexProfile='low-latency'), kept['physical_id'], PROPERTIES)
+
+    assert kept['physical_id'] == 'kb'
+    assert migrated['physical_id'] == 'kb-v1'
+    assert sorted(cluster.indices) == ['kb-v1']
+    assert served(cluster) == ['kb-v1']
+    assert len(cluster.indices['kb-v1']['documents']) == 2
+
+def test_collection_without_aliases_serves_the_index_under_its_name(cluster, responses):
+    cluster.aliases_supported = False
+
+    created = request(responses, 'Create', PROPERTIES)
+    add_documents(cluster, 'kb', 4)
+    migrated = request(responses, 'Update', dict(PROPERTIES, IndexProfile='low-latency'), created['physical_id'], PROPERTIES)
+
+    assert created['physical_id'] == 'kb'
+    assert migrated['status'] == 'SUCCESS'
+    assert migrated['physical_id'] == 'kb'
+    assert sorted(cluster.indices) == ['kb']
+    assert cluster.indices['kb']['mappings']['_meta'] == {'index_profile': 'low-latency'}
+    assert len(cluster.indices['kb']['documents']) == 4
+
+def test_stack_delete_keeps_the_only_version(cluster, responses):
+    physical_id = request(responses, 'Create', PROPERTIES)['physical_id']
+
+    response = request(responses, 'Delete', PROPERTIES, physical_id)
+
+    assert response['status'] == 'SUCCESS'
+    assert sorted(cluster.indices) == ['kb-v1']